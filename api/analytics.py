@@ -1,16 +1,27 @@
 from http.server import BaseHTTPRequestHandler
 import json
 import os
-from datetime import datetime, timedelta
-from supabase import create_client
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from urllib.parse import parse_qs, urlparse
+from db import get_supabase
+from analytics_cache import GLOBAL_SCOPE, analytics_cache
 
+# Window for the overview's recent activity counts
+RECENT_DAYS = 7
 
-def get_supabase():
-    url = os.environ.get('SUPABASE_URL')
-    key = os.environ.get('SUPABASE_KEY')
-    if not url or not key:
-        raise Exception("Supabase credentials not configured")
-    return create_client(url, key)
+# Rollup columns read by each view
+PROJECT_ROLLUP_COLUMNS = ('context_files, context_chars, file_types, features, selected_features, responses, '
+                          'confirmed_responses, ai_suggested_responses, prd_id, prd_version, prd_word_count, '
+                          'prd_edit_count, feedback_count, rating_sum, rating_count')
+TIMELINE_ROLLUP_COLUMNS = 'features_first_at, prd_id, prd_version, prd_created_at'
+
+# Activity time series: bucket sizes, counted metrics and page size
+SERIES_BUCKETS = {'hour': timedelta(hours=1), 'day': timedelta(days=1), 'week': timedelta(weeks=1)}
+SERIES_METRICS = ('projects', 'prds', 'uploads', 'responses', 'feedback', 'share_views')
+SERIES_MAX_BUCKETS = int(os.environ.get('ANALYTICS_SERIES_MAX_BUCKETS', '366'))
+# Buckets covered when no start is given
+SERIES_DEFAULT_BUCKETS = 30
 
 
 def cors_headers():
@@ -36,8 +47,9 @@ def parse_path(path):
     /api/analytics/overview -> ('overview', None)
     /api/analytics/project/{project_id} -> ('project', project_id)
     /api/analytics/timeline/{project_id} -> ('timeline', project_id)
+    /api/analytics/series?bucket=day&... -> ('series', None)
     """
-    parts = path.strip('/').split('/')
+    parts = path.split('?')[0].strip('/').split('/')
 
     if len(parts) >= 3:
         if parts[2] == 'overview':
@@ -46,6 +58,8 @@ def parse_path(path):
             return ('project', parts[3])
         elif parts[2] == 'timeline' and len(parts) >= 4:
             return ('timeline', parts[3])
+        elif parts[2] == 'series':
+            return ('series', None)
 
     return (None, None)
 
@@ -66,48 +80,25 @@ def calculate_time_spent(created_at, updated_at):
 
 
 def get_overview_analytics(supabase):
-    """Get overall analytics across all projects"""
-
-    # Get all projects
-    projects_result = supabase.table('projects').select('*').execute()
-    projects = projects_result.data or []
-
-    total_projects = len(projects)
-
-    # Get PRDs
-    prds_result = supabase.table('generated_prds').select('*').execute()
-    prds = prds_result.data or []
-
-    prds_generated = len(prds)
-
-    # Get context files
-    context_result = supabase.table('context_files').select('*').execute()
-    context_files = context_result.data or []
-
-    total_context_files = len(context_files)
-    total_context_chars = sum(len(f.get('extracted_text', '')) for f in context_files)
+    """Get overall analytics across all projects
 
-    # Get question responses
-    responses_result = supabase.table('question_responses').select('*').execute()
-    responses = responses_result.data or []
-
-    total_responses = len(responses)
-    confirmed_responses = sum(1 for r in responses if r.get('confirmed'))
-    ai_suggested = sum(1 for r in responses if r.get('ai_suggested'))
-
-    # Calculate time metrics
-    total_time_spent = 0
-    for project in projects:
-        time_spent = calculate_time_spent(
-            project.get('created_at'),
-            project.get('updated_at')
-        )
-        total_time_spent += time_spent
-
-    # Recent activity (last 7 days)
-    seven_days_ago = (datetime.utcnow() - timedelta(days=7)).isoformat()
-    recent_projects = [p for p in projects if p.get('created_at', '') > seven_days_ago]
-    recent_prds = [p for p in prds if p.get('created_at', '') > seven_days_ago]
+    The counts and sums are computed by the analytics_overview() database
+    function (migrations/011_analytics_overview.sql), which returns scalars
+    only, so no rows are transferred whatever the table sizes.
+    """
+    result = supabase.rpc('analytics_overview', {'p_recent_days': RECENT_DAYS}).execute()
+    stats = result.data
+    if isinstance(stats, list):
+        stats = stats[0] if stats else None
+    if not stats:
+        raise Exception('Failed to load overview analytics')
+
+    total_projects = stats.get('total_projects') or 0
+    total_context_files = stats.get('total_context_files') or 0
+    total_responses = stats.get('total_responses') or 0
+    confirmed_responses = stats.get('confirmed_responses') or 0
+    ai_suggested = stats.get('ai_suggested_responses') or 0
+    total_time_spent = float(stats.get('total_hours') or 0)
 
     # Calculate averages
     avg_context_per_project = total_context_files / total_projects if total_projects > 0 else 0
@@ -117,15 +108,16 @@ def get_overview_analytics(supabase):
     return {
         'summary': {
             'total_projects': total_projects,
-            'prds_generated': prds_generated,
+            'prds_generated': stats.get('prds_generated') or 0,
             'total_context_files': total_context_files,
+            'total_context_characters': stats.get('total_context_chars') or 0,
             'total_responses': total_responses,
             'confirmed_responses': confirmed_responses,
             'ai_suggested_responses': ai_suggested
         },
         'recent_activity': {
-            'projects_last_7_days': len(recent_projects),
-            'prds_last_7_days': len(recent_prds)
+            'projects_last_7_days': stats.get('projects_recent') or 0,
+            'prds_last_7_days': stats.get('prds_recent') or 0
         },
         'averages': {
             'context_files_per_project': round(avg_context_per_project, 1),
@@ -139,64 +131,86 @@ def get_overview_analytics(supabase):
     }
 
 
-def get_project_analytics(supabase, project_id):
-    """Get detailed analytics for a specific project"""
+def rebuild_rollups(supabase, project_id=None):
+    """Recompute the analytics rollups (migrations/012_analytics_rollups.sql)
+    from the source tables: all of them, or the row of one project.
 
-    # Get project
-    project_result = supabase.table('projects').select('*').eq('id', project_id).execute()
-    if not project_result.data:
-        return None
+    Returns:
+        int: Number of project rollup rows written
+    """
+    result = supabase.rpc('rebuild_analytics_rollups', {'p_project': project_id}).execute()
+    return result.data or 0
 
-    project = project_result.data[0]
 
-    # Get context files
-    context_result = supabase.table('context_files').select('*').eq('project_id', project_id).execute()
-    context_files = context_result.data or []
+def run_queries(queries):
+    """Execute independent Supabase queries concurrently
 
-    # Get features
-    features_result = supabase.table('features').select('*').eq('project_id', project_id).execute()
-    features = features_result.data or []
+    Args:
+        queries: Query name -> built query (not yet executed)
+
+    Returns:
+        dict: Query name -> result rows
+    """
+    with ThreadPoolExecutor(max_workers=len(queries)) as executor:
+        futures = {name: executor.submit(query.execute) for name, query in queries.items()}
+        return {name: future.result().data or [] for name, future in futures.items()}
 
-    selected_features = [f for f in features if f.get('is_selected')]
 
-    # Get question responses
-    responses_result = supabase.table('question_responses').select('*').eq('project_id', project_id).execute()
-    responses = responses_result.data or []
+def rollup_query(supabase, project_id, columns):
+    return supabase.table('analytics_project').select(columns).eq('project_id', project_id)
 
-    # Get PRD
-    prd_result = supabase.table('generated_prds').select('*').eq('project_id', project_id).execute()
-    prd = prd_result.data[0] if prd_result.data else None
 
-    # Get PRD history
-    history_count = 0
-    if prd:
-        history_result = supabase.table('prd_edit_snapshots').select('id').eq('prd_id', prd['id']).execute()
-        history_count = len(history_result.data or [])
+def first_rollup(rows):
+    """The project's rollup row from fetched rows
+
+    Rows are created with the project and backfilled by the migration; a
+    missing one reads as empty until `python api/rollups.py` rebuilds it,
+    since the rebuild locks the rollup tables and must not run on a read.
+    """
+    return rows[0] if rows else {}
 
-    # Get feedback
-    feedback_result = supabase.table('prd_feedback').select('*').eq('project_id', project_id).execute()
-    feedback = feedback_result.data or []
+
+def get_project_analytics(supabase, project_id):
+    """Get detailed analytics for a specific project
+
+    Totals are read from the project's rollup row, maintained by triggers on
+    the source tables, instead of loading the project's rows.
+    """
+
+    # Project and rollup in one round-trip
+    rows = run_queries({
+        'project': supabase.table('projects').select('name, created_at, updated_at').eq('id', project_id),
+        'rollup': rollup_query(supabase, project_id, PROJECT_ROLLUP_COLUMNS)
+    })
+    if not rows['project']:
+        return None
+
+    project = rows['project'][0]
+    rollup = first_rollup(rows['rollup'])
 
     # Calculate metrics
     time_spent = calculate_time_spent(project.get('created_at'), project.get('updated_at'))
 
-    confirmed = sum(1 for r in responses if r.get('confirmed'))
-    ai_suggested = sum(1 for r in responses if r.get('ai_suggested'))
-
-    total_context_chars = sum(len(f.get('extracted_text', '')) for f in context_files)
+    context_files = rollup.get('context_files') or 0
+    features = rollup.get('features') or 0
+    selected_features = rollup.get('selected_features') or 0
+    responses = rollup.get('responses') or 0
+    confirmed = rollup.get('confirmed_responses') or 0
+    ai_suggested = rollup.get('ai_suggested_responses') or 0
+    feedback_count = rollup.get('feedback_count') or 0
+    has_prd = rollup.get('prd_id') is not None
 
     avg_feedback_rating = None
-    if feedback:
-        ratings = [f['rating'] for f in feedback if f.get('rating')]
-        avg_feedback_rating = sum(ratings) / len(ratings) if ratings else None
+    if rollup.get('rating_count'):
+        avg_feedback_rating = rollup['rating_sum'] / rollup['rating_count']
 
     # Completion stages
     stages = {
-        'context_uploaded': len(context_files) > 0,
-        'features_extracted': len(features) > 0,
+        'context_uploaded': context_files > 0,
+        'features_extracted': features > 0,
         'questions_confirmed': confirmed >= 10,
-        'prd_generated': prd is not None,
-        'feedback_provided': len(feedback) > 0
+        'prd_generated': has_prd,
+        'feedback_provided': feedback_count > 0
     }
 
     completion_percentage = sum(1 for v in stages.values() if v) / len(stages) * 100
@@ -214,29 +228,29 @@ def get_project_analytics(supabase, project_id):
             'stages': stages
         },
         'context': {
-            'files_uploaded': len(context_files),
-            'total_characters': total_context_chars,
-            'file_types': list(set(f.get('file_type') for f in context_files))
+            'files_uploaded': context_files,
+            'total_characters': rollup.get('context_chars') or 0,
+            'file_types': list((rollup.get('file_types') or {}).keys())
         },
         'features': {
-            'total_extracted': len(features),
-            'selected': len(selected_features),
-            'in_parking_lot': len(features) - len(selected_features)
+            'total_extracted': features,
+            'selected': selected_features,
+            'in_parking_lot': features - selected_features
         },
         'questions': {
-            'total_responses': len(responses),
+            'total_responses': responses,
             'confirmed': confirmed,
             'ai_suggested': ai_suggested,
-            'confirmation_rate': round((confirmed / len(responses) * 100) if responses else 0, 1)
+            'confirmation_rate': round((confirmed / responses * 100) if responses else 0, 1)
         },
         'prd': {
-            'generated': prd is not None,
-            'version': prd.get('version', 1) if prd else 0,
-            'edit_history_count': history_count,
-            'word_count': len(prd.get('content_md', '').split()) if prd else 0
+            'generated': has_prd,
+            'version': (rollup.get('prd_version') or 1) if has_prd else 0,
+            'edit_history_count': rollup.get('prd_edit_count') or 0,
+            'word_count': rollup.get('prd_word_count') or 0
         },
         'feedback': {
-            'total_feedback': len(feedback),
+            'total_feedback': feedback_count,
             'average_rating': round(avg_feedback_rating, 2) if avg_feedback_rating else None
         }
     }
@@ -247,50 +261,150 @@ def get_project_timeline(supabase, project_id):
 
     timeline = []
 
+    rows = run_queries({
+        'project': supabase.table('projects').select('name, created_at').eq('id', project_id),
+        'files': supabase.table('context_files').select('file_name, created_at').eq('project_id', project_id).order('created_at'),
+        'rollup': rollup_query(supabase, project_id, TIMELINE_ROLLUP_COLUMNS)
+    })
+
     # Project creation
-    project_result = supabase.table('projects').select('*').eq('id', project_id).execute()
-    if project_result.data:
-        project = project_result.data[0]
-        timeline.append({
-            'type': 'project_created',
-            'timestamp': project.get('created_at'),
-            'description': f"Project '{project.get('name')}' created"
-        })
+    if not rows['project']:
+        return timeline
+
+    project = rows['project'][0]
+    timeline.append({
+        'type': 'project_created',
+        'timestamp': project.get('created_at'),
+        'description': f"Project '{project.get('name')}' created"
+    })
 
     # Context files
-    context_result = supabase.table('context_files').select('file_name, created_at').eq('project_id', project_id).order('created_at').execute()
-    for file in (context_result.data or []):
+    for file in rows['files']:
         timeline.append({
             'type': 'context_uploaded',
             'timestamp': file.get('created_at'),
             'description': f"Uploaded {file.get('file_name')}"
         })
 
+    rollup = first_rollup(rows['rollup'])
+
     # Features extracted
-    features_result = supabase.table('features').select('created_at').eq('project_id', project_id).limit(1).execute()
-    if features_result.data:
+    if rollup.get('features_first_at'):
         timeline.append({
             'type': 'features_extracted',
-            'timestamp': features_result.data[0].get('created_at'),
+            'timestamp': rollup['features_first_at'],
             'description': 'Features extracted from context'
         })
 
     # PRD generated
-    prd_result = supabase.table('generated_prds').select('created_at, version').eq('project_id', project_id).execute()
-    if prd_result.data:
-        prd = prd_result.data[0]
+    if rollup.get('prd_id'):
         timeline.append({
             'type': 'prd_generated',
-            'timestamp': prd.get('created_at'),
-            'description': f"PRD generated (v{prd.get('version', 1)})"
+            'timestamp': rollup.get('prd_created_at'),
+            'description': f"PRD generated (v{rollup.get('prd_version') or 1})"
         })
 
     # Sort by timestamp
-    timeline.sort(key=lambda x: x.get('timestamp', ''))
+    timeline.sort(key=lambda x: x.get('timestamp') or '')
 
     return timeline
 
 
+def truncate_to_bucket(moment, bucket):
+    """Start of the UTC hour, day or week (from Monday, as date_trunc) containing moment"""
+    moment = moment.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    if bucket == 'hour':
+        return moment
+    moment = moment.replace(hour=0)
+    if bucket == 'week':
+        moment -= timedelta(days=moment.weekday())
+    return moment
+
+
+def parse_timestamp(value):
+    """Parse an ISO 8601 timestamp (or date); naive values are taken as UTC"""
+    moment = datetime.fromisoformat(value.strip().replace('Z', '+00:00'))
+    return moment if moment.tzinfo else moment.replace(tzinfo=timezone.utc)
+
+
+def parse_series_params(query):
+    """
+    Validate the query string of /api/analytics/series.
+
+    Params:
+        bucket: hour | day | week (default day)
+        start, end: ISO timestamps; the range is [start, end). end defaults to
+            the end of the current bucket, start to SERIES_DEFAULT_BUCKETS
+            buckets before it
+        project_id: Only count this project's events
+        cursor: next_cursor of the previous page
+
+    Raises:
+        ValueError: With a message for the client
+    """
+    params = {key: values[0] for key, values in parse_qs(query).items() if values}
+
+    bucket = params.get('bucket', 'day')
+    if bucket not in SERIES_BUCKETS:
+        raise ValueError(f"bucket must be one of: {', '.join(SERIES_BUCKETS)}")
+    step = SERIES_BUCKETS[bucket]
+
+    try:
+        end = parse_timestamp(params['end']) if params.get('end') else \
+            truncate_to_bucket(datetime.now(timezone.utc), bucket) + step
+        start = truncate_to_bucket(parse_timestamp(params['start']), bucket) if params.get('start') else \
+            end - step * SERIES_DEFAULT_BUCKETS
+        cursor = parse_timestamp(params['cursor']) if params.get('cursor') else None
+    except ValueError:
+        raise ValueError('start, end and cursor must be ISO 8601 timestamps')
+    if start >= end:
+        raise ValueError('start must be before end')
+    if cursor is not None and not start <= cursor < end:
+        raise ValueError('cursor is outside the requested range')
+
+    project_id = params.get('project_id')
+    if project_id and not validate_uuid(project_id):
+        raise ValueError('Invalid project ID')
+
+    return {'bucket': bucket, 'start': start, 'end': end, 'project_id': project_id, 'cursor': cursor}
+
+
+def get_activity_series(supabase, bucket, start, end, project_id=None, cursor=None):
+    """
+    Get event counts per hour, day or week over [start, end)
+
+    Counting is done by the analytics_series() database function
+    (migrations/014_analytics_series.sql), which returns one row per bucket.
+    A page covers at most SERIES_MAX_BUCKETS buckets; next_cursor is passed
+    back as cursor to get the next one.
+    """
+    step = SERIES_BUCKETS[bucket]
+    page_start = truncate_to_bucket(cursor or start, bucket)
+    page_end = min(end, page_start + step * SERIES_MAX_BUCKETS)
+
+    result = supabase.rpc('analytics_series', {
+        'p_bucket': bucket,
+        'p_start': page_start.isoformat(),
+        'p_end': page_end.isoformat(),
+        'p_project': project_id
+    }).execute()
+
+    points = [{'bucket': row['bucket'], **{metric: row.get(metric) or 0 for metric in SERIES_METRICS}}
+              for row in (result.data or [])]
+
+    return {
+        'bucket': bucket,
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'project_id': project_id,
+        'metrics': list(SERIES_METRICS),
+        'points': points,
+        'totals': {metric: sum(point[metric] for point in points) for metric in SERIES_METRICS},
+        # 'Z' rather than '+00:00', which would need escaping in a query string
+        'next_cursor': page_end.isoformat().replace('+00:00', 'Z') if page_end < end else None
+    }
+
+
 class handler(BaseHTTPRequestHandler):
     def send_cors_headers(self):
         for key, value in cors_headers().items():
@@ -314,7 +428,8 @@ class handler(BaseHTTPRequestHandler):
             supabase = get_supabase()
 
             if op == 'overview':
-                analytics = get_overview_analytics(supabase)
+                analytics = analytics_cache.get_or_compute(
+                    supabase, 'overview', GLOBAL_SCOPE, lambda: get_overview_analytics(supabase))
                 self.send_json(200, analytics)
                 return
 
@@ -323,7 +438,8 @@ class handler(BaseHTTPRequestHandler):
                     self.send_json(400, {'error': 'Invalid project ID'})
                     return
 
-                analytics = get_project_analytics(supabase, project_id)
+                analytics = analytics_cache.get_or_compute(
+                    supabase, 'project', project_id, lambda: get_project_analytics(supabase, project_id))
                 if analytics:
                     self.send_json(200, analytics)
                 else:
@@ -335,10 +451,26 @@ class handler(BaseHTTPRequestHandler):
                     self.send_json(400, {'error': 'Invalid project ID'})
                     return
 
-                timeline = get_project_timeline(supabase, project_id)
+                timeline = analytics_cache.get_or_compute(
+                    supabase, 'timeline', project_id, lambda: get_project_timeline(supabase, project_id))
                 self.send_json(200, {'timeline': timeline})
                 return
 
+            elif op == 'series':
+                try:
+                    params = parse_series_params(urlparse(self.path).query)
+                except ValueError as e:
+                    self.send_json(400, {'error': str(e)})
+                    return
+
+                page_start = params['cursor'] or params['start']
+                view = f"series:{params['bucket']}:{params['start'].isoformat()}:{params['end'].isoformat()}:{page_start.isoformat()}"
+                series = analytics_cache.get_or_compute(
+                    supabase, view, params['project_id'] or GLOBAL_SCOPE,
+                    lambda: get_activity_series(supabase, **params))
+                self.send_json(200, series)
+                return
+
             self.send_json(400, {'error': 'Invalid request path'})
 
         except Exception as e:
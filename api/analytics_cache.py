@@ -0,0 +1,190 @@
+"""
+Analytics Result Cache for PM Clarity API
+
+Caches the results of /api/analytics/overview, /project/{id} and
+/timeline/{id}, which are requested on every dashboard render but change only
+when a project's data changes.
+
+Entries are keyed by a generation counter kept in the `analytics_generations`
+table (migrations/013_analytics_generations.sql): one per project, plus a
+global one for the overview. Writes to a project's data call
+bump_generation(), which increments both, so later lookups use new keys and
+the stale entries are never read again (they age out of the LRU).
+
+Generations read from the database are trusted for ANALYTICS_GENERATION_TTL
+seconds, so repeat loads are served from memory without a round-trip; a write
+made by another instance is seen once that window has passed. Writes made by
+this instance are seen at once.
+
+Share views only change the share_views counts of the activity series, so
+record_view() bumps a project at most once per ANALYTICS_VIEW_BUMP_INTERVAL
+seconds instead of writing on every anonymous view.
+
+Two tiers are used, as for LLM responses (see cache.py):
+    - An in-process LRU with TTL
+    - Optionally the shared `llm_cache` table, so instances share results
+
+Configuration (environment variables):
+    ANALYTICS_CACHE_BACKEND       memory | supabase | off (default memory)
+    ANALYTICS_CACHE_TTL           Entry lifetime in seconds (default 300)
+    ANALYTICS_CACHE_MAX_ENTRIES   In-process LRU size (default 256)
+    ANALYTICS_GENERATION_TTL      Seconds a generation read is trusted (default 5)
+    ANALYTICS_VIEW_BUMP_INTERVAL  Min seconds between view bumps of a project (default 60)
+"""
+
+import json
+import os
+import threading
+
+from cache import LRUTTLCache, SupabaseStore
+
+ANALYTICS_CACHE_BACKEND = os.environ.get('ANALYTICS_CACHE_BACKEND', 'memory').lower()
+ANALYTICS_CACHE_TTL = int(os.environ.get('ANALYTICS_CACHE_TTL', '300'))
+ANALYTICS_CACHE_MAX_ENTRIES = int(os.environ.get('ANALYTICS_CACHE_MAX_ENTRIES', '256'))
+ANALYTICS_GENERATION_TTL = float(os.environ.get('ANALYTICS_GENERATION_TTL', '5'))
+ANALYTICS_VIEW_BUMP_INTERVAL = float(os.environ.get('ANALYTICS_VIEW_BUMP_INTERVAL', '60'))
+
+GLOBAL_SCOPE = 'global'
+
+# Stored in the model column of llm_cache rows written by this cache
+STORE_MODEL = 'analytics'
+
+
+class AnalyticsCache:
+    """Generation-keyed result cache with hit/miss counters."""
+
+    def __init__(self, backend=ANALYTICS_CACHE_BACKEND, ttl=ANALYTICS_CACHE_TTL,
+                 max_entries=ANALYTICS_CACHE_MAX_ENTRIES, generation_ttl=ANALYTICS_GENERATION_TTL,
+                 view_bump_interval=ANALYTICS_VIEW_BUMP_INTERVAL):
+        self.enabled = backend != 'off'
+        self.backend = backend
+        self.ttl = ttl
+        self.memory = LRUTTLCache(max_entries, ttl)
+        self.generations = LRUTTLCache(max_entries, generation_ttl)
+        self.view_bumps = LRUTTLCache(max_entries, view_bump_interval)
+        self.store = SupabaseStore() if backend == 'supabase' and os.environ.get('SUPABASE_URL') else None
+        self.stats_lock = threading.Lock()
+        self.stats = {'hits': 0, 'memory_hits': 0, 'store_hits': 0, 'misses': 0, 'errors': 0}
+
+    def _bump_stat(self, key):
+        with self.stats_lock:
+            self.stats[key] += 1
+
+    def get_generation(self, supabase, scope):
+        """Current generation of a scope (a project ID or GLOBAL_SCOPE)."""
+        generation = self.generations.get(scope)
+        if generation is None:
+            result = supabase.table('analytics_generations').select('generation').eq('scope', scope).execute()
+            generation = result.data[0]['generation'] if result.data else 0
+            self.generations.set(scope, generation)
+        return generation
+
+    def get_or_compute(self, supabase, view, scope, compute):
+        """
+        Return the cached result of a view, computing and caching it on a miss.
+
+        Args:
+            supabase: Supabase client
+            view: View name ('overview', 'project', 'timeline')
+            scope: Project ID, or GLOBAL_SCOPE for views over all projects
+            compute: Called without arguments to build the result
+
+        Returns:
+            The view's result (None results are not cached)
+        """
+        if not self.enabled:
+            return compute()
+
+        try:
+            key = f"analytics:{view}:{scope}:{self.get_generation(supabase, scope)}"
+        except Exception as e:
+            # The cache must never break a request (e.g. migration 013 not run yet)
+            self._bump_stat('errors')
+            print(f"Analytics cache unavailable: {e}")
+            return compute()
+
+        value = self.memory.get(key)
+        if value is not None:
+            self._bump_stat('hits')
+            self._bump_stat('memory_hits')
+            return value
+
+        if self.store is not None:
+            try:
+                stored = self.store.get(key)
+            except Exception as e:
+                self._bump_stat('errors')
+                print(f"Analytics cache read failed: {e}")
+                stored = None
+            if stored is not None:
+                value = json.loads(stored)
+                self.memory.set(key, value)
+                self._bump_stat('hits')
+                self._bump_stat('store_hits')
+                return value
+
+        self._bump_stat('misses')
+        value = compute()
+        if value is not None:
+            self.memory.set(key, value)
+            if self.store is not None:
+                try:
+                    self.store.set(key, json.dumps(value), STORE_MODEL, self.ttl)
+                except Exception as e:
+                    self._bump_stat('errors')
+                    print(f"Analytics cache write failed: {e}")
+        return value
+
+    def bump(self, supabase, project_id):
+        """Invalidate the cached results of a project and of the overview."""
+        if not self.enabled or not project_id:
+            return
+        try:
+            result = supabase.rpc('bump_analytics_generation', {'p_project': project_id}).execute()
+        except Exception as e:
+            # A failed bump only delays invalidation until the entries expire
+            self._bump_stat('errors')
+            print(f"Failed to bump analytics generation for {project_id}: {e}")
+            self.generations.delete(project_id)
+            self.generations.delete(GLOBAL_SCOPE)
+            return
+        generations = result.data
+        if isinstance(generations, list):
+            generations = generations[0] if generations else None
+        if isinstance(generations, dict):
+            for scope, generation in generations.items():
+                self.generations.set(scope, generation)
+        else:
+            self.generations.delete(project_id)
+            self.generations.delete(GLOBAL_SCOPE)
+
+    def record_view(self, supabase, project_id):
+        """Invalidate a project's results for a new view, at most once per interval."""
+        if not self.enabled or not project_id or self.view_bumps.get(project_id):
+            return
+        self.view_bumps.set(project_id, True)
+        self.bump(supabase, project_id)
+
+    def get_stats(self):
+        with self.stats_lock:
+            stats = dict(self.stats)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = round(stats['hits'] / lookups, 3) if lookups > 0 else 0
+        stats['backend'] = self.backend if self.enabled else 'off'
+        stats['memory_entries'] = len(self.memory)
+        stats['ttl_seconds'] = self.ttl
+        return stats
+
+
+# Process-wide cache instance
+analytics_cache = AnalyticsCache()
+
+
+def bump_generation(supabase, project_id):
+    """Record a write to a project's data; call after the write succeeds."""
+    analytics_cache.bump(supabase, project_id)
+
+
+def record_view(supabase, project_id):
+    """Record a share view of a project's PRD (rate-limited, see above)."""
+    analytics_cache.record_view(supabase, project_id)
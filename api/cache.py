@@ -0,0 +1,282 @@
+"""
+LLM Response Cache for PM Clarity API
+
+Content-addressed cache in front of the Anthropic gateway. Responses are
+keyed by a SHA-256 fingerprint of the model, max_tokens and the full
+request (system prompt + messages), so an identical prompt is answered
+from cache instead of being re-sent.
+
+Two tiers are used:
+    - An in-process LRU with TTL (free, survives only warm invocations)
+    - A persistent store shared by all instances: the Supabase `llm_cache`
+      table (migrations/006_llm_cache.sql) or a local SQLite file for dev
+
+Configuration (environment variables):
+    LLM_CACHE_BACKEND       supabase | sqlite | memory | off (default supabase)
+    LLM_CACHE_TTL           Entry lifetime in seconds (default 604800, 7 days)
+    LLM_CACHE_MAX_ENTRIES   In-process LRU size (default 512)
+    LLM_CACHE_SQLITE_PATH   SQLite file for the sqlite backend
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+CACHE_BACKEND = os.environ.get('LLM_CACHE_BACKEND', 'supabase').lower()
+CACHE_TTL = int(os.environ.get('LLM_CACHE_TTL', '604800'))
+CACHE_MAX_ENTRIES = int(os.environ.get('LLM_CACHE_MAX_ENTRIES', '512'))
+SQLITE_PATH = os.environ.get('LLM_CACHE_SQLITE_PATH', '/tmp/pm_clarity_llm_cache.sqlite3')
+SQLITE_MAX_ENTRIES = 5000
+
+# Fraction of persistent writes that also purge expired rows
+PURGE_PROBABILITY = 0.02
+
+
+class LRUTTLCache:
+    """Thread-safe in-memory LRU cache whose entries also expire after ttl seconds."""
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """Return the cached value, or None if missing or expired."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= time.time():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        with self.lock:
+            self.entries[key] = (value, time.time() + (ttl if ttl is not None else self.ttl))
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class SupabaseStore:
+    """Persistent store backed by the llm_cache table."""
+
+    name = 'supabase'
+
+    def get(self, key):
+        from db import get_supabase
+
+        supabase = get_supabase()
+        now = datetime.now(timezone.utc).isoformat()
+        result = supabase.table('llm_cache').select('response_text').eq('cache_key', key).gt('expires_at', now).limit(1).execute()
+        if not result.data:
+            return None
+        return result.data[0]['response_text']
+
+    def set(self, key, value, model, ttl):
+        from db import get_supabase
+
+        supabase = get_supabase()
+        now = datetime.now(timezone.utc)
+        supabase.table('llm_cache').upsert({
+            'cache_key': key,
+            'model': model,
+            'response_text': value,
+            'created_at': now.isoformat(),
+            'expires_at': (now + timedelta(seconds=ttl)).isoformat()
+        }, on_conflict='cache_key').execute()
+
+        if _should_purge():
+            supabase.table('llm_cache').delete().lt('expires_at', now.isoformat()).execute()
+
+    def clear(self):
+        from db import get_supabase
+
+        get_supabase().table('llm_cache').delete().neq('cache_key', '').execute()
+
+
+class SQLiteStore:
+    """Persistent store backed by a local SQLite file (development)."""
+
+    name = 'sqlite'
+
+    def __init__(self, path, max_entries=SQLITE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS llm_cache ('
+                'cache_key TEXT PRIMARY KEY, model TEXT, response_text TEXT NOT NULL, '
+                'expires_at REAL NOT NULL, last_used_at REAL NOT NULL)'
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=5)
+
+    def get(self, key):
+        now = time.time()
+        with self.lock, self._connect() as conn:
+            row = conn.execute(
+                'SELECT response_text FROM llm_cache WHERE cache_key = ? AND expires_at > ?', (key, now)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute('UPDATE llm_cache SET last_used_at = ? WHERE cache_key = ?', (now, key))
+            return row[0]
+
+    def set(self, key, value, model, ttl):
+        now = time.time()
+        with self.lock, self._connect() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO llm_cache (cache_key, model, response_text, expires_at, last_used_at) '
+                'VALUES (?, ?, ?, ?, ?)', (key, model, value, now + ttl, now)
+            )
+            if _should_purge():
+                conn.execute('DELETE FROM llm_cache WHERE expires_at <= ?', (now,))
+                # Evict least recently used rows beyond the cap
+                conn.execute(
+                    'DELETE FROM llm_cache WHERE cache_key IN ('
+                    'SELECT cache_key FROM llm_cache ORDER BY last_used_at DESC LIMIT -1 OFFSET ?)',
+                    (self.max_entries,)
+                )
+
+    def clear(self):
+        with self.lock, self._connect() as conn:
+            conn.execute('DELETE FROM llm_cache')
+
+
+def _should_purge():
+    return int.from_bytes(os.urandom(2), 'big') < PURGE_PROBABILITY * 65536
+
+
+def fingerprint(model, max_tokens, messages, **kwargs):
+    """
+    Build the cache key for a request.
+
+    Args:
+        model: Model name
+        max_tokens: Maximum output tokens
+        messages: Anthropic messages list
+        **kwargs: Other request arguments that affect the output (system, temperature, ...)
+
+    Returns:
+        str: Hex SHA-256 digest
+    """
+    payload = json.dumps({
+        'model': model,
+        'max_tokens': max_tokens,
+        'messages': messages,
+        'params': kwargs
+    }, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class LLMResponseCache:
+    """Two-tier (memory + persistent) response cache with hit/miss counters."""
+
+    def __init__(self, backend=CACHE_BACKEND, ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES):
+        self.enabled = backend != 'off'
+        self.ttl = ttl
+        self.memory = LRUTTLCache(max_entries, ttl)
+        self.store = None
+        self.backend = backend
+        self.stats_lock = threading.Lock()
+        self.stats = {
+            'hits': 0,
+            'memory_hits': 0,
+            'store_hits': 0,
+            'misses': 0,
+            'writes': 0,
+            'bypassed': 0,
+            'store_errors': 0
+        }
+
+        if backend == 'supabase' and os.environ.get('SUPABASE_URL'):
+            self.store = SupabaseStore()
+        elif backend == 'sqlite':
+            try:
+                self.store = SQLiteStore(SQLITE_PATH)
+            except sqlite3.Error as e:
+                print(f"LLM cache: SQLite store unavailable ({e}), using memory only")
+
+    def _bump(self, key):
+        with self.stats_lock:
+            self.stats[key] += 1
+
+    def get(self, key):
+        """Look up a response, promoting persistent hits into memory."""
+        value = self.memory.get(key)
+        if value is not None:
+            self._bump('hits')
+            self._bump('memory_hits')
+            return value
+
+        if self.store is not None:
+            try:
+                value = self.store.get(key)
+            except Exception as e:
+                # The cache must never break a request; fall through to the API
+                self._bump('store_errors')
+                print(f"LLM cache read failed: {e}")
+                value = None
+            if value is not None:
+                self.memory.set(key, value)
+                self._bump('hits')
+                self._bump('store_hits')
+                return value
+
+        self._bump('misses')
+        return None
+
+    def set(self, key, value, model):
+        self.memory.set(key, value)
+        if self.store is not None:
+            try:
+                self.store.set(key, value, model, self.ttl)
+            except Exception as e:
+                self._bump('store_errors')
+                print(f"LLM cache write failed: {e}")
+        self._bump('writes')
+
+    def record_bypass(self):
+        self._bump('bypassed')
+
+    def clear(self):
+        self.memory.clear()
+        if self.store is not None:
+            self.store.clear()
+
+    def get_stats(self):
+        with self.stats_lock:
+            stats = dict(self.stats)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = round(stats['hits'] / lookups, 3) if lookups > 0 else 0
+        stats['backend'] = self.backend if self.enabled else 'off'
+        stats['memory_entries'] = len(self.memory)
+        stats['ttl_seconds'] = self.ttl
+        return stats
+
+
+# Process-wide cache instance
+response_cache = LLMResponseCache()
@@ -1,16 +1,7 @@
 from http.server import BaseHTTPRequestHandler
 import json
-import os
 import uuid
-from supabase import create_client
-
-
-def get_supabase():
-    url = os.environ.get('SUPABASE_URL')
-    key = os.environ.get('SUPABASE_KEY')
-    if not url or not key:
-        raise Exception("Supabase credentials not configured")
-    return create_client(url, key)
+from db import get_supabase
 
 
 def cors_headers():
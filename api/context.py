@@ -1,37 +1,32 @@
 from http.server import BaseHTTPRequestHandler
 import json
-import os
 import uuid
-import io
-from supabase import create_client
+import hashlib
+import tempfile
+from db import get_supabase
+from extraction import extract_files, get_file_extension, summarize_extraction_stats
 
 # Import authentication middleware
 from auth_middleware import get_user_from_request, is_auth_enabled
 
-# File processing libraries
-try:
-    from PyPDF2 import PdfReader
-except ImportError:
-    PdfReader = None
-
-try:
-    from docx import Document
-except ImportError:
-    Document = None
-
-try:
-    import openpyxl
-except ImportError:
-    openpyxl = None
-
-import email
-from email import policy
 import re
-import anthropic
+from analytics_cache import bump_generation
+from context_index import fill_shared_texts, get_prompt_context, index_file
+from entity_extractor import extract_entities, merge_entities
+from keyword_matcher import KeywordMatcher, merge_counts
+from llm import complete, is_llm_available
 
 ALLOWED_EXTENSIONS = {'txt', 'pdf', 'docx', 'xlsx', 'md', 'eml', 'csv'}
 MAX_FILE_SIZE = 50 * 1024 * 1024
 
+# Streaming upload parser settings
+UPLOAD_CHUNK_SIZE = 64 * 1024
+SPOOL_MAX_MEMORY = 1024 * 1024  # Larger parts spill to a temp file
+MAX_PART_HEADER_SIZE = 16 * 1024
+
+# Context characters sent to the AI deep analysis
+AI_ANALYSIS_MAX_CHARS = 15000
+
 # Coverage categories for context analysis
 COVERAGE_CATEGORIES = {
     'user_personas': {
@@ -76,9 +71,33 @@ COVERAGE_CATEGORIES = {
     }
 }
 
-
-def analyze_context_quality(files_data):
-    """Analyze the quality and coverage of context files"""
+# Term pairs that suggest contradictory statements
+CONTRADICTION_PAIRS = [
+    ('must have', 'nice to have'),
+    ('required', 'optional'),
+    ('in scope', 'out of scope'),
+    ('priority', 'deprioritize'),
+    ('asap', 'later'),
+    ('critical', 'low priority')
+]
+
+# One matcher for every keyword used by coverage and conflict analysis
+CONTEXT_MATCHER = KeywordMatcher(
+    [kw for config in COVERAGE_CATEGORIES.values() for kw in config['keywords']] +
+    [term for pair in CONTRADICTION_PAIRS for term in pair]
+)
+
+# Retrieval query for the AI deep analysis (the project description is added per request)
+AI_ANALYSIS_QUERY = ' '.join(CONTEXT_MATCHER.keywords)
+
+
+def analyze_context_quality(files_data, keyword_counts=None, total_length=None):
+    """Analyze the quality and coverage of context files
+
+    keyword_counts (from CONTEXT_MATCHER.count) and total_length can be
+    passed in when they are already known (e.g. merged from stored per-file
+    analyses), in which case files_data only needs each file's file_type.
+    """
     if not files_data:
         return {
             'quality_score': 0,
@@ -88,11 +107,12 @@ def analyze_context_quality(files_data):
         }
 
     # Combine all text
-    all_text = '\n'.join([f.get('extracted_text', '') for f in files_data if f.get('extracted_text')])
-    all_text_lower = all_text.lower()
+    if keyword_counts is None or total_length is None:
+        all_text = '\n'.join([f.get('extracted_text', '') for f in files_data if f.get('extracted_text')])
+        keyword_counts = CONTEXT_MATCHER.count(all_text) if keyword_counts is None else keyword_counts
+        total_length = len(all_text)
 
     # Calculate base metrics
-    total_length = len(all_text)
     file_count = len(files_data)
     unique_types = len(set(f.get('file_type', '') for f in files_data))
 
@@ -117,11 +137,13 @@ def analyze_context_quality(files_data):
     missing_categories = []
 
     for category, config in COVERAGE_CATEGORIES.items():
-        matches = sum(1 for kw in config['keywords'] if kw in all_text_lower)
-        if matches > 0:
+        hits = {kw: keyword_counts[kw] for kw in config['keywords'] if keyword_counts.get(kw)}
+        if hits:
             coverage[category] = {
                 'found': True,
-                'match_count': matches,
+                'match_count': sum(hits.values()),
+                'keywords_matched': len(hits),
+                'top_keywords': sorted(hits, key=hits.get, reverse=True)[:3],
                 'description': config['description']
             }
             coverage_score += config['weight']
@@ -129,6 +151,8 @@ def analyze_context_quality(files_data):
             coverage[category] = {
                 'found': False,
                 'match_count': 0,
+                'keywords_matched': 0,
+                'top_keywords': [],
                 'description': config['description']
             }
             missing_categories.append(config['description'])
@@ -172,67 +196,83 @@ def analyze_context_quality(files_data):
     }
 
 
-def extract_entities(text):
-    """Extract key entities from text"""
-    entities = {
-        'dates': [],
-        'percentages': [],
-        'monetary': [],
-        'technical_terms': []
+# Bump when the per-file analysis format changes; stale rows are recomputed
+ANALYSIS_VERSION = 3
+
+
+def analyze_file_text(text):
+    """Per-file analysis stored with each upload (context_files.analysis).
+
+    Everything here can be merged across files without the text, so
+    project-level analysis never re-reads extracted_text.
+    """
+    return {
+        'version': ANALYSIS_VERSION,
+        'length': len(text or ''),
+        'keyword_counts': CONTEXT_MATCHER.count(text),
+        'entities': extract_entities(text) if text else {}
     }
 
-    # Date patterns
-    date_patterns = [
-        r'\b\d{1,2}[/-]\d{1,2}[/-]\d{2,4}\b',
-        r'\b(?:Q[1-4]|H[1-2])\s*\d{4}\b',
-        r'\b(?:January|February|March|April|May|June|July|August|September|October|November|December)\s+\d{1,2},?\s+\d{4}\b',
-        r'\b\d{4}[/-]\d{1,2}[/-]\d{1,2}\b'
-    ]
-    for pattern in date_patterns:
-        matches = re.findall(pattern, text, re.IGNORECASE)
-        entities['dates'].extend(matches[:10])  # Limit to 10
-
-    # Percentages
-    pct_matches = re.findall(r'\b\d+(?:\.\d+)?%\b', text)
-    entities['percentages'] = list(set(pct_matches))[:10]
-
-    # Monetary values
-    money_matches = re.findall(r'\$[\d,]+(?:\.\d{2})?(?:\s*(?:million|billion|M|B|K))?\b', text, re.IGNORECASE)
-    entities['monetary'] = list(set(money_matches))[:10]
-
-    # Technical terms (common API/tech patterns)
-    tech_patterns = [
-        r'\b[A-Z]{2,}(?:\s+[A-Z]{2,})*\b',  # Acronyms
-        r'\b(?:API|SDK|REST|GraphQL|OAuth|JWT|SSL|HTTP|HTTPS)\b'
-    ]
-    for pattern in tech_patterns:
-        matches = re.findall(pattern, text)
-        entities['technical_terms'].extend(matches[:20])
-    entities['technical_terms'] = list(set(entities['technical_terms']))[:15]
-
-    return entities
-
-
-def detect_conflicts(text):
+
+def merge_file_analyses(analyses):
+    """Combine stored per-file analyses into project totals.
+
+    Returns:
+        tuple: (keyword_counts, total_length, entities); total_length counts
+        the newline that joins files, as the concatenated text would
+    """
+    keyword_counts = merge_counts(a.get('keyword_counts') for a in analyses)
+    non_empty = [a for a in analyses if a.get('length')]
+    offsets, total_length = [], 0
+    for a in non_empty:
+        offsets.append(total_length)
+        total_length += a['length'] + 1
+    total_length = max(0, total_length - 1)
+    entities = merge_entities([a.get('entities') for a in non_empty], offsets)
+    return keyword_counts, total_length, entities
+
+
+def load_file_analyses(supabase, project_id):
+    """Fetch stored per-file analyses for a project without extracted_text.
+
+    Rows uploaded before analyses were stored are analyzed once here and
+    backfilled.
+
+    Returns:
+        list: context_files rows with id, file_name, file_type, created_at, analysis
+    """
+    result = supabase.table('context_files').select('id, file_name, file_type, created_at, analysis').eq(
+        'project_id', project_id).order('created_at').execute()
+    files_data = result.data or []
+
+    stale_ids = [f['id'] for f in files_data
+                 if not f.get('analysis') or f['analysis'].get('version') != ANALYSIS_VERSION]
+    if stale_ids:
+        text_result = supabase.table('context_files').select('id, extracted_text, source_file_id').in_('id', stale_ids).execute()
+        texts = {row['id']: row.get('extracted_text') or '' for row in fill_shared_texts(supabase, text_result.data or [])}
+        for f in files_data:
+            if f['id'] in texts:
+                f['analysis'] = analyze_file_text(texts[f['id']])
+                try:
+                    supabase.table('context_files').update({'analysis': f['analysis']}).eq('id', f['id']).execute()
+                except Exception as e:
+                    print(f"Failed to backfill analysis for {f['id']}: {e}")
+    return files_data
+
+
+def detect_conflicts(text, keyword_counts=None):
     """Detect potential conflicts or inconsistencies in the context"""
     conflicts = []
-    text_lower = text.lower()
+    if keyword_counts is None:
+        keyword_counts = CONTEXT_MATCHER.count(text)
 
     # Check for contradictory statements
-    contradiction_pairs = [
-        ('must have', 'nice to have'),
-        ('required', 'optional'),
-        ('in scope', 'out of scope'),
-        ('priority', 'deprioritize'),
-        ('asap', 'later'),
-        ('critical', 'low priority')
-    ]
-
-    for term1, term2 in contradiction_pairs:
-        if term1 in text_lower and term2 in text_lower:
+    for term1, term2 in CONTRADICTION_PAIRS:
+        if keyword_counts.get(term1) and keyword_counts.get(term2):
             conflicts.append({
                 'type': 'potential_contradiction',
                 'terms': [term1, term2],
+                'counts': [keyword_counts[term1], keyword_counts[term2]],
                 'message': f'Found both "{term1}" and "{term2}" - may need clarification'
             })
 
@@ -241,18 +281,15 @@ def detect_conflicts(text):
 
 def ai_analyze_context(text, project_description=''):
     """Use AI to provide deeper analysis of context"""
-    api_key = os.environ.get('ANTHROPIC_API_KEY')
-    if not api_key:
+    if not is_llm_available():
         return None
 
     try:
-        client = anthropic.Anthropic(api_key=api_key)
-
         prompt = f"""Analyze the following context documents for a product requirements document (PRD).
 Project description: {project_description or 'Not provided'}
 
-Context content (first 15000 chars):
-{text[:15000]}
+Context content (most relevant excerpts):
+{text[:AI_ANALYSIS_MAX_CHARS]}
 
 Provide a JSON response with:
 1. "key_themes": List of 3-5 main themes/topics found
@@ -264,13 +301,7 @@ Provide a JSON response with:
 
 Respond ONLY with valid JSON, no other text."""
 
-        response = client.messages.create(
-            model="claude-sonnet-4-20250514",
-            max_tokens=1000,
-            messages=[{"role": "user", "content": prompt}]
-        )
-
-        response_text = response.content[0].text.strip()
+        response_text = complete(prompt, max_tokens=1000, cache=True).strip()
         # Try to parse JSON from response
         if response_text.startswith('{'):
             return json.loads(response_text)
@@ -284,15 +315,56 @@ Respond ONLY with valid JSON, no other text."""
         return None
 
 
+def run_deep_analysis(supabase, project_id):
+    """Basic plus AI analysis of a project's context, or None if it has no files"""
+    # Get project info
+    project_result = supabase.table('projects').select('description').eq('id', project_id).execute()
+    project_description = ''
+    if project_result.data:
+        project_description = project_result.data[0].get('description') or ''
+
+    # Get stored per-file analyses
+    files_data = load_file_analyses(supabase, project_id)
+    if not files_data:
+        return None
+
+    # Perform basic analysis first
+    keyword_counts, total_length, entities = merge_file_analyses([f['analysis'] for f in files_data])
+    basic_analysis = analyze_context_quality(files_data, keyword_counts, total_length)
+    conflicts = detect_conflicts('', keyword_counts)
+
+    # Perform AI deep analysis on the chunks most relevant to it
+    all_text = get_prompt_context(supabase, project_id, f"{project_description} {AI_ANALYSIS_QUERY}",
+                                  AI_ANALYSIS_MAX_CHARS // 4)
+    ai_analysis = ai_analyze_context(all_text, project_description)
+
+    return {
+        **basic_analysis,
+        'entities': entities,
+        'conflicts': conflicts,
+        'ai_analysis': ai_analysis,
+        'file_count': len(files_data)
+    }
+
+
+def run_analyze_context_job(supabase, job):
+    """Job runner for 'analyze_context' (see jobs.py and worker.py)"""
+    job.report(completed=0, total=1, message='Analyzing context')
+    result = run_deep_analysis(supabase, job.project_id)
+    if result is None:
+        raise Exception('No context files to analyze')
+    if result['ai_analysis'] is None and job.attempts < job.max_attempts:
+        # ai_analyze_context swallows its errors; retry rather than finish without it
+        raise Exception('AI analysis failed')
+    return result
+
+
 def summarize_file(text, filename):
     """Generate a summary of a single file using AI"""
-    api_key = os.environ.get('ANTHROPIC_API_KEY')
-    if not api_key:
+    if not is_llm_available():
         return {'summary': text[:500] + '...' if len(text) > 500 else text, 'key_points': []}
 
     try:
-        client = anthropic.Anthropic(api_key=api_key)
-
         prompt = f"""Summarize this document for a PRD context. File: {filename}
 
 Content (first 10000 chars):
@@ -306,13 +378,7 @@ Provide a JSON response with:
 
 Respond ONLY with valid JSON."""
 
-        response = client.messages.create(
-            model="claude-sonnet-4-20250514",
-            max_tokens=500,
-            messages=[{"role": "user", "content": prompt}]
-        )
-
-        response_text = response.content[0].text.strip()
+        response_text = complete(prompt, max_tokens=500, cache=True).strip()
         if response_text.startswith('{'):
             return json.loads(response_text)
         json_match = re.search(r'```(?:json)?\s*(\{.*?\})\s*```', response_text, re.DOTALL)
@@ -323,14 +389,6 @@ Respond ONLY with valid JSON."""
         return {'summary': text[:500] + '...' if len(text) > 500 else text, 'key_points': []}
 
 
-def get_supabase():
-    url = os.environ.get('SUPABASE_URL')
-    key = os.environ.get('SUPABASE_KEY')
-    if not url or not key:
-        raise Exception("Supabase credentials not configured")
-    return create_client(url, key)
-
-
 def cors_headers():
     return {
         'Access-Control-Allow-Origin': '*',
@@ -366,150 +424,195 @@ def parse_path(path):
     return (None, None, None)
 
 
-def get_file_extension(filename):
-    return filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+def validate_upload(file_info):
+    """Return an error message for an unacceptable upload, or None"""
+    ext = get_file_extension(file_info['filename'])
+    if ext not in ALLOWED_EXTENSIONS:
+        return f"Unsupported file type: .{ext}"
+    if file_info['too_large']:
+        return 'File too large'
+    if file_info['size'] == 0:
+        return 'File is empty'
+    return None
+
+
+def find_known_uploads(supabase, content_hashes, user_id=None, project_id=None):
+    """Look up the uploader's earlier uploads with the same bytes.
+
+    Only the user's own files are matched (the project's when auth is off),
+    so reuse never reveals or links to another tenant's upload. One row,
+    the newest that holds a successful extraction, is fetched per hash;
+    its text is not loaded, since the new row will point at it.
+
+    Returns:
+        dict: content_hash -> {'id', 'file_url', 'analysis'}
+    """
+    scope = ('user_id', user_id) if user_id else ('project_id', project_id)
+    if not scope[1]:
+        return {}
+    known = {}
+    for content_hash in {h for h in content_hashes if h}:
+        result = supabase.table('context_files').select('id, file_url, analysis').eq(
+            'content_hash', content_hash).eq(*scope).neq('extracted_text', '').not_.like(
+            'extracted_text', 'Error extracting text:%').order('created_at', desc=True).limit(1).execute()
+        if result.data:
+            row = result.data[0]
+            known[content_hash] = {'id': row['id'], 'file_url': row.get('file_url') or '', 'analysis': row.get('analysis')}
+    return known
+
+
+def get_multipart_boundary(content_type):
+    for part in content_type.split(';'):
+        part = part.strip()
+        if part.startswith('boundary='):
+            return part[9:].strip('"')
+    return None
+
+
+def parse_part_headers(header_section):
+    headers = {}
+    for line in header_section.decode('utf-8', errors='ignore').split('\n'):
+        if ':' in line:
+            key, value = line.split(':', 1)
+            headers[key.strip().lower()] = value.strip()
+    return headers
 
 
-def extract_text_plain(file_data):
-    try:
-        return file_data.decode('utf-8')
-    except UnicodeDecodeError:
-        return file_data.decode('latin-1')
-
-
-def extract_pdf(file_data):
-    if PdfReader is None:
-        return "PDF extraction not available"
-    pdf_file = io.BytesIO(file_data)
-    reader = PdfReader(pdf_file)
-    text_parts = []
-    for page in reader.pages:
-        text = page.extract_text()
-        if text:
-            text_parts.append(text)
-    return '\n\n'.join(text_parts)
-
-
-def extract_docx(file_data):
-    if Document is None:
-        return "DOCX extraction not available"
-    docx_file = io.BytesIO(file_data)
-    doc = Document(docx_file)
-    text_parts = []
-    for para in doc.paragraphs:
-        if para.text.strip():
-            text_parts.append(para.text)
-    for table in doc.tables:
-        for row in table.rows:
-            row_text = [cell.text for cell in row.cells if cell.text.strip()]
-            if row_text:
-                text_parts.append(' | '.join(row_text))
-    return '\n'.join(text_parts)
-
-
-def extract_xlsx(file_data):
-    if openpyxl is None:
-        return "XLSX extraction not available"
-    xlsx_file = io.BytesIO(file_data)
-    workbook = openpyxl.load_workbook(xlsx_file, data_only=True)
-    text_parts = []
-    for sheet_name in workbook.sheetnames:
-        sheet = workbook[sheet_name]
-        text_parts.append(f"=== Sheet: {sheet_name} ===")
-        for row in sheet.iter_rows():
-            row_values = [str(cell.value) for cell in row if cell.value is not None]
-            if row_values:
-                text_parts.append(' | '.join(row_values))
-    return '\n'.join(text_parts)
-
-
-def extract_email(file_data):
-    msg = email.message_from_bytes(file_data, policy=policy.default)
-    text_parts = [
-        f"From: {msg.get('From', 'N/A')}",
-        f"To: {msg.get('To', 'N/A')}",
-        f"Subject: {msg.get('Subject', 'N/A')}",
-        f"Date: {msg.get('Date', 'N/A')}",
-        ""
-    ]
-    if msg.is_multipart():
-        for part in msg.walk():
-            if part.get_content_type() == 'text/plain':
-                payload = part.get_payload(decode=True)
-                if payload:
-                    try:
-                        text_parts.append(payload.decode('utf-8'))
-                    except UnicodeDecodeError:
-                        text_parts.append(payload.decode('latin-1'))
-    else:
-        payload = msg.get_payload(decode=True)
-        if payload:
-            try:
-                text_parts.append(payload.decode('utf-8'))
-            except UnicodeDecodeError:
-                text_parts.append(payload.decode('latin-1'))
-    return '\n'.join(text_parts)
+def get_part_filename(headers):
+    content_disp = headers.get('content-disposition', '')
+    if 'filename=' not in content_disp:
+        return None
+    for part_cd in content_disp.split(';'):
+        part_cd = part_cd.strip()
+        if part_cd.startswith('filename='):
+            return part_cd[9:].strip('"') or None
+    return None
 
 
-def extract_text(file_data, filename):
-    ext = get_file_extension(filename)
-    extractors = {
-        'txt': extract_text_plain, 'md': extract_text_plain, 'csv': extract_text_plain,
-        'pdf': extract_pdf, 'docx': extract_docx, 'xlsx': extract_xlsx, 'eml': extract_email
-    }
-    extractor = extractors.get(ext)
-    if extractor:
-        try:
-            return extractor(file_data)
-        except Exception as e:
-            return f"Error extracting text: {str(e)}"
-    return f"Unsupported file type: {ext}"
+def _write_part(part, buf, length):
+    """Append buf[:length] to the part's spool (without copying buf), enforcing the size cap"""
+    if part is None or length <= 0:
+        return
+    part['size'] += length
+    if part['too_large']:
+        return
+    if part['size'] > part['max_size']:
+        # Stop storing; the rest of the part is drained and discarded
+        part['too_large'] = True
+        part['file'].close()
+        part['file'] = None
+        return
+    with memoryview(buf) as view, view[:length] as piece:
+        part['file'].write(piece)
+        part['hasher'].update(piece)
+
+
+def parse_multipart(rfile, content_type, content_length, max_file_size=MAX_FILE_SIZE):
+    """Parse a multipart/form-data request body incrementally.
 
+    Reads at most content_length bytes from rfile in UPLOAD_CHUNK_SIZE chunks
+    and spools each file part to a SpooledTemporaryFile, so memory use is
+    bounded by the spool threshold rather than the request size. Parts larger
+    than max_file_size are drained without being stored.
 
-def parse_multipart(body, content_type):
+    Returns:
+        list: {'filename', 'file', 'size', 'too_large', 'content_hash'} per
+        file part; 'file' is positioned at the start (None if too large) and
+        must be closed by the caller. 'content_hash' is the SHA-256 of the
+        part's bytes.
+    """
     files = []
-    boundary = None
-    for part in content_type.split(';'):
-        part = part.strip()
-        if part.startswith('boundary='):
-            boundary = part[9:].strip('"')
-            break
+    boundary = get_multipart_boundary(content_type)
     if not boundary:
         return files
 
-    boundary_bytes = f'--{boundary}'.encode()
-    parts = body.split(boundary_bytes)
+    delimiter = b'\r\n--' + boundary.encode()
+    # The first delimiter has no leading CRLF; prepend one so all match
+    buf = bytearray(b'\r\n')
+    remaining = content_length
+
+    def fill():
+        nonlocal remaining
+        if remaining <= 0:
+            return False
+        chunk = rfile.read(min(UPLOAD_CHUNK_SIZE, remaining))
+        if not chunk:
+            remaining = 0
+            return False
+        remaining -= len(chunk)
+        buf.extend(chunk)
+        return True
 
-    for part in parts:
-        if not part or part == b'--\r\n' or part == b'--':
-            continue
-        if b'\r\n\r\n' in part:
-            header_section, content = part.split(b'\r\n\r\n', 1)
-        elif b'\n\n' in part:
-            header_section, content = part.split(b'\n\n', 1)
-        else:
-            continue
-
-        headers = {}
-        for line in header_section.decode('utf-8', errors='ignore').split('\n'):
-            if ':' in line:
-                key, value = line.split(':', 1)
-                headers[key.strip().lower()] = value.strip()
-
-        content_disp = headers.get('content-disposition', '')
-        if 'filename=' in content_disp:
-            filename = None
-            for part_cd in content_disp.split(';'):
-                part_cd = part_cd.strip()
-                if part_cd.startswith('filename='):
-                    filename = part_cd[9:].strip('"')
+    def close_all():
+        for f in files:
+            if f['file'] is not None:
+                f['file'].close()
+
+    try:
+        # Skip the preamble
+        while True:
+            idx = buf.find(delimiter)
+            if idx >= 0:
+                del buf[:idx + len(delimiter)]
+                break
+            del buf[:max(0, len(buf) - len(delimiter) + 1)]
+            if not fill():
+                return files
+
+        while True:
+            # After a delimiter: "--" closes the body, otherwise part headers follow
+            while len(buf) < 2 and fill():
+                pass
+            if buf[:2] == b'--' or len(buf) < 2:
+                break
+
+            while True:
+                header_end = buf.find(b'\r\n\r\n')
+                if header_end >= 0:
                     break
+                if len(buf) > MAX_PART_HEADER_SIZE:
+                    raise Exception("Multipart part headers too large")
+                if not fill():
+                    raise Exception("Multipart body ended unexpectedly")
+            headers = parse_part_headers(bytes(buf[:header_end]))
+            del buf[:header_end + 4]
+
+            filename = get_part_filename(headers)
+            part = None
             if filename:
-                if content.endswith(b'\r\n'):
-                    content = content[:-2]
-                elif content.endswith(b'\n'):
-                    content = content[:-1]
-                files.append({'filename': filename, 'data': content})
+                part = {
+                    'filename': filename,
+                    'file': tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY),
+                    'size': 0,
+                    'too_large': False,
+                    'max_size': max_file_size,
+                    'hasher': hashlib.sha256()
+                }
+                files.append(part)
+
+            # Stream the part body, holding back enough bytes to spot a split delimiter
+            while True:
+                idx = buf.find(delimiter)
+                if idx >= 0:
+                    _write_part(part, buf, idx)
+                    del buf[:idx + len(delimiter)]
+                    break
+                safe = len(buf) - len(delimiter) + 1
+                if safe > 0:
+                    _write_part(part, buf, safe)
+                    del buf[:safe]
+                if not fill():
+                    raise Exception("Multipart body ended unexpectedly")
+    except Exception:
+        close_all()
+        raise
+
+    for f in files:
+        f.pop('max_size', None)
+        hasher = f.pop('hasher')
+        f['content_hash'] = hasher.hexdigest() if not f['too_large'] else None
+        if f['file'] is not None:
+            f['file'].seek(0)
     return files
 
 
@@ -547,9 +650,10 @@ class handler(BaseHTTPRequestHandler):
                 self.send_json(200, result.data if result.data else [])
 
             elif op == 'text' and project_id:
-                result = supabase.table('context_files').select('file_name, extracted_text').eq('project_id', project_id).execute()
+                result = supabase.table('context_files').select('file_name, extracted_text, source_file_id').eq(
+                    'project_id', project_id).execute()
                 texts = []
-                for f in (result.data or []):
+                for f in fill_shared_texts(supabase, result.data or []):
                     if f.get('extracted_text'):
                         texts.append(f"=== {f.get('file_name', 'Unknown')} ===\n{f['extracted_text']}")
                 aggregated = "\n\n".join(texts)
@@ -561,7 +665,7 @@ class handler(BaseHTTPRequestHandler):
                     return
                 result = supabase.table('context_files').select('*').eq('id', file_id).execute()
                 if result.data:
-                    self.send_json(200, result.data[0])
+                    self.send_json(200, fill_shared_texts(supabase, result.data)[0])
                 else:
                     self.send_json(404, {'error': 'File not found'})
 
@@ -570,21 +674,15 @@ class handler(BaseHTTPRequestHandler):
                     self.send_json(400, {'error': 'Invalid project ID format'})
                     return
 
-                # Get all context files for project
-                result = supabase.table('context_files').select('*').eq('project_id', project_id).execute()
-                files_data = result.data or []
+                # Merge the per-file analyses stored at upload time
+                files_data = load_file_analyses(supabase, project_id)
+                keyword_counts, total_length, entities = merge_file_analyses([f['analysis'] for f in files_data])
 
                 # Perform quality analysis
-                analysis = analyze_context_quality(files_data)
-
-                # Combine all text for entity extraction
-                all_text = '\n'.join([f.get('extracted_text', '') for f in files_data if f.get('extracted_text')])
-
-                # Extract entities
-                entities = extract_entities(all_text) if all_text else {}
+                analysis = analyze_context_quality(files_data, keyword_counts, total_length)
 
                 # Detect conflicts
-                conflicts = detect_conflicts(all_text) if all_text else []
+                conflicts = detect_conflicts('', keyword_counts) if total_length else []
 
                 self.send_json(200, {
                     **analysis,
@@ -603,8 +701,8 @@ class handler(BaseHTTPRequestHandler):
                     self.send_json(404, {'error': 'File not found'})
                     return
 
-                file_info = result.data[0]
-                text = file_info.get('extracted_text', '')
+                file_info = fill_shared_texts(supabase, result.data)[0]
+                text = file_info.get('extracted_text') or ''
                 filename = file_info.get('file_name', 'unknown')
 
                 summary = summarize_file(text, filename)
@@ -621,6 +719,69 @@ class handler(BaseHTTPRequestHandler):
             self.send_json(500, {'error': str(e)})
         return
 
+    def save_uploaded_file(self, supabase, project_id, user_id, file_info, extracted_text, stats, uploaded, errors,
+                           file_url=None, analysis=None, source_file_id=None):
+        """Store one extracted upload, recording the outcome.
+
+        The bytes are uploaded to storage unless file_url points at an
+        existing object with the same content, and the per-file analysis is
+        computed unless a current one is passed in. A re-upload passes the
+        source_file_id of the row holding the same content instead of the
+        text: the new row stores no text or chunks of its own. Returns the
+        saved row's (id, file_url, analysis), or None if the file was not saved.
+        """
+        filename = file_info['filename']
+        ext = get_file_extension(filename)
+
+        if extracted_text.startswith('Error extracting text:'):
+            errors.append({'file': filename, 'error': extracted_text})
+            return None
+
+        try:
+            if file_url is None:
+                file_data = file_info['file'].read()
+                unique_filename = f"{project_id}/{uuid.uuid4()}_{filename}"
+                file_url = ''
+                try:
+                    supabase.storage.from_('context-files').upload(unique_filename, file_data, {'content-type': 'application/octet-stream'})
+                    file_url = supabase.storage.from_('context-files').get_public_url(unique_filename)
+                except Exception:
+                    pass
+
+            # A stale analysis of shared text is refreshed by load_file_analyses()
+            if not source_file_id and (not analysis or analysis.get('version') != ANALYSIS_VERSION):
+                analysis = analyze_file_text(extracted_text)
+
+            file_id = str(uuid.uuid4())
+            insert_data = {
+                'id': file_id, 'project_id': project_id, 'file_name': filename,
+                'file_type': ext, 'file_url': file_url, 'extracted_text': None if source_file_id else extracted_text,
+                'content_hash': file_info['content_hash'], 'analysis': analysis
+            }
+            if source_file_id:
+                insert_data['source_file_id'] = source_file_id
+            if user_id:
+                insert_data['user_id'] = user_id
+            db_result = supabase.table('context_files').insert(insert_data).execute()
+
+            if db_result.data:
+                if not source_file_id:
+                    try:
+                        index_file(supabase, project_id, file_id, extracted_text)
+                    except Exception as e:
+                        # Indexed on the next retrieval instead
+                        print(f"Failed to index chunks for {filename}: {e}")
+                uploaded.append({
+                    'id': file_id, 'file_name': filename, 'file_type': ext,
+                    'text_length': (analysis or {}).get('length', len(extracted_text)),
+                    'extraction': summarize_extraction_stats(stats)
+                })
+                return file_id, file_url, analysis
+            errors.append({'file': filename, 'error': 'Failed to save to database'})
+        except Exception as e:
+            errors.append({'file': filename, 'error': str(e)})
+        return None
+
     def do_POST(self):
         """Handle file uploads and AI analysis"""
         # Check authentication
@@ -640,38 +801,11 @@ class handler(BaseHTTPRequestHandler):
 
                 supabase = get_supabase()
 
-                # Get project info
-                project_result = supabase.table('projects').select('*').eq('id', project_id).execute()
-                project_description = ''
-                if project_result.data:
-                    project_description = project_result.data[0].get('description', '')
-
-                # Get all context files
-                result = supabase.table('context_files').select('*').eq('project_id', project_id).execute()
-                files_data = result.data or []
-
-                if not files_data:
+                result = run_deep_analysis(supabase, project_id)
+                if result is None:
                     self.send_json(400, {'error': 'No context files to analyze'})
                     return
-
-                # Combine all text
-                all_text = '\n'.join([f.get('extracted_text', '') for f in files_data if f.get('extracted_text')])
-
-                # Perform basic analysis first
-                basic_analysis = analyze_context_quality(files_data)
-                entities = extract_entities(all_text)
-                conflicts = detect_conflicts(all_text)
-
-                # Perform AI deep analysis
-                ai_analysis = ai_analyze_context(all_text, project_description)
-
-                self.send_json(200, {
-                    **basic_analysis,
-                    'entities': entities,
-                    'conflicts': conflicts,
-                    'ai_analysis': ai_analysis,
-                    'file_count': len(files_data)
-                })
+                self.send_json(200, result)
                 return
 
             if op != 'upload' or not project_id:
@@ -689,60 +823,53 @@ class handler(BaseHTTPRequestHandler):
                 self.send_json(400, {'error': 'No files provided'})
                 return
 
-            body = self.rfile.read(content_length)
             content_type = self.headers.get('Content-Type', '')
-            files = parse_multipart(body, content_type)
+            files = parse_multipart(self.rfile, content_type, content_length)
 
             if not files:
                 self.send_json(400, {'error': 'No valid files provided'})
                 return
 
             uploaded, errors = [], []
-            for file_info in files:
-                filename = file_info['filename']
-                file_data = file_info['data']
-                ext = get_file_extension(filename)
-
-                if ext not in ALLOWED_EXTENSIONS:
-                    errors.append({'file': filename, 'error': f"Unsupported file type: .{ext}"})
-                    continue
-                if len(file_data) > MAX_FILE_SIZE:
-                    errors.append({'file': filename, 'error': 'File too large'})
-                    continue
-                if len(file_data) == 0:
-                    errors.append({'file': filename, 'error': 'File is empty'})
-                    continue
-
-                try:
-                    extracted_text = extract_text(file_data, filename)
-                    if extracted_text.startswith('Error extracting text:'):
-                        errors.append({'file': filename, 'error': extracted_text})
-                        continue
-
-                    unique_filename = f"{project_id}/{uuid.uuid4()}_{filename}"
-                    file_url = ''
-                    try:
-                        supabase.storage.from_('context-files').upload(unique_filename, file_data, {'content-type': 'application/octet-stream'})
-                        file_url = supabase.storage.from_('context-files').get_public_url(unique_filename)
-                    except Exception:
-                        pass
-
-                    file_id = str(uuid.uuid4())
-                    insert_data = {
-                        'id': file_id, 'project_id': project_id, 'file_name': filename,
-                        'file_type': ext, 'file_url': file_url, 'extracted_text': extracted_text
-                    }
-                    if user_id:
-                        insert_data['user_id'] = user_id
-                    db_result = supabase.table('context_files').insert(insert_data).execute()
-
-                    if db_result.data:
-                        uploaded.append({'id': file_id, 'file_name': filename, 'file_type': ext, 'text_length': len(extracted_text)})
+            try:
+                valid_files = []
+                for file_info in files:
+                    error = validate_upload(file_info)
+                    if error:
+                        errors.append({'file': file_info['filename'], 'error': error})
                     else:
-                        errors.append({'file': filename, 'error': 'Failed to save to database'})
-                except Exception as e:
-                    errors.append({'file': filename, 'error': str(e)})
-
+                        valid_files.append(file_info)
+
+                # Content this user uploaded before (or sent twice in this request)
+                # reuses its extraction, chunks and storage object
+                known = find_known_uploads(supabase, [f['content_hash'] for f in valid_files], user_id, project_id)
+                to_extract = {}
+                for file_info in valid_files:
+                    if file_info['content_hash'] not in known:
+                        to_extract.setdefault(file_info['content_hash'], file_info)
+                extracted = dict(zip(to_extract, extract_files(list(to_extract.values()))))
+
+                for file_info in valid_files:
+                    content_hash = file_info['content_hash']
+                    if content_hash in known:
+                        reused = known[content_hash]
+                        extracted_text, stats, source_file_id = '', {'reused': True}, reused['id']
+                        file_url, analysis = reused['file_url'] or None, reused.get('analysis')
+                    else:
+                        (extracted_text, stats), file_url, analysis = extracted[content_hash], None, None
+                        source_file_id = None
+                    saved = self.save_uploaded_file(supabase, project_id, user_id, file_info, extracted_text, stats,
+                                                    uploaded, errors, file_url=file_url, analysis=analysis,
+                                                    source_file_id=source_file_id)
+                    if saved is not None and content_hash not in known:
+                        known[content_hash] = {'id': saved[0], 'file_url': saved[1], 'analysis': saved[2]}
+            finally:
+                for file_info in files:
+                    if file_info['file'] is not None:
+                        file_info['file'].close()
+
+            if uploaded:
+                bump_generation(supabase, project_id)
             self.send_json(200, {'uploaded': uploaded, 'errors': errors, 'summary': {'total_files': len(files), 'successful': len(uploaded), 'failed': len(errors)}})
 
         except Exception as e:
@@ -776,7 +903,12 @@ class handler(BaseHTTPRequestHandler):
                 return
 
             file_info = file_result.data[0]
-            if file_info.get('file_url') and 'context-files/' in file_info['file_url']:
+            # Deduplicated uploads share one storage object; keep it while other rows use it
+            shared = False
+            if file_info.get('file_url'):
+                others = supabase.table('context_files').select('id').eq('file_url', file_info['file_url']).neq('id', file_id).limit(1).execute()
+                shared = bool(others.data)
+            if not shared and file_info.get('file_url') and 'context-files/' in file_info['file_url']:
                 try:
                     storage_path = file_info['file_url'].split('context-files/')[-1]
                     supabase.storage.from_('context-files').remove([storage_path])
@@ -784,6 +916,7 @@ class handler(BaseHTTPRequestHandler):
                     pass
 
             supabase.table('context_files').delete().eq('id', file_id).execute()
+            bump_generation(supabase, file_info.get('project_id'))
             self.send_json(200, {'message': 'File deleted successfully'})
 
         except Exception as e:
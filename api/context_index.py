@@ -0,0 +1,407 @@
+"""
+Context Chunk Index for PM Clarity API
+
+Splits each context file into chunks at upload time and stores them in the
+`context_chunks` table (migrations/009_context_chunks.sql) together with
+their term frequencies, a small inverted index kept next to context_files.
+
+Prompt builders call get_prompt_context() with a query describing their task
+(the questions being answered, the analysis being run, ...), or
+get_prompt_contexts() with one query per prompt (e.g. per prefill batch).
+The project's chunks are ranked with BM25 and the matching ones that fit the
+token budget are returned in document order, so relevant text from every
+file can reach the prompt instead of whatever happened to come first in the
+concatenated files. Context that fits the budget as a whole is sent as is.
+
+A re-uploaded file (context_files.source_file_id set) has no text or chunks
+of its own; it is searched through those of the row it points at.
+
+If the index cannot be used (e.g. the migration has not been run) the
+leading text of the files is returned instead, as before.
+
+Configuration (environment variables):
+    CONTEXT_CHUNK_CHARS     Target chunk size in characters (default 1500)
+"""
+
+import math
+import os
+import re
+import uuid
+from collections import Counter
+
+CHUNK_CHARS = int(os.environ.get('CONTEXT_CHUNK_CHARS', '1500'))
+CHUNK_INSERT_BATCH = 200
+# Rows per select request; PostgREST caps responses at its max-rows setting
+CHUNK_PAGE_SIZE = 1000
+
+# BM25 parameters (the usual defaults)
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Placed between chunks that are not adjacent in the same file
+CHUNK_SEPARATOR = '\n\n...\n\n'
+# Budgeted per chunk for its file header or separator
+CHUNK_OVERHEAD_CHARS = 64
+
+TERM_PATTERN = re.compile(r'[a-z0-9]+')
+PARAGRAPH_BREAK = re.compile(r'\n\s*\n')
+SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+
+STOPWORDS = frozenset(
+    'a an and are as at be been but by can could did do does for from had has have how i if in into is it its '
+    'may me might my no not of on or our should so than that the their them then there these they this those '
+    'to too us was we were what when where which while who why will with would you your'.split()
+)
+
+
+def tokenize(text):
+    """Lowercase index terms of text (stopwords and single characters dropped)."""
+    return [term for term in TERM_PATTERN.findall((text or '').lower())
+            if len(term) > 1 and term not in STOPWORDS]
+
+
+def _split_long(paragraph, max_chars):
+    """Split an oversized paragraph at sentence ends, then at whitespace."""
+    pieces, current = [], ''
+    for sentence in SENTENCE_END.split(paragraph):
+        while len(sentence) > max_chars:
+            cut = sentence.rfind(' ', 0, max_chars)
+            cut = cut if cut > 0 else max_chars
+            if current:
+                pieces.append(current)
+                current = ''
+            pieces.append(sentence[:cut])
+            sentence = sentence[cut:].lstrip()
+        if current and len(current) + len(sentence) + 1 > max_chars:
+            pieces.append(current)
+            current = ''
+        current = f"{current} {sentence}" if current else sentence
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def chunk_text(text, max_chars=CHUNK_CHARS):
+    """
+    Split text into chunks of about max_chars, keeping paragraphs together.
+
+    Args:
+        text: Extracted file text
+        max_chars: Maximum chunk length
+
+    Returns:
+        list: Chunk strings in text order
+    """
+    chunks, current = [], ''
+    for paragraph in PARAGRAPH_BREAK.split(text or ''):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        for piece in (_split_long(paragraph, max_chars) if len(paragraph) > max_chars else [paragraph]):
+            if current and len(current) + len(piece) + 2 > max_chars:
+                chunks.append(current)
+                current = ''
+            current = f"{current}\n\n{piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def build_chunk_rows(project_id, file_id, text):
+    """Build context_chunks rows (with term frequencies) for one file."""
+    rows = []
+    for index, content in enumerate(chunk_text(text)):
+        terms = Counter(tokenize(content))
+        rows.append({
+            'id': str(uuid.uuid4()),
+            'project_id': project_id,
+            'file_id': file_id,
+            'chunk_index': index,
+            'content': content,
+            'char_count': len(content),
+            'term_count': sum(terms.values()),
+            'terms': dict(terms)
+        })
+    return rows
+
+
+def index_file(supabase, project_id, file_id, text):
+    """
+    (Re)build the chunk index of one context file.
+
+    Returns:
+        list: The inserted chunk rows
+    """
+    rows = build_chunk_rows(project_id, file_id, text)
+    supabase.table('context_chunks').delete().eq('file_id', file_id).execute()
+    for i in range(0, len(rows), CHUNK_INSERT_BATCH):
+        supabase.table('context_chunks').insert(rows[i:i + CHUNK_INSERT_BATCH]).execute()
+    return rows
+
+
+def fill_shared_texts(supabase, rows):
+    """
+    Fill in extracted_text of context_files rows that share another row's
+    text (source_file_id set), in one request.
+
+    Returns:
+        list: The same rows
+    """
+    source_ids = list({r['source_file_id'] for r in rows if r.get('source_file_id') and not r.get('extracted_text')})
+    if source_ids:
+        result = supabase.table('context_files').select('id, extracted_text').in_('id', source_ids).execute()
+        texts = {row['id']: row.get('extracted_text') or '' for row in (result.data or [])}
+        for r in rows:
+            if r.get('source_file_id') and not r.get('extracted_text'):
+                r['extracted_text'] = texts.get(r['source_file_id'], '')
+    return rows
+
+
+def bm25_scores(chunks, query_terms):
+    """
+    Score chunks against a query with BM25.
+
+    Args:
+        chunks: Dicts with 'terms' (term -> frequency) and 'term_count'
+        query_terms: Query terms; repeats are ignored so broad queries made
+            of many questions are not dominated by their most common words
+
+    Returns:
+        list: One score per chunk
+    """
+    query_terms = set(query_terms)
+    if not chunks or not query_terms:
+        return [0.0] * len(chunks)
+
+    doc_freq = Counter()
+    for chunk in chunks:
+        doc_freq.update(query_terms.intersection(chunk['terms']))
+    total = len(chunks)
+    idf = {term: math.log(1 + (total - df + 0.5) / (df + 0.5)) for term, df in doc_freq.items()}
+    avg_length = sum(chunk['term_count'] for chunk in chunks) / total or 1
+
+    scores = []
+    for chunk in chunks:
+        terms = chunk['terms']
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * chunk['term_count'] / avg_length)
+        score = 0.0
+        for term, weight in idf.items():
+            tf = terms.get(term)
+            if tf:
+                score += weight * tf * (BM25_K1 + 1) / (tf + norm)
+        scores.append(score)
+    return scores
+
+
+def _chunk_cost(chunk):
+    # Same ~4 characters per token estimate as llm.estimate_tokens
+    return (chunk['char_count'] + CHUNK_OVERHEAD_CHARS) // 4 + 1
+
+
+def select_chunks(chunks, scores, max_tokens):
+    """
+    Pick the best-scoring chunks that fit max_tokens.
+
+    Only chunks matching the query are used, so prompts shrink when little
+    of the context is relevant; if none match, the leading chunks are used.
+    Returns the picked chunks in document order.
+    """
+    candidates = [i for i in range(len(chunks)) if scores[i] > 0] or range(len(chunks))
+    ranked = sorted(candidates, key=lambda i: (-scores[i], chunks[i]['position']))
+    picked, used = [], 0
+    for i in ranked:
+        cost = _chunk_cost(chunks[i])
+        if used + cost > max_tokens:
+            continue
+        picked.append(chunks[i])
+        used += cost
+    picked.sort(key=lambda chunk: chunk['position'])
+    return picked
+
+
+def select_all(build_query, page_size=CHUNK_PAGE_SIZE):
+    """
+    Run a select page by page until every matching row is loaded.
+
+    PostgREST silently cuts a response off at its max-rows limit, so large
+    result sets are requested in ranges. The total comes from the first
+    page's exact count, so pages shortened by a lower server limit are
+    continued rather than mistaken for the end.
+
+    Args:
+        build_query: Called with no arguments for each page; returns a fresh
+            query built with select(..., count='exact') and a stable order
+        page_size: Rows requested per page
+
+    Returns:
+        list: All matching rows
+    """
+    rows = []
+    while True:
+        result = build_query().range(len(rows), len(rows) + page_size - 1).execute()
+        page = result.data or []
+        rows.extend(page)
+        total = result.count if result.count is not None else len(rows) + (page_size if len(page) == page_size else 0)
+        if not page or len(rows) >= total:
+            return rows
+
+
+def _load_project_files(supabase, project_id):
+    """
+    Context files of a project in upload order, one per distinct content.
+
+    Each gets a 'text_id': the id of the row holding its text and chunks.
+    """
+    result = supabase.table('context_files').select('id, file_name, content_hash, source_file_id').eq(
+        'project_id', project_id).order('created_at').execute()
+    files, seen_hashes = [], set()
+    for f in (result.data or []):
+        f['text_id'] = f.get('source_file_id') or f['id']
+        if f.get('content_hash'):
+            if f['content_hash'] in seen_hashes:
+                continue
+            seen_hashes.add(f['content_hash'])
+        files.append(f)
+    return files
+
+
+def load_project_chunks(supabase, files):
+    """
+    Load chunk statistics (without content or terms) for the given files,
+    indexing files uploaded before the chunk index existed.
+
+    Chunks are looked up by each file's text_id, so a re-uploaded file uses
+    the chunks of the row it shares text with (possibly in another project).
+
+    Returns:
+        list: Chunk dicts with id, file_id (a text_id), chunk_index,
+        char_count, term_count and a document-order 'position'; chunks
+        indexed by this call also carry their terms and content
+    """
+    file_order = {f['text_id']: i for i, f in enumerate(files)}
+    chunks = select_all(lambda: supabase.table('context_chunks').select(
+        'id, file_id, chunk_index, char_count, term_count', count='exact').in_(
+        'file_id', list(file_order)).order('id'))
+
+    indexed = {c['file_id'] for c in chunks}
+    missing = [text_id for text_id in file_order if text_id not in indexed]
+    if missing:
+        text_result = supabase.table('context_files').select('id, project_id, extracted_text').in_('id', missing).execute()
+        for row in (text_result.data or []):
+            if row.get('extracted_text'):
+                chunks.extend(index_file(supabase, row['project_id'], row['id'], row['extracted_text']))
+
+    for chunk in chunks:
+        chunk['position'] = (file_order[chunk['file_id']], chunk['chunk_index'])
+    return chunks
+
+
+def load_chunk_terms(supabase, chunks):
+    """Attach the term frequencies BM25 needs to chunks loaded without them."""
+    unloaded = {c['id']: c for c in chunks if 'terms' not in c}
+    if unloaded:
+        file_ids = list({c['file_id'] for c in unloaded.values()})
+        rows = select_all(lambda: supabase.table('context_chunks').select('id, terms', count='exact').in_(
+            'file_id', file_ids).order('id'))
+        for row in rows:
+            if row['id'] in unloaded:
+                unloaded[row['id']]['terms'] = row['terms']
+    for chunk in chunks:
+        chunk.setdefault('terms', {})
+    return chunks
+
+
+def _assemble(picked, contents, file_names):
+    """Join picked chunks, introducing each file by name and marking gaps."""
+    parts, previous = [], None
+    for chunk in picked:
+        content = chunk.get('content') or contents.get(chunk['id'])
+        if not content:
+            continue
+        file_id, index = chunk['file_id'], chunk['chunk_index']
+        if previous is None or previous[0] != file_id:
+            if parts:
+                parts.append('\n\n')
+            parts.append(f"=== {file_names[file_id]} ===\n{content}")
+        elif previous[1] + 1 == index:
+            parts.append(f"\n\n{content}")
+        else:
+            parts.append(f"{CHUNK_SEPARATOR}{content}")
+        previous = (file_id, index)
+    return ''.join(parts)
+
+
+def retrieve_contexts(supabase, project_id, queries, max_tokens):
+    """
+    Build prompt context for several queries from one load of the index.
+
+    If the whole context fits max_tokens every query gets all of it, so
+    prompts that share it stay byte-identical (and prompt-cacheable).
+    Content is fetched once for the union of the picked chunks.
+
+    Args:
+        supabase: Supabase client
+        project_id: Project whose context files are searched
+        queries: Texts describing each task (questions, instructions, ...)
+        max_tokens: Token budget for each returned context
+
+    Returns:
+        list: One context string per query; selected chunks in document
+        order, each file introduced by its name
+    """
+    files = _load_project_files(supabase, project_id)
+    chunks = load_project_chunks(supabase, files) if files else []
+    if not chunks:
+        return [''] * len(queries)
+
+    if sum(_chunk_cost(chunk) for chunk in chunks) <= max_tokens:
+        everything = sorted(chunks, key=lambda chunk: chunk['position'])
+        selections = [everything] * len(queries)
+    else:
+        # Term frequencies are only loaded when chunks have to be ranked
+        load_chunk_terms(supabase, chunks)
+        selections = [select_chunks(chunks, bm25_scores(chunks, tokenize(query)), max_tokens) for query in queries]
+
+    # Chunks indexed during this call already carry their content
+    contents = {}
+    unloaded = list({c['id'] for picked in selections for c in picked if not c.get('content')})
+    if unloaded:
+        content_result = supabase.table('context_chunks').select('id, content').in_('id', unloaded).execute()
+        contents = {row['id']: row['content'] for row in (content_result.data or [])}
+
+    file_names = {f['text_id']: f.get('file_name', 'Unknown') for f in files}
+    return [_assemble(picked, contents, file_names) for picked in selections]
+
+
+def retrieve_context(supabase, project_id, query, max_tokens):
+    """Build prompt context from the project's chunks most relevant to query."""
+    return retrieve_contexts(supabase, project_id, [query], max_tokens)[0]
+
+
+def load_leading_context(supabase, project_id, max_tokens):
+    """The old behaviour: the concatenated files, truncated to the budget."""
+    result = supabase.table('context_files').select('extracted_text, source_file_id').eq(
+        'project_id', project_id).order('created_at').execute()
+    texts = [f['extracted_text'] for f in fill_shared_texts(supabase, result.data or []) if f.get('extracted_text')]
+    return '\n\n---\n\n'.join(texts)[:max_tokens * 4]
+
+
+def get_prompt_contexts(supabase, project_id, queries, max_tokens):
+    """get_prompt_context() for several queries, loading the index once."""
+    try:
+        return retrieve_contexts(supabase, project_id, queries, max_tokens)
+    except Exception as e:
+        print(f"Context retrieval failed, using leading text: {e}")
+        return [load_leading_context(supabase, project_id, max_tokens)] * len(queries)
+
+
+def get_prompt_context(supabase, project_id, query, max_tokens):
+    """
+    Context for a prompt: BM25-ranked chunks within max_tokens, falling back
+    to the leading text of the files if the index is unavailable.
+    """
+    try:
+        return retrieve_context(supabase, project_id, query, max_tokens)
+    except Exception as e:
+        print(f"Context retrieval failed, using leading text: {e}")
+        return load_leading_context(supabase, project_id, max_tokens)
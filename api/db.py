@@ -0,0 +1,121 @@
+"""
+Shared Supabase Data-Access Module for PM Clarity API
+
+Every serverless handler imports get_supabase() from here instead of
+building its own client. A single client is kept per process so warm
+function invocations reuse the same HTTP session (and its keep-alive
+connections to PostgREST and Storage) instead of paying client
+construction and a fresh TLS handshake on every request.
+"""
+
+import os
+import threading
+import time
+
+from supabase import create_client
+
+# Max rows per bulk upsert request (keeps PostgREST payloads reasonable)
+UPSERT_CHUNK_SIZE = 500
+
+# Process-wide client state (guarded by _client_lock)
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+# Pool statistics
+_stats = {
+    'clients_created': 0,
+    'client_requests': 0,
+    'client_reuses': 0,
+    'created_at': None,
+    'last_used_at': None
+}
+
+
+def _create_client():
+    url = os.environ.get('SUPABASE_URL')
+    key = os.environ.get('SUPABASE_KEY')
+    if not url or not key:
+        raise Exception("Supabase credentials not configured")
+    return create_client(url, key)
+
+
+def get_supabase():
+    """
+    Get the process-wide Supabase client, creating it on first use.
+
+    The client is rebuilt if the process has been forked since it was
+    created (e.g. inside a multiprocessing worker), because HTTP
+    connections must not be shared across processes.
+
+    Returns:
+        The shared supabase Client
+    """
+    global _client, _client_pid
+
+    pid = os.getpid()
+    with _client_lock:
+        _stats['client_requests'] += 1
+        _stats['last_used_at'] = time.time()
+
+        if _client is not None and _client_pid == pid:
+            _stats['client_reuses'] += 1
+            return _client
+
+        _client = _create_client()
+        _client_pid = pid
+        _stats['clients_created'] += 1
+        _stats['created_at'] = time.time()
+        return _client
+
+
+def get_pool_stats():
+    """
+    Get statistics about the shared client for this process.
+
+    Every serverless function is its own process, so these counters only
+    describe the process that calls this; the worker logs them per job.
+
+    Returns:
+        dict: Creation/reuse counters, reuse ratio and client age in seconds
+    """
+    with _client_lock:
+        stats = dict(_stats)
+        has_client = _client is not None and _client_pid == os.getpid()
+
+    requests = stats['client_requests']
+    stats['reuse_ratio'] = round(stats['client_reuses'] / requests, 3) if requests > 0 else 0
+    stats['client_age_seconds'] = round(time.time() - stats['created_at'], 1) if stats['created_at'] else None
+    stats['has_client'] = has_client
+    stats['pid'] = os.getpid()
+    return stats
+
+
+def bulk_upsert(supabase, table, rows, on_conflict, chunk_size=UPSERT_CHUNK_SIZE):
+    """
+    Insert-or-update many rows with one request per chunk.
+
+    Rows sharing the same conflict key are collapsed (last one wins), since
+    Postgres rejects a single upsert that touches the same row twice.
+
+    Args:
+        supabase: Supabase client
+        table: Table name
+        rows: List of row dicts (all with the same keys)
+        on_conflict: Comma-separated unique columns, e.g. 'project_id,question_id'
+        chunk_size: Max rows per request
+
+    Returns:
+        list: The saved rows as returned by PostgREST
+    """
+    key_columns = [c.strip() for c in on_conflict.split(',')]
+    unique_rows = {}
+    for row in rows:
+        unique_rows[tuple(row.get(c) for c in key_columns)] = row
+    rows = list(unique_rows.values())
+
+    saved = []
+    for i in range(0, len(rows), chunk_size):
+        result = supabase.table(table).upsert(rows[i:i + chunk_size], on_conflict=on_conflict).execute()
+        saved.extend(result.data or [])
+    return saved
@@ -0,0 +1,200 @@
+"""
+Entity Extraction for PM Clarity API
+
+Finds dates, percentages, monetary values and technical terms in context
+text. Patterns are compiled once at import and scanned lazily (one scan
+covers every digit-led entity). Once ENTITY_MAX_MATCHES matches of an entity
+type have been accepted, further matches of that type are ignored, and a
+scan stops when all of its types are full, so large corpora are never
+materialised as match lists.
+
+Text can be passed as one string or as an iterable of chunks (e.g. one per
+file); offsets are reported as if the chunks were joined with newlines.
+
+Result shape (the lists are what the frontend renders):
+    {
+        'dates': [...], 'percentages': [...], 'monetary': [...], 'technical_terms': [...],
+        'counts': {kind: {value: occurrences}},
+        'first_seen': {kind: {value: character offset}},
+        'truncated': [kinds that hit ENTITY_MAX_MATCHES]
+    }
+"""
+
+import re
+
+ENTITY_KINDS = ('dates', 'percentages', 'monetary', 'technical_terms')
+
+# Max values reported per entity type
+ENTITY_LIMITS = {
+    'dates': 10,
+    'percentages': 10,
+    'monetary': 10,
+    'technical_terms': 15
+}
+
+# Scan caps: matches accepted per type, distinct values tracked per type
+ENTITY_MAX_MATCHES = 2000
+ENTITY_MAX_TRACKED = 200
+
+MONTHS = ('January', 'February', 'March', 'April', 'May', 'June', 'July', 'August', 'September',
+          'October', 'November', 'December')
+# Title, upper and lower case spellings: a case-sensitive alternation is
+# searched several times faster than one under re.IGNORECASE
+MONTH_NAMES = '|'.join(MONTHS + tuple(m.upper() for m in MONTHS) + tuple(m.lower() for m in MONTHS))
+
+
+def _word_start(text, match):
+    """Require a word boundary before the match.
+
+    Used instead of a leading \\b, which stops the regex engine from using
+    its fast search for the pattern's first character.
+    """
+    start = match.start()
+    if start and (text[start - 1].isalnum() or text[start - 1] == '_'):
+        return None
+    return start
+
+
+# Every entity that starts with a digit is found by one scan; the named
+# group says which kind matched
+NUMERIC_PATTERN = re.compile(
+    r'(?P<dates>\d{1,2}[/-]\d{1,2}[/-]\d{2,4}\b|\d{4}[/-]\d{1,2}[/-]\d{1,2}\b)'
+    r'|(?P<percentages>\d+(?:\.\d+)?%)'
+)
+
+# (pattern, entity kind or None to use the matched group name)
+ENTITY_SCANS = [
+    (NUMERIC_PATTERN, None),
+    (re.compile(r'[QH][1-4]\s*\d{4}\b', re.IGNORECASE), 'dates'),
+    (re.compile(r'(?:' + MONTH_NAMES + r')\s+\d{1,2},?\s+\d{4}\b'), 'dates'),
+    (re.compile(r'\$[\d,]+(?:\.\d{2})?(?:\s*(?:million|billion|M|B|K))?\b', re.IGNORECASE), 'monetary'),
+    (re.compile(r'[A-Z]{2,}(?:\s+[A-Z]{2,})*\b'), 'acronyms'),
+    (re.compile(r'(?:API|SDK|REST|GraphQL|OAuth|JWT|SSL|HTTP|HTTPS)\b'), 'technical_terms')
+]
+
+# Matched kind -> (reported entity type, start check); a start check returns
+# where the entity really starts, or None to reject the match
+ENTITY_GROUPS = {
+    'dates': ('dates', _word_start),
+    'percentages': ('percentages', _word_start),
+    'monetary': ('monetary', None),
+    'acronyms': ('technical_terms', _word_start),
+    'technical_terms': ('technical_terms', _word_start)
+}
+
+# Entity types each scan can report
+SCAN_TYPES = {
+    pattern: frozenset(ENTITY_GROUPS[name][0] for name in (pattern.groupindex or {scan_kind: None}))
+    for pattern, scan_kind in ENTITY_SCANS
+}
+
+
+def _iter_chunks(text):
+    if isinstance(text, str):
+        yield text
+    else:
+        for chunk in text:
+            if chunk:
+                yield chunk
+
+
+def extract_entities(text):
+    """
+    Extract key entities from text.
+
+    Args:
+        text: A string, or an iterable of strings scanned one after another
+
+    Returns:
+        dict: Values per entity type in first-seen order, plus their
+        occurrence counts and first-seen offsets
+    """
+    found = {kind: {} for kind in ENTITY_KINDS}
+    accepted = {kind: 0 for kind in ENTITY_KINDS}
+    truncated = set()
+
+    base = 0
+    for chunk in _iter_chunks(text):
+        # The same span can be found by several scans (e.g. 'API'); count it once
+        seen_spans = set()
+        for pattern, scan_kind in ENTITY_SCANS:
+            scan_types = SCAN_TYPES[pattern]
+            if scan_types <= truncated:
+                continue
+            pos = 0
+            while True:
+                match = pattern.search(chunk, pos)
+                if match is None:
+                    break
+
+                kind, start_check = ENTITY_GROUPS[scan_kind or match.lastgroup]
+                start = start_check(chunk, match) if start_check else match.start()
+                if start is None:
+                    # Rejected: retry from the next character, as a leading \b would
+                    pos = match.start() + 1
+                    continue
+                pos = match.end()
+
+                span = (kind, start, match.end())
+                if kind in truncated or span in seen_spans:
+                    continue
+                seen_spans.add(span)
+                accepted[kind] += 1
+                if accepted[kind] > ENTITY_MAX_MATCHES:
+                    truncated.add(kind)
+                    if scan_types <= truncated:
+                        break
+                    continue
+                value = chunk[start:match.end()]
+                values = found[kind]
+                entry = values.get(value)
+                if entry is not None:
+                    entry[0] += 1
+                elif len(values) < ENTITY_MAX_TRACKED:
+                    values[value] = [1, base + start]
+        base += len(chunk) + 1
+
+    entities = {'counts': {}, 'first_seen': {}, 'truncated': sorted(truncated)}
+    for kind in ENTITY_KINDS:
+        ordered = sorted(found[kind].items(), key=lambda item: item[1][1])[:ENTITY_LIMITS[kind]]
+        entities[kind] = [value for value, _ in ordered]
+        entities['counts'][kind] = {value: entry[0] for value, entry in ordered}
+        entities['first_seen'][kind] = {value: entry[1] for value, entry in ordered}
+    return entities
+
+
+def merge_entities(entity_sets, offsets=None):
+    """
+    Merge entity results from several texts (e.g. stored per-file analyses).
+
+    Args:
+        entity_sets: extract_entities() results, in text order
+        offsets: Optional start offset of each text within the combined text
+
+    Returns:
+        dict: Same shape as extract_entities(), capped at ENTITY_LIMITS
+    """
+    counts = {kind: {} for kind in ENTITY_KINDS}
+    first_seen = {kind: {} for kind in ENTITY_KINDS}
+    truncated = set()
+
+    for index, entities in enumerate(entity_sets):
+        if not entities:
+            continue
+        base = offsets[index] if offsets else 0
+        truncated.update(entities.get('truncated', []))
+        for kind in ENTITY_KINDS:
+            entity_counts = entities.get('counts', {}).get(kind, {})
+            entity_offsets = entities.get('first_seen', {}).get(kind, {})
+            for value in entities.get(kind, []):
+                counts[kind][value] = counts[kind].get(value, 0) + entity_counts.get(value, 1)
+                if value not in first_seen[kind]:
+                    first_seen[kind][value] = base + entity_offsets.get(value, 0)
+
+    merged = {'counts': {}, 'first_seen': {}, 'truncated': sorted(truncated)}
+    for kind in ENTITY_KINDS:
+        ordered = sorted(first_seen[kind], key=first_seen[kind].get)[:ENTITY_LIMITS[kind]]
+        merged[kind] = ordered
+        merged['counts'][kind] = {value: counts[kind][value] for value in ordered}
+        merged['first_seen'][kind] = {value: first_seen[kind][value] for value in ordered}
+    return merged
@@ -0,0 +1,473 @@
+"""
+Context File Text Extraction for PM Clarity API
+
+Extractors for every supported upload type, plus extract_files(), which
+runs extraction for many files on a process pool sized to the available
+cores. PDF/DOCX/XLSX parsing is CPU-bound pure Python, so threads would not
+help; separate processes let a multi-file upload use every core.
+
+Configuration (environment variables):
+    EXTRACTION_WORKERS      Max worker processes (default: available cores)
+    EXTRACTION_TIMEOUT      Per-file extraction timeout in seconds (default 120)
+    PDF_MAX_PAGES           Max pages extracted per PDF (default 0, no cap)
+    PDF_PAGE_STRATEGY       head | sample: which pages to keep when capped
+    PDF_PAGE_WORKERS        Max processes for page-parallel PDF extraction
+    XLSX_MAX_ROWS           Max non-empty rows extracted per sheet (default 5000)
+    XLSX_MAX_COLUMNS        Max columns extracted per row (default 50)
+"""
+
+import email
+import io
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from email import policy
+
+# File processing libraries
+try:
+    from PyPDF2 import PdfReader
+except ImportError:
+    PdfReader = None
+
+try:
+    from docx import Document
+except ImportError:
+    Document = None
+
+try:
+    import openpyxl
+except ImportError:
+    openpyxl = None
+
+
+# Worker processes are spawned, not forked: a fork of the threaded HTTP
+# server would copy locks held by other request threads (and the shared
+# HTTP clients) into children that can never release them
+_mp = multiprocessing.get_context('spawn')
+
+
+def _available_cores():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+EXTRACTION_WORKERS = int(os.environ.get('EXTRACTION_WORKERS', str(_available_cores())))
+EXTRACTION_TIMEOUT = int(os.environ.get('EXTRACTION_TIMEOUT', '120'))
+
+# PDF page extraction
+PDF_MAX_PAGES = int(os.environ.get('PDF_MAX_PAGES', '0'))
+PDF_PAGE_STRATEGY = os.environ.get('PDF_PAGE_STRATEGY', 'head')
+PDF_PAGE_WORKERS = int(os.environ.get('PDF_PAGE_WORKERS', str(_available_cores())))
+PDF_PARALLEL_MIN_PAGES = 40
+PDF_PAGES_PER_RANGE = 5
+
+# XLSX caps per sheet
+XLSX_MAX_ROWS = int(os.environ.get('XLSX_MAX_ROWS', '5000'))
+XLSX_MAX_COLUMNS = int(os.environ.get('XLSX_MAX_COLUMNS', '50'))
+
+
+def get_file_extension(filename):
+    return filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+
+
+def extract_text_plain(file_data):
+    try:
+        return file_data.decode('utf-8')
+    except UnicodeDecodeError:
+        return file_data.decode('latin-1')
+
+
+def select_pdf_pages(page_count, max_pages=PDF_MAX_PAGES, strategy=PDF_PAGE_STRATEGY):
+    """
+    Choose which pages to extract from a PDF.
+
+    Args:
+        page_count: Total pages in the document
+        max_pages: Page cap (0 for no cap)
+        strategy: 'head' keeps the first max_pages pages; 'sample' spreads
+            them evenly across the document, always keeping the first and last
+
+    Returns:
+        list: Sorted zero-based page numbers
+    """
+    if not max_pages or page_count <= max_pages:
+        return list(range(page_count))
+    if strategy == 'sample' and max_pages > 1:
+        step = (page_count - 1) / (max_pages - 1)
+        return sorted({round(i * step) for i in range(max_pages)})
+    return list(range(max_pages))
+
+
+def _extract_pdf_pages(reader, page_numbers):
+    """Extract a run of pages, returning their joined text and per-page timings."""
+    out = io.StringIO()
+    timings = []
+    for page_number in page_numbers:
+        started = time.perf_counter()
+        text = reader.pages[page_number].extract_text()
+        timings.append({
+            'page': page_number + 1,
+            'seconds': round(time.perf_counter() - started, 4),
+            'chars': len(text or '')
+        })
+        if text:
+            if out.tell():
+                out.write('\n\n')
+            out.write(text)
+    return out.getvalue(), timings
+
+
+# Per-process reader for page workers (set by the pool initializer)
+_worker_pdf_reader = None
+
+
+def _init_pdf_worker(file_data):
+    global _worker_pdf_reader
+    _worker_pdf_reader = PdfReader(io.BytesIO(file_data))
+
+
+def _extract_pdf_range(page_numbers):
+    return _extract_pdf_pages(_worker_pdf_reader, page_numbers)
+
+
+def _can_fork_workers():
+    # Pool workers are daemonic and may not start their own children
+    return not multiprocessing.current_process().daemon
+
+
+def extract_pdf(file_data, stats=None):
+    """
+    Extract PDF text, splitting large documents into page ranges across processes.
+
+    Page text is written into the result as each range completes (in page
+    order), so individual page strings are not all held at once. Inside an
+    extract_files() worker the pages are read sequentially, since those
+    workers already use every core.
+
+    Args:
+        file_data: PDF bytes
+        stats: Optional dict to fill with page counts and per-page timings
+    """
+    if PdfReader is None:
+        return "PDF extraction not available"
+    reader = PdfReader(io.BytesIO(file_data))
+    page_count = len(reader.pages)
+    page_numbers = select_pdf_pages(page_count)
+
+    workers = min(PDF_PAGE_WORKERS, len(page_numbers) // PDF_PAGES_PER_RANGE)
+    out = io.StringIO()
+    timings = []
+    used_workers = 1
+
+    if workers > 1 and len(page_numbers) >= PDF_PARALLEL_MIN_PAGES and _can_fork_workers():
+        # Several ranges per worker keeps them busy when some pages are slower
+        range_count = workers * 4
+        size = -(-len(page_numbers) // range_count)
+        ranges = [page_numbers[i:i + size] for i in range(0, len(page_numbers), size)]
+        try:
+            pool = _mp.Pool(processes=workers, initializer=_init_pdf_worker, initargs=(file_data,))
+        except (OSError, ImportError) as e:
+            print(f"PDF page pool unavailable ({e}), extracting sequentially")
+            pool = None
+        if pool is not None:
+            try:
+                for text, range_timings in pool.imap(_extract_pdf_range, ranges):
+                    if text:
+                        if out.tell():
+                            out.write('\n\n')
+                        out.write(text)
+                    timings.extend(range_timings)
+            finally:
+                pool.terminate()
+                pool.join()
+            used_workers = workers
+
+    if used_workers == 1:
+        text, timings = _extract_pdf_pages(reader, page_numbers)
+        out.write(text)
+
+    if len(page_numbers) < page_count:
+        out.write(f"\n\n[Extracted {len(page_numbers)} of {page_count} pages]")
+
+    if stats is not None:
+        stats.update({
+            'pages_total': page_count,
+            'pages_extracted': len(page_numbers),
+            'page_strategy': PDF_PAGE_STRATEGY if len(page_numbers) < page_count else 'all',
+            'workers': used_workers,
+            'page_timings': timings
+        })
+    return out.getvalue()
+
+
+def extract_docx(file_data):
+    if Document is None:
+        return "DOCX extraction not available"
+    docx_file = io.BytesIO(file_data)
+    doc = Document(docx_file)
+    text_parts = []
+    for para in doc.paragraphs:
+        if para.text.strip():
+            text_parts.append(para.text)
+    for table in doc.tables:
+        for row in table.rows:
+            row_text = [cell.text for cell in row.cells if cell.text.strip()]
+            if row_text:
+                text_parts.append(' | '.join(row_text))
+    return '\n'.join(text_parts)
+
+
+def extract_xlsx(file_data, stats=None):
+    """
+    Extract spreadsheet text with openpyxl's streaming read-only mode.
+
+    Rows are read as plain values and written out one at a time, so memory
+    stays bounded regardless of workbook size. Each sheet is capped at
+    XLSX_MAX_ROWS rows and XLSX_MAX_COLUMNS columns; a capped sheet ends with
+    a summary line (row/column counts and its header row).
+
+    Args:
+        file_data: XLSX bytes
+        stats: Optional dict to fill with per-sheet summaries
+    """
+    if openpyxl is None:
+        return "XLSX extraction not available"
+    workbook = openpyxl.load_workbook(io.BytesIO(file_data), read_only=True, data_only=True)
+    out = io.StringIO()
+    sheets = []
+    try:
+        for sheet in workbook.worksheets:
+            if out.tell():
+                out.write('\n')
+            out.write(f"=== Sheet: {sheet.title} ===")
+
+            # Dimensions come from the sheet's metadata and may be missing
+            total_rows = sheet.max_row
+            total_columns = sheet.max_column
+            header = None
+            rows_written = 0
+            rows_truncated = False
+            columns_truncated = bool(total_columns and total_columns > XLSX_MAX_COLUMNS)
+            for row in sheet.iter_rows(values_only=True):
+                if not columns_truncated and len(row) > XLSX_MAX_COLUMNS:
+                    columns_truncated = any(value is not None for value in row[XLSX_MAX_COLUMNS:])
+                row_values = [str(value) for value in row[:XLSX_MAX_COLUMNS] if value is not None]
+                if not row_values:
+                    continue
+                if rows_written >= XLSX_MAX_ROWS:
+                    rows_truncated = True
+                    break
+                if header is None:
+                    header = row_values
+                out.write('\n' + ' | '.join(row_values))
+                rows_written += 1
+
+            summary = {
+                'name': sheet.title,
+                'rows_extracted': rows_written,
+                'total_rows': total_rows,
+                'total_columns': total_columns,
+                'rows_truncated': rows_truncated,
+                'columns_truncated': columns_truncated,
+                'header': header
+            }
+            sheets.append(summary)
+
+            if rows_truncated or columns_truncated:
+                if rows_truncated:
+                    row_note = f"first {rows_written} of {total_rows} rows" if total_rows else f"first {rows_written} rows"
+                else:
+                    row_note = f"{rows_written} rows"
+                if columns_truncated:
+                    column_note = f", first {XLSX_MAX_COLUMNS} of {total_columns} columns" if total_columns else f", first {XLSX_MAX_COLUMNS} columns"
+                else:
+                    column_note = ''
+                header_note = f"; header: {' | '.join(header)}" if header else ''
+                out.write(f"\n[Sheet truncated: {row_note}{column_note}{header_note}]")
+    finally:
+        workbook.close()
+
+    if stats is not None:
+        stats['sheets'] = sheets
+    return out.getvalue()
+
+
+def extract_email(file_data):
+    msg = email.message_from_bytes(file_data, policy=policy.default)
+    text_parts = [
+        f"From: {msg.get('From', 'N/A')}",
+        f"To: {msg.get('To', 'N/A')}",
+        f"Subject: {msg.get('Subject', 'N/A')}",
+        f"Date: {msg.get('Date', 'N/A')}",
+        ""
+    ]
+    if msg.is_multipart():
+        for part in msg.walk():
+            if part.get_content_type() == 'text/plain':
+                payload = part.get_payload(decode=True)
+                if payload:
+                    try:
+                        text_parts.append(payload.decode('utf-8'))
+                    except UnicodeDecodeError:
+                        text_parts.append(payload.decode('latin-1'))
+    else:
+        payload = msg.get_payload(decode=True)
+        if payload:
+            try:
+                text_parts.append(payload.decode('utf-8'))
+            except UnicodeDecodeError:
+                text_parts.append(payload.decode('latin-1'))
+    return '\n'.join(text_parts)
+
+
+def extract_text_with_stats(file_data, filename):
+    """
+    Extract text from an uploaded file and report how the extraction went.
+
+    Returns:
+        tuple: (text, stats) where stats holds 'seconds' plus extractor-specific
+        details (page counts and per-page timings for PDFs)
+    """
+    ext = get_file_extension(filename)
+    extractors = {
+        'txt': extract_text_plain, 'md': extract_text_plain, 'csv': extract_text_plain,
+        'pdf': extract_pdf, 'docx': extract_docx, 'xlsx': extract_xlsx, 'eml': extract_email
+    }
+    extractor = extractors.get(ext)
+    if not extractor:
+        return f"Unsupported file type: {ext}", {}
+
+    stats = {}
+    started = time.perf_counter()
+    try:
+        text = extractor(file_data, stats) if extractor in (extract_pdf, extract_xlsx) else extractor(file_data)
+    except Exception as e:
+        return f"Error extracting text: {str(e)}", {}
+    stats['seconds'] = round(time.perf_counter() - started, 3)
+    return text, stats
+
+
+def extract_text(file_data, filename):
+    return extract_text_with_stats(file_data, filename)[0]
+
+
+def summarize_extraction_stats(stats, slowest=3):
+    """Condense extraction stats for API responses (drops the full page timing list)."""
+    if not stats:
+        return {}
+    summary = {k: v for k, v in stats.items() if k != 'page_timings'}
+    if stats.get('page_timings'):
+        summary['slowest_pages'] = sorted(stats['page_timings'], key=lambda t: t['seconds'], reverse=True)[:slowest]
+    return summary
+
+
+def _read_spool(file_obj):
+    file_obj.seek(0)
+    data = file_obj.read()
+    file_obj.seek(0)
+    return data
+
+
+def _extract_with_timeout(file_data, filename, timeout):
+    """
+    Extract one file on a thread, giving up after timeout seconds.
+
+    A thread cannot be stopped, so an extractor stuck past its timeout runs
+    on in the background until it returns; only the caller stops waiting.
+    """
+    result = []
+    thread = threading.Thread(target=lambda: result.append(extract_text_with_stats(file_data, filename)), daemon=True)
+    thread.start()
+    thread.join(timeout)
+    if not result:
+        return (f"Error extracting text: timed out after {timeout}s", {})
+    return result[0]
+
+
+def _extract_serially(files, timeout):
+    return [_extract_with_timeout(_read_spool(f['file']), f['filename'], timeout) for f in files]
+
+
+def extract_files(files, timeout=EXTRACTION_TIMEOUT, max_workers=EXTRACTION_WORKERS):
+    """
+    Extract text from many uploaded files in parallel.
+
+    Files are fed to a process pool one per free worker, so each file's
+    timeout starts when it is actually dispatched and only the in-flight
+    files' bytes are held in memory. A worker stuck past its timeout is
+    written off; the pool is replaced if every worker is stuck. A single
+    file, or every file where process pools are unavailable (e.g. no
+    /dev/shm for semaphores), is extracted in this process, with the same
+    per-file timeout.
+
+    Args:
+        files: List of {'filename', 'file'} dicts (file is a readable spool)
+        timeout: Per-file timeout in seconds
+        max_workers: Max worker processes
+
+    Returns:
+        list: (text, stats) per file, in input order; failures have
+        "Error extracting text: ..." text, as from extract_text()
+    """
+    workers = min(max_workers, len(files))
+    if workers <= 1:
+        return _extract_serially(files, timeout)
+
+    try:
+        pool = _mp.Pool(processes=workers)
+    except (OSError, ImportError) as e:
+        print(f"Extraction pool unavailable ({e}), extracting serially")
+        return _extract_serially(files, timeout)
+
+    results = [None] * len(files)
+    done = queue.Queue()
+    pending = {}
+    timed_out = set()
+    next_index = 0
+
+    try:
+        while next_index < len(files) or pending:
+            while next_index < len(files) and len(pending) + len(timed_out) < workers:
+                index = next_index
+                file_info = files[index]
+                pool.apply_async(
+                    extract_text_with_stats, (_read_spool(file_info['file']), file_info['filename']),
+                    callback=lambda result, index=index: done.put((index, result)),
+                    error_callback=lambda e, index=index: done.put((index, (f"Error extracting text: {e}", {})))
+                )
+                pending[index] = time.monotonic() + timeout
+                next_index += 1
+
+            if not pending:
+                # Every worker is stuck on a timed-out file; start over with a fresh pool
+                pool.terminate()
+                pool = _mp.Pool(processes=workers)
+                timed_out.clear()
+                continue
+
+            try:
+                index, result = done.get(timeout=max(0, min(pending.values()) - time.monotonic()))
+            except queue.Empty:
+                now = time.monotonic()
+                for index, deadline in list(pending.items()):
+                    if deadline <= now:
+                        del pending[index]
+                        timed_out.add(index)
+                        results[index] = (f"Error extracting text: timed out after {timeout}s", {})
+                continue
+
+            if index in pending:
+                del pending[index]
+                results[index] = result
+            else:
+                # A timed-out file finished late; its worker is free again
+                timed_out.discard(index)
+    finally:
+        pool.terminate()
+        pool.join()
+
+    return results
@@ -1,21 +1,15 @@
 from http.server import BaseHTTPRequestHandler
 import json
-import os
 import uuid
-from supabase import create_client
+from analytics_cache import bump_generation
+from context_index import get_prompt_context
+from db import get_supabase
+from llm import complete
 
-try:
-    import anthropic
-except ImportError:
-    anthropic = None
-
-
-def get_supabase():
-    url = os.environ.get('SUPABASE_URL')
-    key = os.environ.get('SUPABASE_KEY')
-    if not url or not key:
-        raise Exception("Supabase credentials not configured")
-    return create_client(url, key)
+# Context budget for feature extraction, and the query its chunks are ranked by
+FEATURE_CONTEXT_TOKENS = 7500
+FEATURE_QUERY = ('feature functionality capability user need want problem workflow integration '
+                 'technical requirement experience support platform product')
 
 
 def cors_headers():
@@ -52,19 +46,10 @@ def parse_path(path):
 
 def extract_features_with_claude(context_text):
     """Use Claude to extract features from context"""
-    if anthropic is None:
-        raise Exception("Anthropic library not available")
-
-    api_key = os.environ.get('ANTHROPIC_API_KEY')
-    if not api_key:
-        raise Exception("Anthropic API key not configured")
-
-    client = anthropic.Anthropic(api_key=api_key)
-
     prompt = f"""Analyze the following product context and extract a list of potential features for the product.
 
 CONTEXT:
-{context_text[:30000]}
+{context_text[:FEATURE_CONTEXT_TOKENS * 4]}
 
 For each feature, provide:
 1. A concise name (3-7 words)
@@ -87,13 +72,7 @@ Respond in JSON format with an array of objects:
 
 Respond ONLY with the JSON array, no additional text."""
 
-    message = client.messages.create(
-        model="claude-sonnet-4-20250514",
-        max_tokens=4096,
-        messages=[{"role": "user", "content": prompt}]
-    )
-
-    response_text = message.content[0].text.strip()
+    response_text = complete(prompt, max_tokens=4096, cache=True).strip()
 
     try:
         if response_text.startswith('['):
@@ -108,6 +87,59 @@ Respond ONLY with the JSON array, no additional text."""
     return []
 
 
+def save_extracted_features(supabase, project_id, extracted_features, id_namespace=None):
+    """Save AI-extracted features (selected by default) and return the saved rows.
+
+    With id_namespace the row ids are derived from it, so saving the same
+    extraction again (a retried job) updates the rows instead of duplicating them.
+    """
+    saved_features = []
+    for i, feature in enumerate(extracted_features):
+        feature_id = str(uuid.uuid5(id_namespace, str(i)) if id_namespace else uuid.uuid4())
+        feature_data = {
+            'id': feature_id,
+            'project_id': project_id,
+            'name': feature.get('name', 'Unnamed Feature'),
+            'description': feature.get('description', ''),
+            'is_selected': True,
+            'is_ai_generated': True,
+            'display_order': i
+        }
+        result = supabase.table('features').upsert(feature_data, on_conflict='id').execute()
+        if result.data:
+            saved_features.append(result.data[0])
+    if saved_features:
+        bump_generation(supabase, project_id)
+    return saved_features
+
+
+def run_extract_features_job(supabase, job):
+    """
+    Job runner for 'extract_features' (see jobs.py and worker.py).
+
+    The extracted list is checkpointed before it is saved, so a retry after
+    a failed save does not call the model again.
+    """
+    extracted_features = job.checkpoint.get('features')
+    if extracted_features is None:
+        context = get_prompt_context(supabase, job.project_id, FEATURE_QUERY, FEATURE_CONTEXT_TOKENS)
+        if not context.strip():
+            raise Exception('No context available. Please upload context files first.')
+
+        job.report(completed=0, total=2, message='Extracting features')
+        extracted_features = extract_features_with_claude(context)
+        if not extracted_features:
+            raise Exception('AI could not extract features from the context')
+        job.save_checkpoint({'features': extracted_features}, completed=1, message='Saving features')
+
+    saved_features = save_extracted_features(supabase, job.project_id, extracted_features, uuid.UUID(job.id))
+    return {
+        'message': f'Extracted {len(saved_features)} features',
+        'features': saved_features,
+        'count': len(saved_features)
+    }
+
+
 class handler(BaseHTTPRequestHandler):
     def send_cors_headers(self):
         for key, value in cors_headers().items():
@@ -164,10 +196,8 @@ class handler(BaseHTTPRequestHandler):
                     self.send_json(400, {'error': 'Invalid project ID format'})
                     return
 
-                # Get aggregated context
-                context_result = supabase.table('context_files').select('extracted_text').eq('project_id', project_id).execute()
-                context_texts = [f.get('extracted_text', '') for f in (context_result.data or []) if f.get('extracted_text')]
-                context = '\n\n---\n\n'.join(context_texts)
+                # Get the context chunks most relevant to feature extraction
+                context = get_prompt_context(supabase, project_id, FEATURE_QUERY, FEATURE_CONTEXT_TOKENS)
 
                 if not context.strip():
                     self.send_json(400, {'error': 'No context available. Please upload context files first.'})
@@ -185,21 +215,7 @@ class handler(BaseHTTPRequestHandler):
                     return
 
                 # Save features to database
-                saved_features = []
-                for i, feature in enumerate(extracted_features):
-                    feature_id = str(uuid.uuid4())
-                    feature_data = {
-                        'id': feature_id,
-                        'project_id': project_id,
-                        'name': feature.get('name', 'Unnamed Feature'),
-                        'description': feature.get('description', ''),
-                        'is_selected': True,
-                        'is_ai_generated': True,
-                        'display_order': i
-                    }
-                    result = supabase.table('features').insert(feature_data).execute()
-                    if result.data:
-                        saved_features.append(result.data[0])
+                saved_features = save_extracted_features(supabase, project_id, extracted_features)
 
                 self.send_json(200, {
                     'message': f'Extracted {len(saved_features)} features',
@@ -235,6 +251,7 @@ class handler(BaseHTTPRequestHandler):
 
                 result = supabase.table('features').insert(feature_data).execute()
                 if result.data:
+                    bump_generation(supabase, project_id)
                     self.send_json(201, result.data[0])
                 else:
                     self.send_json(500, {'error': 'Failed to create feature'})
@@ -296,6 +313,7 @@ class handler(BaseHTTPRequestHandler):
 
                 result = supabase.table('features').update({'is_selected': is_selected}).eq('id', feature_id).execute()
                 if result.data:
+                    bump_generation(supabase, result.data[0].get('project_id'))
                     self.send_json(200, result.data[0])
                 else:
                     self.send_json(404, {'error': 'Feature not found'})
@@ -318,6 +336,8 @@ class handler(BaseHTTPRequestHandler):
                     return
 
                 result = supabase.table('features').delete().eq('id', feature_id).execute()
+                if result.data:
+                    bump_generation(supabase, result.data[0].get('project_id'))
                 self.send_json(200, {'message': 'Feature deleted'})
 
             else:
@@ -1,21 +1,9 @@
 from http.server import BaseHTTPRequestHandler
 import json
-import os
 import uuid
-from supabase import create_client
-
-try:
-    import anthropic
-except ImportError:
-    anthropic = None
-
-
-def get_supabase():
-    url = os.environ.get('SUPABASE_URL')
-    key = os.environ.get('SUPABASE_KEY')
-    if not url or not key:
-        raise Exception("Supabase credentials not configured")
-    return create_client(url, key)
+from analytics_cache import bump_generation
+from db import get_supabase
+from llm import complete, is_llm_available
 
 
 def cors_headers():
@@ -106,11 +94,7 @@ def analyze_feedback_patterns(feedback_data):
 
 def generate_improvement_suggestions(prd_content, feedback_data, context=''):
     """Use AI to generate specific improvement suggestions"""
-    if anthropic is None:
-        return None
-
-    api_key = os.environ.get('ANTHROPIC_API_KEY')
-    if not api_key:
+    if not is_llm_available():
         return None
 
     # Compile feedback summary
@@ -122,8 +106,6 @@ def generate_improvement_suggestions(prd_content, feedback_data, context=''):
     feedback_text = '\n'.join(feedback_summary) if feedback_summary else 'No specific feedback provided'
 
     try:
-        client = anthropic.Anthropic(api_key=api_key)
-
         prompt = f"""Analyze this PRD and the user feedback to provide specific improvement suggestions.
 
 PRD Content (first 8000 chars):
@@ -140,13 +122,7 @@ Based on the feedback, provide a JSON response with:
 
 Respond ONLY with valid JSON, no other text."""
 
-        message = client.messages.create(
-            model="claude-sonnet-4-20250514",
-            max_tokens=1500,
-            messages=[{"role": "user", "content": prompt}]
-        )
-
-        response_text = message.content[0].text.strip()
+        response_text = complete(prompt, max_tokens=1500).strip()
         if response_text.startswith('{'):
             return json.loads(response_text)
         # Try to extract JSON from markdown code block
@@ -160,6 +136,97 @@ Respond ONLY with valid JSON, no other text."""
     return None
 
 
+def summarize_feedback(feedback_data):
+    """One line per feedback entry that has text"""
+    return [f"- {fb.get('section_name', 'General')}: {fb['feedback_text']}" for fb in feedback_data if fb.get('feedback_text')]
+
+
+def build_improvement_prompt(prd_content, feedback_summary):
+    return f"""Improve this PRD based on the user feedback provided.
+
+Current PRD:
+{prd_content}
+
+User Feedback:
+{chr(10).join(feedback_summary)}
+
+Instructions:
+1. Address each piece of feedback
+2. Maintain the overall structure and formatting
+3. Make the content clearer and more actionable
+4. Keep the improved PRD comprehensive but concise
+
+Return the improved PRD in markdown format. Return ONLY the improved PRD content, no explanations."""
+
+
+def apply_prd_improvement(supabase, project_id, prd, improved_content, snapshot_id=None):
+    """
+    Snapshot the PRD as it is, then save the improved content as its next
+    version; returns the snapshot id.
+
+    The snapshot is written first so a failure never leaves an improved PRD
+    without its previous version. Passing a fixed snapshot_id (as the job
+    runner does) makes a retry overwrite the same snapshot.
+    """
+    version = prd.get('version') or 1
+    snapshot_id = snapshot_id or str(uuid.uuid4())
+    supabase.table('prd_edit_snapshots').upsert({
+        'id': snapshot_id,
+        'prd_id': prd['id'],
+        'project_id': project_id,
+        'snapshot_content': prd.get('content_md') or '',
+        'version_name': f"Before AI improvement v{version}",
+        'change_summary': 'Auto-saved before AI improvement'
+    }, on_conflict='id').execute()
+
+    supabase.table('generated_prds').update({
+        'content_md': improved_content,
+        'version': version + 1
+    }).eq('id', prd['id']).execute()
+    bump_generation(supabase, project_id)
+    return snapshot_id
+
+
+def run_improve_prd_job(supabase, job):
+    """
+    Job runner for 'improve_prd' (see jobs.py and worker.py).
+
+    The improved content is checkpointed before it is applied and the
+    snapshot id after, so a retry neither calls the model again nor
+    applies the improvement twice.
+    """
+    checkpoint = dict(job.checkpoint)
+    if not checkpoint.get('snapshot_id'):
+        if checkpoint.get('improved_content') is None:
+            prd_result = supabase.table('generated_prds').select('id, version, content_md').eq('project_id', job.project_id).execute()
+            if not prd_result.data:
+                raise Exception('PRD not found')
+            feedback_result = supabase.table('prd_feedback').select('*').eq('project_id', job.project_id).order('created_at', desc=True).limit(10).execute()
+            feedback_summary = summarize_feedback(feedback_result.data or [])
+            if not feedback_summary:
+                raise Exception('No actionable feedback text provided')
+            if not is_llm_available():
+                raise Exception('AI service not configured')
+
+            prd = prd_result.data[0]
+            job.report(completed=0, total=2, message='Improving PRD')
+            improved_content = complete(build_improvement_prompt(prd.get('content_md', ''), feedback_summary), max_tokens=8000).strip()
+            # The PRD as it was before, so re-applying after a failure is idempotent
+            checkpoint.update({'prd': prd, 'improved_content': improved_content})
+            job.save_checkpoint(checkpoint, completed=1, message='Saving improved PRD')
+
+        checkpoint['snapshot_id'] = apply_prd_improvement(
+            supabase, job.project_id, checkpoint['prd'], checkpoint['improved_content'],
+            snapshot_id=str(uuid.uuid5(uuid.UUID(job.id), 'snapshot')))
+        job.save_checkpoint(checkpoint, completed=2)
+
+    return {
+        'success': True,
+        'message': 'PRD improved based on feedback',
+        'previous_version_id': checkpoint['snapshot_id']
+    }
+
+
 class handler(BaseHTTPRequestHandler):
     def send_cors_headers(self):
         for key, value in cors_headers().items():
@@ -282,6 +349,7 @@ class handler(BaseHTTPRequestHandler):
                 result = supabase.table('prd_feedback').insert(feedback_data).execute()
 
                 if result.data:
+                    bump_generation(supabase, project_id)
                     self.send_json(201, {
                         'success': True,
                         'feedback_id': feedback_id,
@@ -320,6 +388,7 @@ class handler(BaseHTTPRequestHandler):
                 result = supabase.table('prd_feedback').insert(feedback_data).execute()
 
                 if result.data:
+                    bump_generation(supabase, project_id)
                     self.send_json(201, {
                         'success': True,
                         'feedback_id': feedback_id
@@ -336,7 +405,6 @@ class handler(BaseHTTPRequestHandler):
                     return
 
                 prd_content = prd_result.data[0].get('content_md', '')
-                prd_id = prd_result.data[0].get('id')
 
                 feedback_result = supabase.table('prd_feedback').select('*').eq('project_id', project_id).order('created_at', desc=True).limit(10).execute()
                 feedback_data = feedback_result.data or []
@@ -346,67 +414,22 @@ class handler(BaseHTTPRequestHandler):
                     return
 
                 # Use AI to improve the PRD
-                if anthropic is None:
-                    self.send_json(503, {'error': 'AI service not available'})
-                    return
-
-                api_key = os.environ.get('ANTHROPIC_API_KEY')
-                if not api_key:
+                if not is_llm_available():
                     self.send_json(503, {'error': 'AI service not configured'})
                     return
 
                 # Compile feedback
-                feedback_summary = []
-                for fb in feedback_data:
-                    if fb.get('feedback_text'):
-                        feedback_summary.append(f"- {fb.get('section_name', 'General')}: {fb['feedback_text']}")
+                feedback_summary = summarize_feedback(feedback_data)
 
                 if not feedback_summary:
                     self.send_json(400, {'error': 'No actionable feedback text provided'})
                     return
 
                 try:
-                    client = anthropic.Anthropic(api_key=api_key)
-
-                    prompt = f"""Improve this PRD based on the user feedback provided.
-
-Current PRD:
-{prd_content}
-
-User Feedback:
-{chr(10).join(feedback_summary)}
-
-Instructions:
-1. Address each piece of feedback
-2. Maintain the overall structure and formatting
-3. Make the content clearer and more actionable
-4. Keep the improved PRD comprehensive but concise
-
-Return the improved PRD in markdown format. Return ONLY the improved PRD content, no explanations."""
+                    improved_content = complete(build_improvement_prompt(prd_content, feedback_summary), max_tokens=8000).strip()
 
-                    message = client.messages.create(
-                        model="claude-sonnet-4-20250514",
-                        max_tokens=8000,
-                        messages=[{"role": "user", "content": prompt}]
-                    )
-
-                    improved_content = message.content[0].text.strip()
-
-                    # Save as new version
-                    supabase.table('generated_prds').update({
-                        'content_md': improved_content,
-                        'version': prd_result.data[0].get('version', 1) + 1
-                    }).eq('id', prd_id).execute()
-
-                    # Create snapshot of previous version
-                    snapshot_id = str(uuid.uuid4())
-                    supabase.table('prd_edit_snapshots').insert({
-                        'id': snapshot_id,
-                        'prd_id': prd_id,
-                        'content_md': prd_content,
-                        'version_name': f"Before AI improvement v{prd_result.data[0].get('version', 1)}",
-                        'change_summary': 'Auto-saved before AI improvement'
-                    }).execute()
+                    # Save as new version (the previous one is kept as a snapshot)
+                    snapshot_id = apply_prd_improvement(supabase, project_id, prd_result.data[0], improved_content)
 
                     self.send_json(200, {
                         'success': True,
@@ -0,0 +1,358 @@
+"""
+Background Jobs for PM Clarity API
+
+Long-running AI operations are queued in the `jobs` table
+(migrations/010_jobs.sql) and executed by a worker process (api/worker.py)
+instead of inside the HTTP request, so they are not bound by the
+serverless request timeout.
+
+Endpoints:
+    POST /api/jobs                        Enqueue {job_type, project_id, params}; returns the job id at once
+    GET  /api/jobs/{job_id}               Status, progress, partial and final results
+    GET  /api/jobs/project/{project_id}   Recent jobs of a project
+    POST /api/jobs/{job_id}/cancel        Cancel a queued or running job
+
+A runner reports progress and saves a checkpoint (the work finished so far)
+through its Job. When an attempt fails the job is queued again with a
+backoff and the next attempt starts from the checkpoint instead of from
+scratch; a job whose worker died is taken over once its lock goes stale.
+
+Configuration (environment variables):
+    JOB_MAX_ATTEMPTS        Attempts before a job fails for good (default 3)
+    JOB_RETRY_BASE_DELAY    Seconds before the first retry, doubled per attempt (default 10)
+    JOB_LOCK_TIMEOUT        Seconds without progress before a running job is taken over (default 600)
+"""
+
+from http.server import BaseHTTPRequestHandler
+import json
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+from db import get_supabase
+
+# Import authentication middleware
+from auth_middleware import get_user_from_request, is_auth_enabled
+
+JOB_TYPES = ('prefill', 'extract_features', 'generate_prd', 'improve_prd', 'analyze_context')
+ACTIVE_STATUSES = ('queued', 'running')
+
+JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', '3'))
+JOB_RETRY_BASE_DELAY = float(os.environ.get('JOB_RETRY_BASE_DELAY', '10'))
+JOB_LOCK_TIMEOUT = int(os.environ.get('JOB_LOCK_TIMEOUT', '600'))
+
+# Columns returned to clients (the checkpoint is internal to the runner)
+JOB_COLUMNS = 'id, project_id, job_type, status, params, progress, result, error, attempts, max_attempts, created_at, updated_at, started_at, finished_at'
+
+
+class JobLost(Exception):
+    """The running job was cancelled or taken over by another worker."""
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat()
+
+
+class Job:
+    """A claimed job, as seen by its runner."""
+
+    def __init__(self, supabase, row, worker_id):
+        self.supabase = supabase
+        self.id = row['id']
+        self.project_id = row.get('project_id')
+        self.job_type = row['job_type']
+        self.params = row.get('params') or {}
+        self.checkpoint = row.get('checkpoint') or {}
+        self.progress = row.get('progress') or {}
+        self.attempts = row.get('attempts', 1)
+        self.max_attempts = row.get('max_attempts', JOB_MAX_ATTEMPTS)
+        self.worker_id = worker_id
+
+    def _update(self, fields):
+        """Update the job while this worker still holds it; refreshes the lock."""
+        now = _now()
+        result = self.supabase.table('jobs').update({**fields, 'locked_at': now, 'updated_at': now}).eq(
+            'id', self.id).eq('status', 'running').eq('locked_by', self.worker_id).execute()
+        if not result.data:
+            raise JobLost(f"Job {self.id} was cancelled or claimed by another worker")
+
+    def report(self, completed=None, total=None, message=None, partial=None):
+        """
+        Record progress, visible to clients polling the job.
+
+        Args:
+            completed: Units of work done (batches, sections, ...)
+            total: Units of work in the job
+            message: Short human-readable status
+            partial: Partial results clients can show before the job finishes
+        """
+        for key, value in (('completed', completed), ('total', total), ('message', message), ('partial', partial)):
+            if value is not None:
+                self.progress[key] = value
+        self._update({'progress': self.progress})
+
+    def save_checkpoint(self, checkpoint, **progress):
+        """Persist the work finished so far (and optionally progress) for a retry to resume from."""
+        self.checkpoint = checkpoint
+        for key, value in progress.items():
+            if value is not None:
+                self.progress[key] = value
+        self._update({'checkpoint': checkpoint, 'progress': self.progress})
+
+    def heartbeat(self):
+        """Refresh the lock without changing progress."""
+        self._update({})
+
+
+def enqueue_job(supabase, job_type, project_id, params=None):
+    """
+    Queue a job, or return the matching job that is already queued or running.
+
+    Returns:
+        dict: The job row (JOB_COLUMNS)
+    """
+    if job_type not in JOB_TYPES:
+        raise Exception(f"Unknown job type: {job_type}")
+    params = params or {}
+
+    active = supabase.table('jobs').select(JOB_COLUMNS).eq('project_id', project_id).eq('job_type', job_type).in_(
+        'status', list(ACTIVE_STATUSES)).order('created_at', desc=True).execute()
+    for row in (active.data or []):
+        if (row.get('params') or {}) == params:
+            return row
+
+    row = {
+        'id': str(uuid.uuid4()),
+        'project_id': project_id,
+        'job_type': job_type,
+        'status': 'queued',
+        'params': params,
+        'progress': {},
+        'checkpoint': {},
+        'max_attempts': JOB_MAX_ATTEMPTS
+    }
+    result = supabase.table('jobs').insert(row).execute()
+    if not result.data:
+        raise Exception('Failed to enqueue job')
+    return {key: result.data[0].get(key) for key in JOB_COLUMNS.split(', ')}
+
+
+def user_can_access_project(supabase, project_id, user_id):
+    """Whether the project exists and, when signed in, belongs to the user"""
+    query = supabase.table('projects').select('id').eq('id', project_id)
+    if user_id:
+        query = query.eq('user_id', user_id)
+    return bool(query.execute().data)
+
+
+def get_job(supabase, job_id):
+    result = supabase.table('jobs').select(JOB_COLUMNS).eq('id', job_id).execute()
+    return result.data[0] if result.data else None
+
+
+def list_project_jobs(supabase, project_id, limit=20):
+    result = supabase.table('jobs').select(JOB_COLUMNS).eq('project_id', project_id).order(
+        'created_at', desc=True).limit(limit).execute()
+    return result.data or []
+
+
+def cancel_job(supabase, job_id):
+    """Cancel a queued or running job; a running job stops at its next progress report."""
+    now = _now()
+    result = supabase.table('jobs').update({
+        'status': 'cancelled', 'finished_at': now, 'updated_at': now, 'locked_by': None
+    }).eq('id', job_id).in_('status', list(ACTIVE_STATUSES)).execute()
+    return bool(result.data)
+
+
+def claim_job(supabase, worker_id, job_types=None):
+    """
+    Claim the next runnable job for this worker.
+
+    Returns:
+        Job or None if nothing is runnable
+    """
+    result = supabase.rpc('claim_job', {
+        'p_worker': worker_id,
+        'p_types': list(job_types) if job_types else None,
+        'p_lock_timeout': JOB_LOCK_TIMEOUT
+    }).execute()
+    rows = result.data or []
+    return Job(supabase, rows[0], worker_id) if rows else None
+
+
+def finish_job(job, result):
+    """Mark a job as succeeded with its final result."""
+    now = _now()
+    job.supabase.table('jobs').update({
+        'status': 'succeeded', 'result': result, 'error': None, 'finished_at': now, 'updated_at': now, 'locked_by': None
+    }).eq('id', job.id).eq('status', 'running').eq('locked_by', job.worker_id).execute()
+
+
+def fail_job(job, error):
+    """
+    Record a failed attempt: queue the job again with a backoff, keeping its
+    checkpoint, or fail it for good once max_attempts is reached.
+
+    Returns:
+        bool: True if the job will be retried
+    """
+    now = datetime.now(timezone.utc)
+    retry = job.attempts < job.max_attempts
+    fields = {'error': str(error), 'updated_at': now.isoformat(), 'locked_by': None}
+    if retry:
+        delay = JOB_RETRY_BASE_DELAY * (2 ** (job.attempts - 1))
+        fields.update({'status': 'queued', 'run_after': (now + timedelta(seconds=delay)).isoformat()})
+    else:
+        fields.update({'status': 'failed', 'finished_at': now.isoformat()})
+    job.supabase.table('jobs').update(fields).eq('id', job.id).eq('status', 'running').eq(
+        'locked_by', job.worker_id).execute()
+    return retry
+
+
+def release_job(job):
+    """Put a job back in the queue without counting the attempt (e.g. on worker shutdown)."""
+    job.supabase.table('jobs').update({
+        'status': 'queued', 'attempts': max(0, job.attempts - 1), 'locked_by': None,
+        'run_after': _now(), 'updated_at': _now()
+    }).eq('id', job.id).eq('status', 'running').eq('locked_by', job.worker_id).execute()
+
+
+def cors_headers():
+    return {
+        'Access-Control-Allow-Origin': '*',
+        'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+        'Access-Control-Allow-Headers': 'Content-Type, Authorization',
+        'Content-Type': 'application/json'
+    }
+
+
+def validate_uuid(uuid_str):
+    try:
+        uuid.UUID(uuid_str)
+        return True
+    except (ValueError, AttributeError):
+        return False
+
+
+def parse_path(path):
+    """Parse path to determine operation and extract IDs"""
+    parts = path.split('?')[0].strip('/').split('/')
+    if len(parts) == 2:
+        return ('enqueue', None, None)
+    if len(parts) >= 4 and parts[2] == 'project':
+        return ('project', parts[3], None)
+    if len(parts) >= 4 and parts[3] == 'cancel':
+        return ('cancel', None, parts[2])
+    if len(parts) == 3:
+        return ('get', None, parts[2])
+    return (None, None, None)
+
+
+class handler(BaseHTTPRequestHandler):
+    def send_cors_headers(self):
+        for key, value in cors_headers().items():
+            self.send_header(key, value)
+
+    def send_json(self, status, data):
+        self.send_response(status)
+        self.send_cors_headers()
+        self.end_headers()
+        self.wfile.write(json.dumps(data).encode())
+
+    def do_OPTIONS(self):
+        self.send_response(200)
+        self.send_cors_headers()
+        self.end_headers()
+        return
+
+    def do_GET(self):
+        """Poll a job, or list a project's jobs"""
+        user_id = get_user_from_request(self)
+        if is_auth_enabled() and not user_id:
+            self.send_json(401, {'error': 'Unauthorized', 'message': 'Please sign in to continue'})
+            return
+
+        try:
+            op, project_id, job_id = parse_path(self.path)
+            supabase = get_supabase()
+
+            if op == 'get':
+                if not validate_uuid(job_id):
+                    self.send_json(400, {'error': 'Invalid job ID format'})
+                    return
+                job = get_job(supabase, job_id)
+                if job and user_can_access_project(supabase, job['project_id'], user_id):
+                    self.send_json(200, job)
+                else:
+                    self.send_json(404, {'error': 'Job not found'})
+
+            elif op == 'project':
+                if not validate_uuid(project_id):
+                    self.send_json(400, {'error': 'Invalid project ID format'})
+                    return
+                if not user_can_access_project(supabase, project_id, user_id):
+                    self.send_json(404, {'error': 'Project not found'})
+                    return
+                self.send_json(200, list_project_jobs(supabase, project_id))
+
+            else:
+                self.send_json(400, {'error': 'Invalid request path'})
+
+        except Exception as e:
+            self.send_json(500, {'error': str(e)})
+        return
+
+    def do_POST(self):
+        """Enqueue or cancel a job"""
+        user_id = get_user_from_request(self)
+        if is_auth_enabled() and not user_id:
+            self.send_json(401, {'error': 'Unauthorized', 'message': 'Please sign in to continue'})
+            return
+
+        try:
+            op, _, job_id = parse_path(self.path)
+            supabase = get_supabase()
+
+            if op == 'enqueue':
+                content_length = int(self.headers.get('Content-Length', 0))
+                body = self.rfile.read(content_length)
+                data = json.loads(body) if body else {}
+
+                job_type = data.get('job_type')
+                project_id = data.get('project_id')
+                if job_type not in JOB_TYPES:
+                    self.send_json(400, {'error': f"job_type must be one of: {', '.join(JOB_TYPES)}"})
+                    return
+                if not project_id or not validate_uuid(project_id):
+                    self.send_json(400, {'error': 'Invalid project ID format'})
+                    return
+                params = data.get('params') or {}
+                if not isinstance(params, dict):
+                    self.send_json(400, {'error': 'params must be an object'})
+                    return
+
+                if not user_can_access_project(supabase, project_id, user_id):
+                    self.send_json(404, {'error': 'Project not found'})
+                    return
+
+                job = enqueue_job(supabase, job_type, project_id, params)
+                self.send_json(202, {'job_id': job['id'], 'status': job['status'], 'job': job})
+
+            elif op == 'cancel':
+                if not validate_uuid(job_id):
+                    self.send_json(400, {'error': 'Invalid job ID format'})
+                    return
+                job = get_job(supabase, job_id)
+                if not job or not user_can_access_project(supabase, job['project_id'], user_id):
+                    self.send_json(404, {'error': 'Job not found'})
+                elif cancel_job(supabase, job_id):
+                    self.send_json(200, {'message': 'Job cancelled', 'job_id': job_id})
+                else:
+                    self.send_json(409, {'error': 'Job has already finished'})
+
+            else:
+                self.send_json(400, {'error': 'Invalid request path'})
+
+        except Exception as e:
+            self.send_json(500, {'error': str(e)})
+        return
@@ -0,0 +1,391 @@
+"""
+Shared Anthropic Gateway for PM Clarity API
+
+All Claude calls go through this module. It keeps one Anthropic client per
+process (so warm invocations reuse the same HTTP connections), limits the
+number of in-flight requests and tokens per minute with a token bucket, and
+retries rate-limit (429) and overloaded (529) responses with jittered
+exponential backoff.
+
+Configuration (environment variables):
+    LLM_MAX_CONCURRENCY     Max concurrent requests per process (default 5)
+    LLM_TOKENS_PER_MINUTE   Token budget per minute, input + output (default 80000)
+    LLM_MAX_RETRIES         Retries for 429/529 responses (default 4)
+    LLM_RETRY_BASE_DELAY    Base backoff delay in seconds (default 1.0)
+
+Large prompt prefixes that repeat across calls (project context, feature
+lists) should be passed as `system=cached_system(text)` so the provider-side
+prompt cache can serve them; cached vs uncached input tokens are logged
+per call and totalled in get_usage_stats().
+
+complete(..., cache=True) serves a response from the response cache
+(cache.py) when an identical request was answered before. Only analyses of
+unchanged input opt in; generation and regeneration calls leave it off so
+the user gets a fresh answer each time.
+"""
+
+import os
+import random
+import threading
+import time
+
+from cache import fingerprint, response_cache
+
+try:
+    import anthropic
+except ImportError:
+    anthropic = None
+
+DEFAULT_MODEL = "claude-sonnet-4-20250514"
+
+MAX_CONCURRENCY = int(os.environ.get('LLM_MAX_CONCURRENCY', '5'))
+TOKENS_PER_MINUTE = int(os.environ.get('LLM_TOKENS_PER_MINUTE', '80000'))
+MAX_RETRIES = int(os.environ.get('LLM_MAX_RETRIES', '4'))
+RETRY_BASE_DELAY = float(os.environ.get('LLM_RETRY_BASE_DELAY', '1.0'))
+RETRY_MAX_DELAY = 30.0
+RETRYABLE_STATUS_CODES = {429, 529}
+
+# Prefixes shorter than this (in tokens) are not cached by the provider
+MIN_CACHEABLE_TOKENS = 1024
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled continuously at capacity per minute."""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.refill_rate = capacity / 60.0
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.refill_rate)
+        self.updated_at = now
+
+    def acquire(self, amount):
+        """Block until `amount` tokens are available, then take them. Returns seconds waited."""
+        amount = min(amount, self.capacity)
+        waited = 0.0
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return waited
+                delay = (amount - self.tokens) / self.refill_rate
+            time.sleep(delay)
+            waited += delay
+
+    def refund(self, amount):
+        """Return unused tokens (e.g. when actual usage was below the reservation)."""
+        if amount <= 0:
+            return
+        with self.lock:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+
+# Process-wide state
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+_concurrency = threading.BoundedSemaphore(MAX_CONCURRENCY)
+_token_bucket = TokenBucket(TOKENS_PER_MINUTE)
+_stats_lock = threading.Lock()
+_stats = {
+    'requests': 0,
+    'retries': 0,
+    'failures': 0,
+    'throttle_wait_seconds': 0.0,
+    'input_tokens': 0,
+    'output_tokens': 0,
+    'cache_read_input_tokens': 0,
+    'cache_creation_input_tokens': 0
+}
+
+
+def _bump(key, amount=1):
+    with _stats_lock:
+        _stats[key] += amount
+
+
+def _record_usage(message, reserved, label=None):
+    """Update token counters and refund the unused part of the reservation.
+
+    `input_tokens` counts only uncached input; cache reads are billed at a
+    fraction of the price and do not count against the input rate limit.
+    """
+    usage = getattr(message, 'usage', None)
+    if usage is None:
+        return
+    input_tokens = getattr(usage, 'input_tokens', 0) or 0
+    output_tokens = getattr(usage, 'output_tokens', 0) or 0
+    cache_read = getattr(usage, 'cache_read_input_tokens', 0) or 0
+    cache_creation = getattr(usage, 'cache_creation_input_tokens', 0) or 0
+    _bump('input_tokens', input_tokens)
+    _bump('output_tokens', output_tokens)
+    _bump('cache_read_input_tokens', cache_read)
+    _bump('cache_creation_input_tokens', cache_creation)
+    print(f"LLM usage [{label or 'call'}]: input={input_tokens} cache_read={cache_read} "
+          f"cache_creation={cache_creation} output={output_tokens}")
+    _token_bucket.refund(reserved - input_tokens - cache_creation - output_tokens)
+
+
+def is_llm_available():
+    """Check whether the Anthropic library and API key are both present."""
+    return anthropic is not None and bool(os.environ.get('ANTHROPIC_API_KEY'))
+
+
+def get_client():
+    """
+    Get the process-wide Anthropic client, creating it on first use.
+
+    SDK-level retries are disabled because retries are handled here.
+
+    Raises:
+        Exception: If the library is missing or the API key is not configured
+    """
+    global _client, _client_pid
+
+    if anthropic is None:
+        raise Exception("Anthropic library not available")
+    api_key = os.environ.get('ANTHROPIC_API_KEY')
+    if not api_key:
+        raise Exception("Anthropic API key not configured")
+
+    pid = os.getpid()
+    with _client_lock:
+        if _client is None or _client_pid != pid:
+            _client = anthropic.Anthropic(api_key=api_key, max_retries=0)
+            _client_pid = pid
+        return _client
+
+
+def estimate_tokens(text):
+    """Rough token estimate (~4 characters per token)."""
+    return len(text or '') // 4 + 1
+
+
+def cached_system(text):
+    """
+    Build a system prompt whose text is marked for provider-side prompt caching.
+
+    Put the stable, shared part of a prompt (e.g. project context) here and
+    the per-call part in the user message, so repeat calls read the prefix
+    from cache instead of paying for it again.
+
+    Args:
+        text: Stable prompt prefix
+
+    Returns:
+        list: Anthropic system content blocks
+    """
+    return [{"type": "text", "text": text, "cache_control": {"type": "ephemeral"}}]
+
+
+def split_system(stable_text, variable_text):
+    """
+    Build system blocks for a prompt whose instructions repeat across calls
+    but whose context is specific to each call (e.g. retrieved per query).
+
+    Only the stable block is marked for caching, and only when it is long
+    enough to be cached; the per-call text follows unmarked, so no call pays
+    the cache-write premium for a prefix that is never read back.
+
+    Returns:
+        list: Anthropic system content blocks
+    """
+    stable = {"type": "text", "text": stable_text}
+    if is_cacheable(stable_text):
+        stable["cache_control"] = {"type": "ephemeral"}
+    return [stable, {"type": "text", "text": variable_text}]
+
+
+def _prompt_text(messages, system):
+    if isinstance(system, list):
+        system = ''.join(block.get('text', '') for block in system)
+    return ''.join(str(m.get('content', '')) for m in messages) + (system or '')
+
+
+def is_cacheable(text):
+    """Check whether a prefix is long enough for the provider to cache it."""
+    return estimate_tokens(text) >= MIN_CACHEABLE_TOKENS
+
+
+def warm_prompt_cache(system, label='warm'):
+    """
+    Write a cached system prefix with a minimal request.
+
+    A cache entry is only readable once the request that wrote it has
+    started responding, so parallel requests sharing a fresh prefix all miss.
+    Call this once before fanning out to make them read from cache.
+
+    Args:
+        system: System blocks built with cached_system()
+        label: Name recorded in the per-call usage log
+    """
+    create_message([{"role": "user", "content": "Reply with OK."}], 1, system=system, label=label)
+
+
+def _retry_delay(error, attempt):
+    """Backoff for a retryable error, honouring Retry-After when present."""
+    retry_after = None
+    response = getattr(error, 'response', None)
+    if response is not None:
+        try:
+            retry_after = float(response.headers.get('retry-after'))
+        except (TypeError, ValueError):
+            retry_after = None
+    if retry_after is not None:
+        return min(retry_after, RETRY_MAX_DELAY) + random.uniform(0, RETRY_BASE_DELAY)
+    # Full jitter: uniform over [0, base * 2^attempt]
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * (2 ** attempt)))
+
+
+def _is_retryable(error):
+    return getattr(error, 'status_code', None) in RETRYABLE_STATUS_CODES
+
+
+def create_message(messages, max_tokens, model=DEFAULT_MODEL, **kwargs):
+    """
+    Send a messages.create request through the limiter with retries.
+
+    Args:
+        messages: Anthropic messages list
+        max_tokens: Maximum output tokens
+        model: Model name
+        **kwargs: Extra arguments passed to messages.create (system, timeout, ...);
+            `label` names the call in the per-call usage log
+
+    Returns:
+        The Anthropic Message response
+    """
+    client = get_client()
+    label = kwargs.pop('label', None)
+    if kwargs.get('timeout') is None:
+        kwargs.pop('timeout', None)
+
+    reserved = estimate_tokens(_prompt_text(messages, kwargs.get('system'))) + max_tokens
+
+    attempt = 0
+    while True:
+        waited = _token_bucket.acquire(reserved)
+        if waited:
+            _bump('throttle_wait_seconds', waited)
+        try:
+            with _concurrency:
+                _bump('requests')
+                message = client.messages.create(model=model, max_tokens=max_tokens, messages=messages, **kwargs)
+        except Exception as e:
+            # A failed request still counts against the provider's limits; keep the reservation
+            if anthropic is not None and isinstance(e, anthropic.APIStatusError) and _is_retryable(e) and attempt < MAX_RETRIES:
+                _bump('retries')
+                time.sleep(_retry_delay(e, attempt))
+                attempt += 1
+                continue
+            _bump('failures')
+            raise
+
+        _record_usage(message, reserved, label)
+        return message
+
+
+def complete(prompt, max_tokens, model=DEFAULT_MODEL, cache=False, **kwargs):
+    """
+    Send a single-turn prompt and return the text of the first content block.
+
+    Args:
+        prompt: User prompt text
+        max_tokens: Maximum output tokens
+        model: Model name
+        cache: Serve/store the response through the response cache; leave off
+            for generation, where a repeat request asks for a new answer
+        **kwargs: Extra arguments passed to messages.create
+
+    Returns:
+        str: Response text
+    """
+    messages = [{"role": "user", "content": prompt}]
+    use_cache = cache and response_cache.enabled
+    if use_cache:
+        params = {k: v for k, v in kwargs.items() if k not in ('timeout', 'label')}
+        key = fingerprint(model, max_tokens, messages, **params)
+        cached = response_cache.get(key)
+        if cached is not None:
+            return cached
+    elif response_cache.enabled:
+        response_cache.record_bypass()
+
+    message = create_message(messages, max_tokens, model=model, **kwargs)
+    text = message.content[0].text
+    # Empty or truncated responses are not worth replaying
+    if use_cache and text.strip() and getattr(message, 'stop_reason', None) != 'max_tokens':
+        response_cache.set(key, text, model)
+    return text
+
+
+def stream_text(prompt, max_tokens, model=DEFAULT_MODEL, **kwargs):
+    """
+    Stream a single-turn prompt, yielding text deltas as they arrive.
+
+    The request holds a concurrency slot for the whole stream. 429/529
+    errors are retried only if they happen before the first delta, so the
+    caller never sees duplicated text.
+
+    Args:
+        prompt: User prompt text
+        max_tokens: Maximum output tokens
+        model: Model name
+        **kwargs: Extra arguments passed to messages.stream
+
+    Yields:
+        str: Text deltas
+    """
+    client = get_client()
+    label = kwargs.pop('label', None)
+    if kwargs.get('timeout') is None:
+        kwargs.pop('timeout', None)
+
+    messages = [{"role": "user", "content": prompt}]
+    reserved = estimate_tokens(_prompt_text(messages, kwargs.get('system'))) + max_tokens
+
+    attempt = 0
+    while True:
+        waited = _token_bucket.acquire(reserved)
+        if waited:
+            _bump('throttle_wait_seconds', waited)
+        started = False
+        try:
+            with _concurrency:
+                _bump('requests')
+                with client.messages.stream(model=model, max_tokens=max_tokens, messages=messages, **kwargs) as stream:
+                    for text in stream.text_stream:
+                        started = True
+                        yield text
+                    message = stream.get_final_message()
+        except Exception as e:
+            if not started and anthropic is not None and isinstance(e, anthropic.APIStatusError) and _is_retryable(e) and attempt < MAX_RETRIES:
+                _bump('retries')
+                time.sleep(_retry_delay(e, attempt))
+                attempt += 1
+                continue
+            _bump('failures')
+            raise
+
+        _record_usage(message, reserved, label)
+        return
+
+
+def get_usage_stats():
+    """Get request, retry and token counters for this process."""
+    with _stats_lock:
+        stats = dict(_stats)
+    stats['throttle_wait_seconds'] = round(stats['throttle_wait_seconds'], 2)
+    stats['max_concurrency'] = MAX_CONCURRENCY
+    stats['tokens_per_minute'] = TOKENS_PER_MINUTE
+    input_total = stats['input_tokens'] + stats['cache_read_input_tokens'] + stats['cache_creation_input_tokens']
+    stats['prompt_cache_read_ratio'] = round(stats['cache_read_input_tokens'] / input_total, 3) if input_total > 0 else 0
+    stats['cache'] = response_cache.get_stats()
+    return stats
@@ -4,12 +4,12 @@ import os
 import uuid
 import io
 import re
-from supabase import create_client
-
-try:
-    import anthropic
-except ImportError:
-    anthropic = None
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from analytics_cache import bump_generation
+from db import get_supabase
+from llm import complete, stream_text
 
 try:
     from docx import Document
@@ -50,6 +50,29 @@ PRD_TEMPLATE = """# Product Requirements Document
 """
 
 
+# Seconds between SSE heartbeat comments while waiting for the model
+SSE_HEARTBEAT_INTERVAL = 10
+
+# Section-parallel generation settings
+PRD_SECTION_WORKERS = int(os.environ.get('PRD_SECTION_WORKERS', '5'))
+PRD_SECTION_RETRIES = int(os.environ.get('PRD_SECTION_RETRIES', '2'))
+PRD_SECTION_MAX_TOKENS = 2048
+
+# Which question parts (data/questions.json) feed each default PRD section.
+# Sections not listed here are matched to question parts by keyword overlap.
+SECTION_QUESTION_PARTS = {
+    'executive summary': None,  # None = every part, answers condensed
+    'problem statement': ['Part 1'],
+    'target users': ['Part 2'],
+    'proposed solution': ['Part 4'],
+    'key features': ['Part 4', 'Part 7'],
+    'success metrics': ['Part 5'],
+    'technical requirements': ['Part 4', 'Part 7'],
+    'timeline and milestones': ['Part 7', 'Part 9'],
+    'risks and mitigations': ['Part 7', 'Part 3']
+}
+
+
 def load_questions():
     questions_file = os.path.join(os.path.dirname(__file__), 'data', 'questions.json')
     try:
@@ -59,14 +82,6 @@ def load_questions():
         return {"sections": []}
 
 
-def get_supabase():
-    url = os.environ.get('SUPABASE_URL')
-    key = os.environ.get('SUPABASE_KEY')
-    if not url or not key:
-        raise Exception("Supabase credentials not configured")
-    return create_client(url, key)
-
-
 def cors_headers():
     return {
         'Access-Control-Allow-Origin': '*',
@@ -94,6 +109,7 @@ def parse_path(path):
     """Parse path to determine operation and extract project_id
     /api/prd/{project_id} -> ('get', project_id)
     /api/prd/generate/{project_id} -> ('generate', project_id)
+    /api/prd/generate-stream/{project_id} -> ('generate_stream', project_id)
     /api/prd/preview/{project_id} -> ('preview', project_id)
     /api/prd/export/md/{project_id} -> ('export_md', project_id)
     /api/prd/export/docx/{project_id} -> ('export_docx', project_id)
@@ -110,6 +126,8 @@ def parse_path(path):
     if len(parts) >= 3:
         if parts[2] == 'generate' and len(parts) >= 4:
             return ('generate', parts[3], None)
+        elif parts[2] == 'generate-stream' and len(parts) >= 4:
+            return ('generate_stream', parts[3], None)
         elif parts[2] == 'preview' and len(parts) >= 4:
             return ('preview', parts[3], None)
         elif parts[2] == 'export' and len(parts) >= 5:
@@ -146,14 +164,25 @@ def get_question_map(questions_data):
     return question_map
 
 
-def generate_prd_with_claude(organized_responses, template):
-    if anthropic is None:
-        raise Exception("Anthropic library not available")
-    api_key = os.environ.get('ANTHROPIC_API_KEY')
-    if not api_key:
-        raise Exception("Anthropic API key not configured")
+def organize_responses(responses, question_map):
+    """Group responses by question section, keeping only known questions"""
+    organized_responses = {}
+    for resp in responses:
+        q_id = resp.get('question_id')
+        if q_id in question_map:
+            section_key = question_map[q_id]['section']
+            if section_key not in organized_responses:
+                organized_responses[section_key] = []
+            organized_responses[section_key].append({
+                'question_id': q_id,
+                'question': question_map[q_id]['question'],
+                'response': resp.get('response', ''),
+                'confirmed': resp.get('confirmed', False)
+            })
+    return organized_responses
 
-    client = anthropic.Anthropic(api_key=api_key)
+
+def build_prd_prompt(organized_responses, template):
     responses_text = ""
     for section_name, responses in organized_responses.items():
         responses_text += f"\n## {section_name}\n"
@@ -177,51 +206,320 @@ Generate a well-structured PRD that:
 5. Adds appropriate formatting (headers, bullet points, etc.)
 
 Output the PRD in Markdown format."""
+    return prompt
+
+
+def generate_prd_with_claude(organized_responses, template):
+    return complete(build_prd_prompt(organized_responses, template), max_tokens=8192)
 
-    message = client.messages.create(model="claude-sonnet-4-20250514", max_tokens=8192, messages=[{"role": "user", "content": prompt}])
-    return message.content[0].text
 
+def stream_prd_with_claude(organized_responses, template):
+    """Yield Markdown deltas of the generated PRD as the model produces them"""
+    return stream_text(build_prd_prompt(organized_responses, template), max_tokens=8192)
 
-def regenerate_prd_section(current_prd, section_name, organized_responses):
-    """Regenerate a specific section of the PRD while keeping other sections intact"""
-    if anthropic is None:
-        raise Exception("Anthropic library not available")
-    api_key = os.environ.get('ANTHROPIC_API_KEY')
-    if not api_key:
-        raise Exception("Anthropic API key not configured")
 
-    client = anthropic.Anthropic(api_key=api_key)
+def split_template_sections(template):
+    """Split a Markdown template into its title and ordered ## sections.
 
-    # Build context from responses
+    Returns:
+        (title, [{'name': ..., 'guidance': ...}, ...])
+    """
+    title = 'Product Requirements Document'
+    sections = []
+    for line in template.split('\n'):
+        if line.startswith('# '):
+            title = line[2:].strip()
+        elif line.startswith('## '):
+            sections.append({'name': line[3:].strip(), 'guidance': ''})
+        elif sections and line.strip():
+            sections[-1]['guidance'] = (sections[-1]['guidance'] + '\n' + line.strip()).strip()
+    return title, sections
+
+
+def template_from_sections(template_sections):
+    """Render custom template_sections rows as a Markdown template"""
+    lines = ['# Product Requirements Document', '']
+    for section in sorted(template_sections, key=lambda s: s.get('section_order') or 0):
+        lines.append(f"## {section.get('section_name', 'Section')}")
+        lines.append(f"[{section.get('prompt_template') or 'Relevant details for this section'}]")
+        lines.append('')
+    return '\n'.join(lines)
+
+
+def _keywords(text):
+    return {w for w in re.findall(r'[a-z]{4,}', (text or '').lower())}
+
+
+def select_section_responses(section, organized_responses):
+    """Pick the organized_responses relevant to one template section"""
+    key = section['name'].lower()
+    if key in SECTION_QUESTION_PARTS:
+        parts = SECTION_QUESTION_PARTS[key]
+        if parts is None:
+            return organized_responses, True
+        selected = {name: resps for name, resps in organized_responses.items()
+                    if any(name.startswith(prefix + ':') for prefix in parts)}
+        if selected:
+            return selected, False
+
+    # Custom section: rank question parts by keyword overlap with the section
+    section_words = _keywords(section['name'] + ' ' + section['guidance'])
+    scored = []
+    for name, resps in organized_responses.items():
+        part_words = _keywords(name + ' ' + ' '.join(r.get('question', '') for r in resps))
+        overlap = len(section_words & part_words)
+        if overlap:
+            scored.append((overlap, name))
+    if not scored:
+        return organized_responses, True
+    scored.sort(reverse=True)
+    return {name: organized_responses[name] for _, name in scored[:2]}, False
+
+
+def format_section_responses(section_responses, condensed=False):
+    """Render Q&A for a section prompt; condensed keeps a few short answers per part"""
     responses_text = ""
-    for section, responses in organized_responses.items():
-        responses_text += f"\n### {section}\n"
-        for resp in responses:
-            if resp.get('response') and resp.get('response').strip():
-                responses_text += f"Q: {resp['question']}\nA: {resp['response']}\n\n"
+    for part_name, responses in section_responses.items():
+        answered = [r for r in responses if r.get('response') and r.get('response').strip()]
+        if not answered:
+            continue
+        responses_text += f"\n### {part_name}\n"
+        for resp in answered[:4] if condensed else answered:
+            answer = resp['response'][:400] if condensed else resp['response']
+            responses_text += f"Q: {resp['question']}\nA: {answer}\n\n"
+    return responses_text
+
+
+def build_section_prompt(section, section_responses, condensed=False):
+    responses_text = format_section_responses(section_responses, condensed)
+
+    return f"""You are a professional product manager writing one section of a Product Requirements Document (PRD).
+
+SECTION: {section['name']}
+SECTION GUIDANCE: {section['guidance'] or 'None'}
+
+RELEVANT Q&A RESPONSES:
+{responses_text or 'No directly relevant responses were provided.'}
+
+Write ONLY the body of the "{section['name']}" section:
+1. Do not include the "## {section['name']}" header or any other PRD section
+2. Use professional language appropriate for stakeholders
+3. Include specific details from the responses
+4. Use Markdown formatting (### sub-headers, bullet points, tables) where helpful"""
+
+
+def _generate_section(section, organized_responses):
+    """Generate one section body, retrying on failure or empty output"""
+    section_responses, condensed = select_section_responses(section, organized_responses)
+    prompt = build_section_prompt(section, section_responses, condensed)
+    last_error = None
+    for _ in range(PRD_SECTION_RETRIES + 1):
+        try:
+            body = complete(prompt, max_tokens=PRD_SECTION_MAX_TOKENS).strip()
+            # Drop a repeated header if the model added one anyway
+            body = re.sub(rf'^#{{1,3}}\s*{re.escape(section["name"])}\s*\n', '', body, flags=re.IGNORECASE).strip()
+            if body:
+                return body
+            last_error = 'Empty section returned'
+        except Exception as e:
+            last_error = str(e)
+    raise Exception(last_error)
+
+
+def generate_prd_by_sections(organized_responses, template, completed=None, on_section_done=None):
+    """Generate each ## section of the template concurrently and stitch them in order.
+
+    A section that still fails after retries gets a placeholder so the rest
+    of the document is kept; failures are reported alongside the content.
+
+    completed maps section index -> body for sections generated earlier
+    (e.g. by an interrupted job), which are not generated again;
+    on_section_done(index, body) is called as each new section finishes.
+
+    Returns:
+        (prd_content, section_errors) where section_errors is a list of
+        {'section': name, 'error': message}
+    """
+    title, sections = split_template_sections(template)
+    if not sections:
+        return generate_prd_with_claude(organized_responses, template), []
+
+    bodies = [None] * len(sections)
+    for idx, body in (completed or {}).items():
+        if idx < len(sections):
+            bodies[idx] = body
+    pending = [idx for idx in range(len(sections)) if bodies[idx] is None]
+
+    section_errors = []
+    if pending:
+        with ThreadPoolExecutor(max_workers=min(PRD_SECTION_WORKERS, len(pending))) as executor:
+            futures = {executor.submit(_generate_section, sections[idx], organized_responses): idx for idx in pending}
+            for future in as_completed(futures):
+                idx = futures[future]
+                try:
+                    bodies[idx] = future.result()
+                except Exception as e:
+                    section_errors.append({'section': sections[idx]['name'], 'error': str(e)})
+                    continue
+                if on_section_done:
+                    on_section_done(idx, bodies[idx])
+        section_order = {section['name']: idx for idx, section in enumerate(sections)}
+        section_errors.sort(key=lambda error: section_order[error['section']])
+
+    if len(section_errors) == len(sections):
+        raise Exception(f"All sections failed: {section_errors[0]['error']}")
+
+    parts = [f"# {title}"]
+    for section, body in zip(sections, bodies):
+        parts.append(f"## {section['name']}\n\n{body or '_This section could not be generated. Use Regenerate Section to try again._'}")
+    return '\n\n'.join(parts) + '\n', section_errors
+
+
+def get_generation_template(supabase, template_id=None):
+    """Use a custom template's sections when given, otherwise PRD_TEMPLATE"""
+    if template_id and validate_uuid(template_id):
+        sections_result = supabase.table('template_sections').select(
+            'section_name, section_order, prompt_template'
+        ).eq('template_id', template_id).order('section_order').execute()
+        if sections_result.data:
+            return template_from_sections(sections_result.data)
+    return PRD_TEMPLATE
+
+
+def save_generated_prd(supabase, project_id, prd_content):
+    """Insert a newly generated PRD and return its id"""
+    prd_id = str(uuid.uuid4())
+    prd_result = supabase.table('generated_prds').insert({'id': prd_id, 'project_id': project_id, 'content_md': prd_content}).execute()
+    saved_prd = prd_result.data[0] if prd_result.data else None
+    bump_generation(supabase, project_id)
+    return saved_prd['id'] if saved_prd else prd_id
+
+
+def run_generate_prd_job(supabase, job):
+    """
+    Job runner for 'generate_prd' (see jobs.py and worker.py).
+
+    params: {"mode": "sections" (default) | "single", "template_id": "..."}.
+    In sections mode every finished section is checkpointed, so a retry only
+    generates the sections that had not finished; the saved PRD id is
+    checkpointed too, so a retry never saves a second copy.
+    """
+    responses_result = supabase.table('question_responses').select('*').eq('project_id', job.project_id).execute()
+    responses = responses_result.data if responses_result.data else []
+    if not responses:
+        raise Exception('No responses found. Please answer questions first.')
+    confirmed_responses = [r for r in responses if r.get('confirmed')]
+    if not confirmed_responses:
+        raise Exception('No confirmed responses found. Please confirm at least some answers.')
+
+    organized_responses = organize_responses(responses, get_question_map(load_questions()))
+    stats = {'total_responses': len(responses), 'confirmed_responses': len(confirmed_responses), 'sections_covered': len(organized_responses)}
+    mode = job.params.get('mode', 'sections')
+    checkpoint = dict(job.checkpoint)
+
+    section_errors = checkpoint.get('section_errors', [])
+    prd_content = checkpoint.get('content')
+    if prd_content is None and mode == 'sections':
+        template = get_generation_template(supabase, job.params.get('template_id'))
+        total = len(split_template_sections(template)[1])
+        completed = {int(idx): body for idx, body in checkpoint.get('sections', {}).items()}
+        job.report(completed=len(completed), total=total, message='Generating sections')
+
+        def on_section_done(idx, body):
+            completed[idx] = body
+            checkpoint['sections'] = completed
+            job.save_checkpoint(checkpoint, completed=len(completed), total=total)
+
+        prd_content, section_errors = generate_prd_by_sections(organized_responses, template, completed, on_section_done)
+        if section_errors and job.attempts < job.max_attempts:
+            raise Exception(f"{len(section_errors)} sections failed: {section_errors[0]['error']}")
+    elif prd_content is None:
+        job.report(completed=0, total=1, message='Generating PRD')
+        prd_content = generate_prd_with_claude(organized_responses, PRD_TEMPLATE)
+
+    if not prd_content or prd_content.startswith('# Error'):
+        raise Exception('Failed to generate PRD content')
+
+    prd_id = checkpoint.get('prd_id')
+    if not prd_id:
+        checkpoint.update({'content': prd_content, 'section_errors': section_errors})
+        job.save_checkpoint(checkpoint, message='Saving PRD')
+        prd_id = save_generated_prd(supabase, job.project_id, prd_content)
+        checkpoint['prd_id'] = prd_id
+        job.save_checkpoint(checkpoint)
+
+    return {
+        'message': 'PRD generated successfully',
+        'prd_id': prd_id,
+        'content': prd_content,
+        'stats': stats,
+        'mode': mode,
+        'section_errors': section_errors
+    }
+
+
+def sse_event(event, data):
+    """Format one Server-Sent Event with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def find_section_span(markdown, section_name):
+    """Locate the body of a "## section_name" section by header position.
+
+    The body runs from the end of the header line to the next # or ## header
+    (### sub-headers stay inside the section).
+
+    Returns:
+        (body_start, body_end) character offsets, or None if not found
+    """
+    header = re.search(rf'^##[ \t]+{re.escape(section_name.strip())}[ \t]*$', markdown or '', re.MULTILINE | re.IGNORECASE)
+    if not header:
+        return None
+    body_start = header.end()
+    next_header = re.compile(r'^#{1,2}[ \t]+\S', re.MULTILINE).search(markdown, body_start)
+    body_end = next_header.start() if next_header else len(markdown)
+    return body_start, body_end
+
+
+def splice_section(markdown, span, new_body):
+    """Replace the section body at span with new_body"""
+    body_start, body_end = span
+    tail = markdown[body_end:]
+    return markdown[:body_start] + '\n\n' + new_body.strip() + ('\n\n' + tail if tail else '\n')
+
 
-    prompt = f"""You are a professional product manager. I need you to regenerate ONLY the "{section_name}" section of the following PRD.
+def regenerate_prd_section(current_section, section_name, organized_responses, outline=None):
+    """Regenerate the body of one PRD section.
 
-CURRENT PRD:
-{current_prd}
+    Only the target section and the Q&A relevant to it are sent, and only
+    the new section body comes back; the caller splices it into the PRD.
+    """
+    section = {'name': section_name, 'guidance': ''}
+    section_responses, condensed = select_section_responses(section, organized_responses)
+
+    responses_text = format_section_responses(section_responses, condensed)
+
+    prompt = f"""You are a professional product manager. Rewrite the "{section_name}" section of a PRD.
+
+OTHER SECTIONS IN THIS PRD (for context only, do not write them):
+{', '.join(outline or []) or 'None'}
+
+CURRENT "{section_name}" SECTION:
+{current_section.strip() or '(empty)'}
 
 AVAILABLE Q&A DATA (use this to improve the section):
-{responses_text}
+{responses_text or 'No directly relevant responses were provided.'}
 
 INSTRUCTIONS:
-1. Find the "{section_name}" section in the PRD (look for ## {section_name} or similar headers)
-2. Regenerate ONLY that section with improved content based on the Q&A data
-3. Keep ALL other sections EXACTLY as they are
-4. Return the COMPLETE PRD with the regenerated section
+1. Regenerate ONLY the body of the "{section_name}" section with improved content based on the Q&A data
+2. Do not include the "## {section_name}" header or any other section
+3. Use Markdown formatting (### sub-headers, bullet points, tables) where helpful
 
-Output the complete PRD in Markdown format."""
+Output only the section body in Markdown format."""
 
-    message = client.messages.create(
-        model="claude-sonnet-4-20250514",
-        max_tokens=8192,
-        messages=[{"role": "user", "content": prompt}]
-    )
-    return message.content[0].text
+    body = complete(prompt, max_tokens=PRD_SECTION_MAX_TOKENS).strip()
+    # Drop a repeated header if the model added one anyway
+    return re.sub(rf'^#{{1,3}}\s*{re.escape(section_name)}\s*\n', '', body, flags=re.IGNORECASE).strip()
 
 
 def compute_diff(old_content, new_content):
@@ -366,6 +664,86 @@ class handler(BaseHTTPRequestHandler):
         self.end_headers()
         self.wfile.write(json.dumps(data).encode())
 
+    def write_sse(self, chunk):
+        """Write raw SSE text; returns False once the client has disconnected"""
+        try:
+            self.wfile.write(chunk.encode())
+            self.wfile.flush()
+            return True
+        except (BrokenPipeError, ConnectionResetError):
+            return False
+
+    def stream_prd(self, supabase, project_id, organized_responses, stats):
+        """Stream PRD generation as text/event-stream and persist the final document.
+
+        Events: start, delta ({text}), done ({prd_id, stats}), error ({error, details}).
+        A heartbeat comment is sent whenever the model is silent for
+        SSE_HEARTBEAT_INTERVAL seconds so proxies keep the connection open.
+        Generation continues (and is saved) even if the client disconnects.
+        """
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'keep-alive')
+        self.send_header('X-Accel-Buffering', 'no')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+
+        connected = True
+        try:
+            events = queue.Queue()
+
+            def produce():
+                try:
+                    for text in stream_prd_with_claude(organized_responses, PRD_TEMPLATE):
+                        events.put(('delta', text))
+                    events.put(('end', None))
+                except Exception as e:
+                    events.put(('error', str(e)))
+
+            threading.Thread(target=produce, daemon=True).start()
+
+            connected = self.write_sse(sse_event('start', {'project_id': project_id}))
+            parts = []
+            while True:
+                try:
+                    kind, value = events.get(timeout=SSE_HEARTBEAT_INTERVAL)
+                except queue.Empty:
+                    if connected:
+                        connected = self.write_sse(': heartbeat\n\n')
+                    continue
+
+                if kind == 'delta':
+                    parts.append(value)
+                    if connected:
+                        connected = self.write_sse(sse_event('delta', {'text': value}))
+                elif kind == 'error':
+                    if connected:
+                        self.write_sse(sse_event('error', {'error': 'AI service temporarily unavailable', 'details': value}))
+                    return
+                else:
+                    break
+
+            prd_content = ''.join(parts)
+            if not prd_content or prd_content.startswith('# Error'):
+                if connected:
+                    self.write_sse(sse_event('error', {'error': 'Failed to generate PRD content'}))
+                return
+
+            try:
+                prd_id = save_generated_prd(supabase, project_id, prd_content)
+            except Exception as e:
+                if connected:
+                    self.write_sse(sse_event('error', {'error': 'PRD generated but failed to save', 'details': str(e)}))
+                return
+
+            if connected:
+                self.write_sse(sse_event('done', {'message': 'PRD generated successfully', 'prd_id': prd_id, 'stats': stats}))
+        except Exception as e:
+            # The 200 headers are already sent, so the failure must go out as an event
+            if connected:
+                self.write_sse(sse_event('error', {'error': 'Failed to generate PRD', 'details': str(e)}))
+
     def do_OPTIONS(self):
         self.send_response(200)
         self.send_cors_headers()
@@ -556,6 +934,7 @@ class handler(BaseHTTPRequestHandler):
                 'content_md': new_content,
                 'is_manually_edited': True
             }).eq('id', prd_id).execute()
+            bump_generation(supabase, project_id)
 
             self.send_json(200, {
                 'success': True,
@@ -571,7 +950,7 @@ class handler(BaseHTTPRequestHandler):
         try:
             op, project_id, extra_id = parse_path(self.path)
 
-            if op not in ['generate', 'restore', 'regenerate_section', 'save_version', 'compare', 'changelog']:
+            if op not in ['generate', 'generate_stream', 'restore', 'regenerate_section', 'save_version', 'compare', 'changelog']:
                 self.send_json(400, {'error': 'Invalid request path'})
                 return
 
@@ -586,7 +965,7 @@ class handler(BaseHTTPRequestHandler):
                 self.send_json(404, {'error': 'Project not found'})
                 return
 
-            if op == 'generate':
+            if op in ('generate', 'generate_stream'):
                 responses_result = supabase.table('question_responses').select('*').eq('project_id', project_id).execute()
                 responses = responses_result.data if responses_result.data else []
 
@@ -599,25 +978,26 @@ class handler(BaseHTTPRequestHandler):
                     self.send_json(400, {'error': 'No confirmed responses found. Please confirm at least some answers.'})
                     return
 
-                questions_data = load_questions()
-                question_map = get_question_map(questions_data)
-                organized_responses = {}
-
-                for resp in responses:
-                    q_id = resp.get('question_id')
-                    if q_id in question_map:
-                        section_key = question_map[q_id]['section']
-                        if section_key not in organized_responses:
-                            organized_responses[section_key] = []
-                        organized_responses[section_key].append({
-                            'question_id': q_id,
-                            'question': question_map[q_id]['question'],
-                            'response': resp.get('response', ''),
-                            'confirmed': resp.get('confirmed', False)
-                        })
+                question_map = get_question_map(load_questions())
+                organized_responses = organize_responses(responses, question_map)
+                stats = {'total_responses': len(responses), 'confirmed_responses': len(confirmed_responses), 'sections_covered': len(organized_responses)}
 
+                if op == 'generate_stream':
+                    self.stream_prd(supabase, project_id, organized_responses, stats)
+                    return
+
+                # Optional body: {"mode": "sections", "template_id": "..."}
+                content_length = int(self.headers.get('Content-Length', 0))
+                body = json.loads(self.rfile.read(content_length)) if content_length > 0 else {}
+                mode = body.get('mode', 'single')
+
+                section_errors = []
                 try:
-                    prd_content = generate_prd_with_claude(organized_responses, PRD_TEMPLATE)
+                    if mode == 'sections':
+                        template = get_generation_template(supabase, body.get('template_id'))
+                        prd_content, section_errors = generate_prd_by_sections(organized_responses, template)
+                    else:
+                        prd_content = generate_prd_with_claude(organized_responses, PRD_TEMPLATE)
                 except Exception as e:
                     self.send_json(503, {'error': 'AI service temporarily unavailable', 'details': str(e)})
                     return
@@ -626,308 +1006,307 @@ class handler(BaseHTTPRequestHandler):
                     self.send_json(500, {'error': 'Failed to generate PRD content'})
                     return
 
-                prd_id = str(uuid.uuid4())
                 try:
-                    prd_result = supabase.table('generated_prds').insert({'id': prd_id, 'project_id': project_id, 'content_md': prd_content}).execute()
-                    saved_prd = prd_result.data[0] if prd_result.data else None
+                    prd_id = save_generated_prd(supabase, project_id, prd_content)
                 except Exception as e:
                     self.send_json(500, {'error': 'PRD generated but failed to save', 'content': prd_content, 'details': str(e)})
                     return
 
                 self.send_json(200, {
                     'message': 'PRD generated successfully',
-                    'prd_id': saved_prd['id'] if saved_prd else prd_id,
+                    'prd_id': prd_id,
                     'content': prd_content,
-                    'stats': {'total_responses': len(responses), 'confirmed_responses': len(confirmed_responses), 'sections_covered': len(organized_responses)}
+                    'stats': stats,
+                    'mode': mode,
+                    'section_errors': section_errors
                 })
                 return
 
             elif op == 'restore':
-            # Restore PRD from a snapshot
-            snapshot_id = extra_id
-            if not snapshot_id or not validate_uuid(snapshot_id):
-                self.send_json(400, {'error': 'Invalid snapshot ID'})
-                return
+                # Restore PRD from a snapshot
+                snapshot_id = extra_id
+                if not snapshot_id or not validate_uuid(snapshot_id):
+                    self.send_json(400, {'error': 'Invalid snapshot ID'})
+                    return
 
-            content_length = int(self.headers.get('Content-Length', 0))
-            body = json.loads(self.rfile.read(content_length)) if content_length > 0 else {}
-            create_backup = body.get('create_backup', True)
+                content_length = int(self.headers.get('Content-Length', 0))
+                body = json.loads(self.rfile.read(content_length)) if content_length > 0 else {}
+                create_backup = body.get('create_backup', True)
 
-            # Get the snapshot
-            snapshot_result = supabase.table('prd_edit_snapshots').select('*').eq('id', snapshot_id).execute()
-            if not snapshot_result.data:
-                self.send_json(404, {'error': 'Snapshot not found'})
-                return
+                # Get the snapshot
+                snapshot_result = supabase.table('prd_edit_snapshots').select('*').eq('id', snapshot_id).execute()
+                if not snapshot_result.data:
+                    self.send_json(404, {'error': 'Snapshot not found'})
+                    return
 
-            snapshot = snapshot_result.data[0]
-            snapshot_content = snapshot.get('snapshot_content', '')
-            prd_id = snapshot.get('prd_id')
+                snapshot = snapshot_result.data[0]
+                snapshot_content = snapshot.get('snapshot_content', '')
+                prd_id = snapshot.get('prd_id')
 
-            # Get current PRD
-            prd_result = supabase.table('generated_prds').select('*').eq('id', prd_id).execute()
-            if not prd_result.data:
-                self.send_json(404, {'error': 'PRD not found'})
-                return
+                # Get current PRD
+                prd_result = supabase.table('generated_prds').select('*').eq('id', prd_id).execute()
+                if not prd_result.data:
+                    self.send_json(404, {'error': 'PRD not found'})
+                    return
 
-            prd = prd_result.data[0]
-            current_content = prd.get('content_md', '')
+                prd = prd_result.data[0]
+                current_content = prd.get('content_md', '')
+
+                # Create backup of current content before restoring
+                if create_backup and current_content:
+                    backup_id = str(uuid.uuid4())
+                    supabase.table('prd_edit_snapshots').insert({
+                        'id': backup_id,
+                        'prd_id': prd_id,
+                        'project_id': project_id,
+                        'snapshot_content': current_content,
+                        'change_summary': 'Backup before restore',
+                        'is_major_version': False
+                    }).execute()
+
+                # Restore the snapshot content
+                supabase.table('generated_prds').update({
+                    'content_md': snapshot_content,
+                    'is_manually_edited': True
+                }).eq('id', prd_id).execute()
+                bump_generation(supabase, project_id)
 
-            # Create backup of current content before restoring
-            if create_backup and current_content:
-                backup_id = str(uuid.uuid4())
-                supabase.table('prd_edit_snapshots').insert({
-                    'id': backup_id,
-                    'prd_id': prd_id,
-                    'project_id': project_id,
-                    'snapshot_content': current_content,
-                    'change_summary': 'Backup before restore',
-                    'is_major_version': False
-                }).execute()
+                self.send_json(200, {
+                    'success': True,
+                    'message': 'PRD restored successfully',
+                    'content': snapshot_content,
+                    'prd_id': prd_id
+                })
+                return
 
-            # Restore the snapshot content
-            supabase.table('generated_prds').update({
-                'content_md': snapshot_content,
-                'is_manually_edited': True
-            }).eq('id', prd_id).execute()
+            elif op == 'save_version':
+                # Save current PRD as a named version
+                content_length = int(self.headers.get('Content-Length', 0))
+                body = json.loads(self.rfile.read(content_length)) if content_length > 0 else {}
 
-            self.send_json(200, {
-                'success': True,
-                'message': 'PRD restored successfully',
-                'content': snapshot_content,
-                'prd_id': prd_id
-            })
-            return
+                version_name = body.get('version_name', '').strip()
+                change_summary = body.get('change_summary', '').strip()
 
-        elif op == 'save_version':
-            # Save current PRD as a named version
-            content_length = int(self.headers.get('Content-Length', 0))
-            body = json.loads(self.rfile.read(content_length)) if content_length > 0 else {}
+                if not version_name:
+                    self.send_json(400, {'error': 'Version name is required'})
+                    return
 
-            version_name = body.get('version_name', '').strip()
-            change_summary = body.get('change_summary', '').strip()
+                # Get current PRD
+                result = supabase.table('generated_prds').select('*').eq('project_id', project_id).order('created_at', desc=True).limit(1).execute()
 
-            if not version_name:
-                self.send_json(400, {'error': 'Version name is required'})
-                return
+                if not result.data:
+                    self.send_json(404, {'error': 'No PRD found'})
+                    return
 
-            # Get current PRD
-            result = supabase.table('generated_prds').select('*').eq('project_id', project_id).order('created_at', desc=True).limit(1).execute()
+                prd = result.data[0]
+                prd_id = prd['id']
+                current_content = prd.get('content_md', '')
 
-            if not result.data:
-                self.send_json(404, {'error': 'No PRD found'})
+                # Create named version snapshot
+                version_id = str(uuid.uuid4())
+                supabase.table('prd_edit_snapshots').insert({
+                    'id': version_id,
+                    'prd_id': prd_id,
+                    'project_id': project_id,
+                    'snapshot_content': current_content,
+                    'version_name': version_name,
+                    'change_summary': change_summary,
+                    'is_major_version': True
+                }).execute()
+                bump_generation(supabase, project_id)
+
+                self.send_json(200, {
+                    'success': True,
+                    'message': f'Version "{version_name}" saved successfully',
+                    'version_id': version_id
+                })
                 return
 
-            prd = result.data[0]
-            prd_id = prd['id']
-            current_content = prd.get('content_md', '')
-
-            # Create named version snapshot
-            version_id = str(uuid.uuid4())
-            supabase.table('prd_edit_snapshots').insert({
-                'id': version_id,
-                'prd_id': prd_id,
-                'project_id': project_id,
-                'snapshot_content': current_content,
-                'version_name': version_name,
-                'change_summary': change_summary,
-                'is_major_version': True
-            }).execute()
+            elif op == 'regenerate_section':
+                # Regenerate a specific section of the PRD
+                content_length = int(self.headers.get('Content-Length', 0))
+                body = json.loads(self.rfile.read(content_length)) if content_length > 0 else {}
 
-            self.send_json(200, {
-                'success': True,
-                'message': f'Version "{version_name}" saved successfully',
-                'version_id': version_id
-            })
-            return
-
-        elif op == 'regenerate_section':
-            # Regenerate a specific section of the PRD
-            content_length = int(self.headers.get('Content-Length', 0))
-            body = json.loads(self.rfile.read(content_length)) if content_length > 0 else {}
+                section_name = body.get('section_name', '').strip()
+                if not section_name:
+                    self.send_json(400, {'error': 'Section name is required'})
+                    return
 
-            section_name = body.get('section_name', '').strip()
-            if not section_name:
-                self.send_json(400, {'error': 'Section name is required'})
-                return
+                # Get current PRD
+                result = supabase.table('generated_prds').select('*').eq('project_id', project_id).order('created_at', desc=True).limit(1).execute()
 
-            # Get current PRD
-            result = supabase.table('generated_prds').select('*').eq('project_id', project_id).order('created_at', desc=True).limit(1).execute()
+                if not result.data:
+                    self.send_json(404, {'error': 'No PRD found'})
+                    return
 
-            if not result.data:
-                self.send_json(404, {'error': 'No PRD found'})
-                return
+                prd = result.data[0]
+                prd_id = prd['id']
+                current_content = prd.get('content_md', '')
 
-            prd = result.data[0]
-            prd_id = prd['id']
-            current_content = prd.get('content_md', '')
-
-            # Get responses for context
-            responses_result = supabase.table('question_responses').select('*').eq('project_id', project_id).execute()
-            responses = responses_result.data if responses_result.data else []
-
-            questions_data = load_questions()
-            question_map = get_question_map(questions_data)
-
-            # Organize responses
-            organized_responses = {}
-            for resp in responses:
-                q_id = resp.get('question_id')
-                if q_id in question_map:
-                    section_key = question_map[q_id]['section']
-                    if section_key not in organized_responses:
-                        organized_responses[section_key] = []
-                    organized_responses[section_key].append({
-                        'question_id': q_id,
-                        'question': question_map[q_id]['question'],
-                        'response': resp.get('response', ''),
-                        'confirmed': resp.get('confirmed', False)
-                    })
-
-            # Generate only the requested section
-            try:
-                regenerated_section = regenerate_prd_section(current_content, section_name, organized_responses)
-            except Exception as e:
-                self.send_json(503, {'error': 'AI service temporarily unavailable', 'details': str(e)})
-                return
+                span = find_section_span(current_content, section_name)
+                if not span:
+                    self.send_json(404, {'error': f'Section "{section_name}" not found in PRD'})
+                    return
+                outline = [h.strip() for h in re.findall(r'^##[ \t]+(.+)$', current_content, re.MULTILINE)
+                           if h.strip().lower() != section_name.lower()]
 
-            # Create snapshot before updating
-            snapshot_id = str(uuid.uuid4())
-            supabase.table('prd_edit_snapshots').insert({
-                'id': snapshot_id,
-                'prd_id': prd_id,
-                'project_id': project_id,
-                'snapshot_content': current_content,
-                'change_summary': f'Before regenerating {section_name}',
-                'is_major_version': False
-            }).execute()
-
-            # Update PRD with new section
-            supabase.table('generated_prds').update({
-                'content_md': regenerated_section,
-                'is_manually_edited': True
-            }).eq('id', prd_id).execute()
+                # Get responses for context
+                responses_result = supabase.table('question_responses').select('*').eq('project_id', project_id).execute()
+                responses = responses_result.data if responses_result.data else []
 
-            self.send_json(200, {
-                'success': True,
-                'message': f'Section "{section_name}" regenerated successfully',
-                'content': regenerated_section,
-                'prd_id': prd_id
-            })
-            return
+                question_map = get_question_map(load_questions())
+                organized_responses = organize_responses(responses, question_map)
 
-        elif op == 'compare':
-            # Compare two versions
-            content_length = int(self.headers.get('Content-Length', 0))
-            body = json.loads(self.rfile.read(content_length)) if content_length > 0 else {}
+                # Generate only the requested section
+                try:
+                    regenerated_section = regenerate_prd_section(
+                        current_content[span[0]:span[1]], section_name, organized_responses, outline
+                    )
+                except Exception as e:
+                    self.send_json(503, {'error': 'AI service temporarily unavailable', 'details': str(e)})
+                    return
 
-            version1_id = body.get('version1_id')
-            version2_id = body.get('version2_id')  # 'current' for current version
+                # Create snapshot before updating
+                snapshot_id = str(uuid.uuid4())
+                supabase.table('prd_edit_snapshots').insert({
+                    'id': snapshot_id,
+                    'prd_id': prd_id,
+                    'project_id': project_id,
+                    'snapshot_content': current_content,
+                    'change_summary': f'Before regenerating {section_name}',
+                    'is_major_version': False
+                }).execute()
 
-            # Get current PRD
-            result = supabase.table('generated_prds').select('*').eq('project_id', project_id).order('created_at', desc=True).limit(1).execute()
+                # Splice the new section into the stored PRD
+                updated_content = splice_section(current_content, span, regenerated_section)
+                supabase.table('generated_prds').update({
+                    'content_md': updated_content,
+                    'is_manually_edited': True
+                }).eq('id', prd_id).execute()
+                bump_generation(supabase, project_id)
 
-            if not result.data:
-                self.send_json(404, {'error': 'No PRD found'})
+                self.send_json(200, {
+                    'success': True,
+                    'message': f'Section "{section_name}" regenerated successfully',
+                    'section_name': section_name,
+                    'section_content': regenerated_section,
+                    'prd_id': prd_id
+                })
                 return
 
-            prd = result.data[0]
-            current_content = prd.get('content_md', '')
-
-            # Get version 1 content
-            if version1_id == 'current':
-                content1 = current_content
-                version1_name = 'Current Version'
-            else:
-                if not validate_uuid(version1_id):
-                    self.send_json(400, {'error': 'Invalid version1 ID'})
-                    return
-                snap1 = supabase.table('prd_edit_snapshots').select('*').eq('id', version1_id).execute()
-                if not snap1.data:
-                    self.send_json(404, {'error': 'Version 1 not found'})
-                    return
-                content1 = snap1.data[0].get('snapshot_content', '')
-                version1_name = snap1.data[0].get('version_name') or snap1.data[0].get('created_at')
+            elif op == 'compare':
+                # Compare two versions
+                content_length = int(self.headers.get('Content-Length', 0))
+                body = json.loads(self.rfile.read(content_length)) if content_length > 0 else {}
 
-            # Get version 2 content
-            if version2_id == 'current':
-                content2 = current_content
-                version2_name = 'Current Version'
-            else:
-                if not validate_uuid(version2_id):
-                    self.send_json(400, {'error': 'Invalid version2 ID'})
-                    return
-                snap2 = supabase.table('prd_edit_snapshots').select('*').eq('id', version2_id).execute()
-                if not snap2.data:
-                    self.send_json(404, {'error': 'Version 2 not found'})
-                    return
-                content2 = snap2.data[0].get('snapshot_content', '')
-                version2_name = snap2.data[0].get('version_name') or snap2.data[0].get('created_at')
+                version1_id = body.get('version1_id')
+                version2_id = body.get('version2_id')  # 'current' for current version
 
-            # Compute diff
-            diff_result = compute_diff(content1, content2)
+                # Get current PRD
+                result = supabase.table('generated_prds').select('*').eq('project_id', project_id).order('created_at', desc=True).limit(1).execute()
 
-            self.send_json(200, {
-                'version1': {'id': version1_id, 'name': version1_name, 'content': content1},
-                'version2': {'id': version2_id, 'name': version2_name, 'content': content2},
-                'diff': diff_result['diff'],
-                'stats': {
-                    'added_lines': diff_result['added_lines'],
-                    'removed_lines': diff_result['removed_lines'],
-                    'total_changes': diff_result['total_changes']
-                }
-            })
-            return
-
-        elif op == 'changelog':
-            # Generate changelog between versions
-            content_length = int(self.headers.get('Content-Length', 0))
-            body = json.loads(self.rfile.read(content_length)) if content_length > 0 else {}
+                if not result.data:
+                    self.send_json(404, {'error': 'No PRD found'})
+                    return
 
-            from_version_id = body.get('from_version_id')
-            to_version_id = body.get('to_version_id', 'current')
-            version_name = body.get('version_name')
+                prd = result.data[0]
+                current_content = prd.get('content_md', '')
 
-            # Get current PRD
-            result = supabase.table('generated_prds').select('*').eq('project_id', project_id).order('created_at', desc=True).limit(1).execute()
+                # Get version 1 content
+                if version1_id == 'current':
+                    content1 = current_content
+                    version1_name = 'Current Version'
+                else:
+                    if not validate_uuid(version1_id):
+                        self.send_json(400, {'error': 'Invalid version1 ID'})
+                        return
+                    snap1 = supabase.table('prd_edit_snapshots').select('*').eq('id', version1_id).execute()
+                    if not snap1.data:
+                        self.send_json(404, {'error': 'Version 1 not found'})
+                        return
+                    content1 = snap1.data[0].get('snapshot_content', '')
+                    version1_name = snap1.data[0].get('version_name') or snap1.data[0].get('created_at')
+
+                # Get version 2 content
+                if version2_id == 'current':
+                    content2 = current_content
+                    version2_name = 'Current Version'
+                else:
+                    if not validate_uuid(version2_id):
+                        self.send_json(400, {'error': 'Invalid version2 ID'})
+                        return
+                    snap2 = supabase.table('prd_edit_snapshots').select('*').eq('id', version2_id).execute()
+                    if not snap2.data:
+                        self.send_json(404, {'error': 'Version 2 not found'})
+                        return
+                    content2 = snap2.data[0].get('snapshot_content', '')
+                    version2_name = snap2.data[0].get('version_name') or snap2.data[0].get('created_at')
+
+                # Compute diff
+                diff_result = compute_diff(content1, content2)
 
-            if not result.data:
-                self.send_json(404, {'error': 'No PRD found'})
+                self.send_json(200, {
+                    'version1': {'id': version1_id, 'name': version1_name, 'content': content1},
+                    'version2': {'id': version2_id, 'name': version2_name, 'content': content2},
+                    'diff': diff_result['diff'],
+                    'stats': {
+                        'added_lines': diff_result['added_lines'],
+                        'removed_lines': diff_result['removed_lines'],
+                        'total_changes': diff_result['total_changes']
+                    }
+                })
                 return
 
-            prd = result.data[0]
-            current_content = prd.get('content_md', '')
+            elif op == 'changelog':
+                # Generate changelog between versions
+                content_length = int(self.headers.get('Content-Length', 0))
+                body = json.loads(self.rfile.read(content_length)) if content_length > 0 else {}
 
-            # Get from content
-            if from_version_id == 'current':
-                from_content = current_content
-            else:
-                if not validate_uuid(from_version_id):
-                    self.send_json(400, {'error': 'Invalid from_version_id'})
-                    return
-                snap = supabase.table('prd_edit_snapshots').select('snapshot_content').eq('id', from_version_id).execute()
-                if not snap.data:
-                    self.send_json(404, {'error': 'From version not found'})
-                    return
-                from_content = snap.data[0].get('snapshot_content', '')
+                from_version_id = body.get('from_version_id')
+                to_version_id = body.get('to_version_id', 'current')
+                version_name = body.get('version_name')
 
-            # Get to content
-            if to_version_id == 'current':
-                to_content = current_content
-            else:
-                if not validate_uuid(to_version_id):
-                    self.send_json(400, {'error': 'Invalid to_version_id'})
-                    return
-                snap = supabase.table('prd_edit_snapshots').select('snapshot_content').eq('id', to_version_id).execute()
-                if not snap.data:
-                    self.send_json(404, {'error': 'To version not found'})
+                # Get current PRD
+                result = supabase.table('generated_prds').select('*').eq('project_id', project_id).order('created_at', desc=True).limit(1).execute()
+
+                if not result.data:
+                    self.send_json(404, {'error': 'No PRD found'})
                     return
-                to_content = snap.data[0].get('snapshot_content', '')
 
-            # Generate changelog
-            changelog_result = generate_changelog(from_content, to_content, version_name)
+                prd = result.data[0]
+                current_content = prd.get('content_md', '')
 
-            self.send_json(200, changelog_result)
-            return
+                # Get from content
+                if from_version_id == 'current':
+                    from_content = current_content
+                else:
+                    if not validate_uuid(from_version_id):
+                        self.send_json(400, {'error': 'Invalid from_version_id'})
+                        return
+                    snap = supabase.table('prd_edit_snapshots').select('snapshot_content').eq('id', from_version_id).execute()
+                    if not snap.data:
+                        self.send_json(404, {'error': 'From version not found'})
+                        return
+                    from_content = snap.data[0].get('snapshot_content', '')
+
+                # Get to content
+                if to_version_id == 'current':
+                    to_content = current_content
+                else:
+                    if not validate_uuid(to_version_id):
+                        self.send_json(400, {'error': 'Invalid to_version_id'})
+                        return
+                    snap = supabase.table('prd_edit_snapshots').select('snapshot_content').eq('id', to_version_id).execute()
+                    if not snap.data:
+                        self.send_json(404, {'error': 'To version not found'})
+                        return
+                    to_content = snap.data[0].get('snapshot_content', '')
+
+                # Generate changelog
+                changelog_result = generate_changelog(from_content, to_content, version_name)
+
+                self.send_json(200, changelog_result)
+                return
 
         except Exception as e:
             self.send_json(500, {'error': f'Operation failed: {str(e)}'})
@@ -1,20 +1,12 @@
 from http.server import BaseHTTPRequestHandler
 import json
-import os
-from supabase import create_client
+from analytics_cache import bump_generation
+from db import get_supabase
 
 # Import authentication middleware
 from auth_middleware import require_auth, get_user_from_request, is_auth_enabled
 
 
-def get_supabase():
-    url = os.environ.get('SUPABASE_URL')
-    key = os.environ.get('SUPABASE_KEY')
-    if not url or not key:
-        raise Exception("Supabase credentials not configured")
-    return create_client(url, key)
-
-
 def cors_headers():
     return {
         'Access-Control-Allow-Origin': '*',
@@ -112,6 +104,7 @@ class handler(BaseHTTPRequestHandler):
             result = supabase.table('projects').insert(insert_data).execute()
 
             if result.data:
+                bump_generation(supabase, result.data[0]['id'])
                 self.send_json(201, result.data[0])
             else:
                 self.send_json(500, {'error': 'Failed to create project'})
@@ -139,7 +132,9 @@ class handler(BaseHTTPRequestHandler):
             query = supabase.table('projects').delete().eq('id', project_id)
             if user_id:
                 query = query.eq('user_id', user_id)
-            query.execute()
+            result = query.execute()
+            if result.data:
+                bump_generation(supabase, project_id)
 
             self.send_json(200, {'message': 'Project deleted'})
         except Exception as e:
@@ -2,12 +2,13 @@ from http.server import BaseHTTPRequestHandler
 import json
 import os
 import uuid
-from supabase import create_client
-
-try:
-    import anthropic
-except ImportError:
-    anthropic = None
+import math
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError, as_completed
+from analytics_cache import bump_generation
+from context_index import get_prompt_context, get_prompt_contexts
+from db import get_supabase, bulk_upsert
+from keyword_matcher import KeywordMatcher
+from llm import complete, get_client, is_cacheable, is_llm_available, split_system, warm_prompt_cache
 
 
 def load_questions():
@@ -21,12 +22,16 @@ def load_questions():
         return {"sections": []}
 
 
-def get_supabase():
-    url = os.environ.get('SUPABASE_URL')
-    key = os.environ.get('SUPABASE_KEY')
-    if not url or not key:
-        raise Exception("Supabase credentials not configured")
-    return create_client(url, key)
+# Prefill batching configuration
+PREFILL_BATCH_SIZE = 30
+PREFILL_MAX_WORKERS = int(os.environ.get('PREFILL_MAX_WORKERS', '5'))
+PREFILL_BATCH_TIMEOUT = float(os.environ.get('PREFILL_BATCH_TIMEOUT', '120'))
+
+# Context token budgets (chunks are ranked against each prompt's questions;
+# for prefill, separately for every batch)
+PREFILL_CONTEXT_TOKENS = 3000
+FOLLOW_UP_CONTEXT_TOKENS = 500
+SMART_SUGGEST_CONTEXT_TOKENS = 1250
 
 
 def cors_headers():
@@ -98,6 +103,10 @@ FOLLOW_UP_TRIGGERS = {
     }
 }
 
+FOLLOW_UP_MATCHER = KeywordMatcher(
+    [kw for config in FOLLOW_UP_TRIGGERS.values() for kw in config['keywords']]
+)
+
 # Skip logic rules
 SKIP_LOGIC = {
     '2.1.1': {'skip_if_contains': ['n/a', 'none', 'no competitors'], 'skip_questions': ['2.1.2', '2.1.3']},
@@ -111,22 +120,21 @@ def get_follow_up_questions(question_id, response_text):
     if not response_text:
         return []
 
-    response_lower = response_text.lower()
+    found = FOLLOW_UP_MATCHER.find(response_text)
     follow_ups = []
 
     for trigger_name, trigger_config in FOLLOW_UP_TRIGGERS.items():
-        for keyword in trigger_config['keywords']:
-            if keyword in response_lower:
-                for fu in trigger_config['follow_ups']:
-                    follow_up = {
-                        **fu,
-                        'parent_question_id': question_id,
-                        'trigger': trigger_name,
-                        'type': 'follow_up'
-                    }
-                    if follow_up not in follow_ups:
-                        follow_ups.append(follow_up)
-                break  # Only add once per trigger
+        # Only add once per trigger
+        if any(keyword in found for keyword in trigger_config['keywords']):
+            for fu in trigger_config['follow_ups']:
+                follow_up = {
+                    **fu,
+                    'parent_question_id': question_id,
+                    'trigger': trigger_name,
+                    'type': 'follow_up'
+                }
+                if follow_up not in follow_ups:
+                    follow_ups.append(follow_up)
 
     return follow_ups[:3]  # Limit to 3 follow-ups
 
@@ -148,36 +156,27 @@ def check_skip_logic(question_id, response_text):
 
 def generate_ai_follow_ups(question_text, response_text, context=''):
     """Use AI to generate contextual follow-up questions"""
-    if anthropic is None:
-        return []
-
-    api_key = os.environ.get('ANTHROPIC_API_KEY')
-    if not api_key:
+    if not is_llm_available():
         return []
 
     try:
-        client = anthropic.Anthropic(api_key=api_key)
+        # The context is retrieved for this question, so only the instructions are cacheable
+        system = split_system(
+            "You suggest follow-up questions for a product requirements questionnaire.",
+            f"\n\nAdditional Context: {context[:FOLLOW_UP_CONTEXT_TOKENS * 4] if context else 'None provided'}")
 
         prompt = f"""Based on this product question and answer, suggest 2 follow-up questions that would help clarify or expand the response.
 
 Original Question: {question_text}
 Answer Given: {response_text}
 
-Additional Context: {context[:2000] if context else 'None provided'}
-
 Return a JSON array with follow-up questions:
 [{{"id": "ai_fu_1", "question": "...", "hint": "...", "reasoning": "..."}}]
 
 Only suggest questions if the answer is substantial and could benefit from clarification. If the answer is complete, return an empty array [].
 Return ONLY the JSON array, no other text."""
 
-        message = client.messages.create(
-            model="claude-sonnet-4-20250514",
-            max_tokens=500,
-            messages=[{"role": "user", "content": prompt}]
-        )
-
-        response_text = message.content[0].text.strip()
+        response_text = complete(prompt, max_tokens=500, system=system, label='follow_ups', cache=True).strip()
         if response_text.startswith('['):
             follow_ups = json.loads(response_text)
             for fu in follow_ups:
@@ -224,6 +223,23 @@ def get_related_questions(question_id, questions_data, responses):
     return related[:3]
 
 
+def save_question_responses(supabase, project_id, responses):
+    """Upsert many question responses in bulk (UNIQUE(project_id, question_id))."""
+    rows = [{
+        'project_id': project_id,
+        'question_id': resp['question_id'],
+        'response': resp.get('response', ''),
+        'ai_suggested': resp.get('ai_suggested', False),
+        'confirmed': resp.get('confirmed', False)
+    } for resp in responses if resp.get('question_id')]
+    if not rows:
+        return []
+    saved = bulk_upsert(supabase, 'question_responses', rows, on_conflict='project_id,question_id')
+    if saved:
+        bump_generation(supabase, project_id)
+    return saved
+
+
 def get_flat_questions(questions_data):
     flat_questions = []
     for section in questions_data.get('sections', []):
@@ -238,10 +254,31 @@ def get_flat_questions(questions_data):
     return flat_questions
 
 
-def analyze_context_for_questions_batch(context, questions, selected_features=None, client=None):
-    """Process a single batch of questions."""
-    questions_text = "\n".join([f"{q['id']}: {q['question']}" for q in questions])
+def split_prefill_batches(questions):
+    # Use smaller batches (30 instead of 50) to reduce per-request latency
+    return [questions[i:i + PREFILL_BATCH_SIZE] for i in range(0, len(questions), PREFILL_BATCH_SIZE)]
+
+
+def build_prefill_query(questions):
+    """Retrieval query for one prefill batch: its question texts and hints."""
+    return '\n'.join(f"{q['question']} {q.get('hint', '')}" for q in questions)
+
+
+def get_prefill_contexts(supabase, project_id, questions):
+    """Context for each prefill batch, routed by the batch's own questions."""
+    queries = [build_prefill_query(batch) for batch in split_prefill_batches(questions)]
+    return get_prompt_contexts(supabase, project_id, queries, PREFILL_CONTEXT_TOKENS)
+
+
+def build_prefill_system(context, selected_features=None, shared_context=True):
+    """Build the system blocks of a prefill batch: instructions and features, then context.
 
+    When every batch is given the same context, the cache marker goes on the
+    context block so all batches read one cached prefix. Routed contexts
+    differ per batch, so then only the instructions + features block is
+    marked, and only if it is long enough to be cached; a per-batch prefix
+    would pay the cache-write premium and never be read back.
+    """
     features_context = ""
     if selected_features and len(selected_features) > 0:
         features_list = []
@@ -249,14 +286,25 @@ def analyze_context_for_questions_batch(context, questions, selected_features=No
             features_list.append(f"- {f.get('name', 'Unnamed')}: {f.get('description', '')[:100]}")
         features_context = "\n\nSELECTED FEATURES:\n" + "\n".join(features_list)
 
-    max_context_length = 12000
+    max_context_length = PREFILL_CONTEXT_TOKENS * 4
     truncated_context = context[:max_context_length]
 
-    prompt = f"""Based on the product context and features below, answer these product questions concisely.
+    blocks = [
+        {"type": "text", "text": f"You answer product questions using the product features and context below.{features_context}"},
+        {"type": "text", "text": f"\n\nCONTEXT:\n{truncated_context}"}
+    ]
+    marked = 1 if shared_context else 0
+    if is_cacheable(''.join(block['text'] for block in blocks[:marked + 1])):
+        blocks[marked]['cache_control'] = {"type": "ephemeral"}
+    return blocks
 
-CONTEXT:
-{truncated_context}
-{features_context}
+
+def analyze_context_for_questions_batch(context, questions, selected_features=None, timeout=None, shared_context=True):
+    """Process a single batch of questions."""
+    questions_text = "\n".join([f"{q['id']}: {q['question']}" for q in questions])
+    system = build_prefill_system(context, selected_features, shared_context)
+
+    prompt = f"""Based on the product context and features, answer these product questions concisely.
 
 QUESTIONS:
 {questions_text}
@@ -266,13 +314,8 @@ For each question, provide a brief answer based on context and features. Use emp
 Return JSON array only:
 [{{"question_id": "1.1.1", "suggested_answer": "answer", "confidence": "high/medium/low", "source_hint": "brief source"}}]"""
 
-    message = client.messages.create(
-        model="claude-sonnet-4-20250514",
-        max_tokens=4000,
-        messages=[{"role": "user", "content": prompt}]
-    )
-
-    response_text = message.content[0].text.strip()
+    response_text = complete(prompt, max_tokens=4000, system=system,
+                             timeout=timeout, label='prefill_batch', cache=True).strip()
     try:
         if response_text.startswith('['):
             return json.loads(response_text)
@@ -285,35 +328,148 @@ Return JSON array only:
     return []
 
 
-def analyze_context_for_questions(context, questions, selected_features=None):
-    """Analyze context and features to generate answers for ALL questions."""
-    if anthropic is None:
-        raise Exception("Anthropic library not available")
-    api_key = os.environ.get('ANTHROPIC_API_KEY')
-    if not api_key:
-        raise Exception("Anthropic API key not configured")
+def analyze_context_for_questions(context, questions, selected_features=None, completed=None, on_batch_done=None):
+    """Analyze context and features to generate answers for ALL questions.
 
-    client = anthropic.Anthropic(api_key=api_key)
+    context is either one string used by every batch, or a list with one
+    string per batch (see get_prefill_contexts()).
 
-    # Use smaller batches (30 instead of 50) to reduce per-request latency
-    # This ensures faster completion of each batch and better progress updates
-    batch_size = 30
-    all_responses = []
+    Batches are sent concurrently through a bounded thread pool (the LLM
+    gateway still enforces the process-wide rate limits). A failed or timed
+    out batch is skipped; the remaining answers are returned in question order.
 
-    for i in range(0, len(questions), batch_size):
-        batch = questions[i:i + batch_size]
+    completed maps batch index -> answers of batches finished earlier (e.g.
+    by an interrupted job), which are not sent again; on_batch_done(index,
+    answers) is called as each new batch finishes.
+    """
+    # Fail fast if the AI service is not configured (batch errors are swallowed below)
+    get_client()
+
+    batches = split_prefill_batches(questions)
+    if not batches:
+        return []
+    contexts = [context] * len(batches) if isinstance(context, str) else context
+    batch_results = [[] for _ in batches]
+    for idx, answers in (completed or {}).items():
+        if idx < len(batches):
+            batch_results[idx] = answers
+    pending = [idx for idx in range(len(batches)) if idx not in (completed or {})]
+    if not pending:
+        return _order_responses(questions, batch_results)
+
+    # Concurrent batches sharing a fresh prefix would all miss the prompt
+    # cache; write the marked prefix once first so every batch reads it
+    shared_context = len(set(contexts[idx] for idx in pending)) == 1
+    system = build_prefill_system(contexts[pending[0]], selected_features, shared_context)
+    marked = [i for i, block in enumerate(system) if 'cache_control' in block]
+    if len(pending) > 1 and marked:
         try:
-            batch_responses = analyze_context_for_questions_batch(
-                context, batch, selected_features, client
-            )
-            all_responses.extend(batch_responses)
+            warm_prompt_cache(system[:marked[0] + 1], label='prefill_warm')
         except Exception as e:
-            print(f"Error processing batch {i//batch_size + 1}: {e}")
-            continue
+            print(f"Prompt cache warm-up failed: {e}")
 
+    max_workers = min(PREFILL_MAX_WORKERS, len(pending))
+    # Batches queued behind a full pool start late, so allow one timeout per wave
+    overall_timeout = PREFILL_BATCH_TIMEOUT * math.ceil(len(pending) / max_workers)
+
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        futures = {
+            executor.submit(analyze_context_for_questions_batch, contexts[idx], batches[idx], selected_features,
+                            PREFILL_BATCH_TIMEOUT, shared_context): idx
+            for idx in pending
+        }
+        try:
+            for future in as_completed(futures, timeout=overall_timeout):
+                idx = futures[future]
+                try:
+                    batch_results[idx] = future.result()
+                except Exception as e:
+                    print(f"Error processing batch {idx + 1}: {e}")
+                    continue
+                if on_batch_done:
+                    on_batch_done(idx, batch_results[idx])
+        except FuturesTimeoutError:
+            for future, idx in futures.items():
+                if not future.done():
+                    print(f"Batch {idx + 1} timed out after {overall_timeout}s")
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    return _order_responses(questions, batch_results)
+
+
+def _order_responses(questions, batch_results):
+    question_order = {q['id']: i for i, q in enumerate(questions)}
+    all_responses = [resp for batch in batch_results for resp in batch]
+    all_responses.sort(key=lambda r: question_order.get(r.get('question_id'), len(question_order)))
     return all_responses
 
 
+def save_prefill_answers(supabase, project_id, ai_responses):
+    """Save AI answers as unconfirmed suggestions and return the saved ones with their confidence"""
+    suggestions = [
+        {'question_id': r.get('question_id'), 'response': r.get('suggested_answer', ''), 'ai_suggested': True, 'confirmed': False}
+        for r in ai_responses if r.get('question_id') and r.get('suggested_answer')
+    ]
+    saved_rows = save_question_responses(supabase, project_id, suggestions)
+    saved_ids = {row.get('question_id') for row in saved_rows}
+    confidence = {r.get('question_id'): r.get('confidence', 'low') for r in ai_responses}
+    return [
+        {'question_id': s['question_id'], 'response': s['response'], 'confidence': confidence.get(s['question_id'], 'low')}
+        for s in suggestions if s['question_id'] in saved_ids
+    ]
+
+
+def run_prefill_job(supabase, job):
+    """
+    Job runner for 'prefill' (see jobs.py and worker.py).
+
+    Each finished batch is saved and checkpointed right away, so partial
+    answers appear while the job runs and a retried job only sends the
+    batches that had not finished.
+    """
+    project_id = job.project_id
+    flat_questions = get_flat_questions(load_questions())
+    if not flat_questions:
+        raise Exception('No questions found to process')
+
+    features_result = supabase.table('features').select('name, description').eq('project_id', project_id).eq('is_selected', True).execute()
+    selected_features = features_result.data if features_result.data else []
+
+    contexts = get_prefill_contexts(supabase, project_id, flat_questions)
+    if not any(context.strip() for context in contexts):
+        raise Exception('No context available. Please upload context files first.')
+
+    completed = {int(idx): answers for idx, answers in job.checkpoint.get('batches', {}).items()}
+    saved_count = job.checkpoint.get('saved', 0)
+    total = len(contexts)
+    job.report(completed=len(completed), total=total, message='Answering questions')
+
+    def on_batch_done(idx, answers):
+        nonlocal saved_count
+        saved_count += len(save_prefill_answers(supabase, project_id, answers))
+        completed[idx] = answers
+        job.save_checkpoint({'batches': completed, 'saved': saved_count}, completed=len(completed), total=total,
+                            partial={'saved': saved_count})
+
+    ai_responses = analyze_context_for_questions(contexts, flat_questions, selected_features,
+                                                 completed=completed, on_batch_done=on_batch_done)
+    unfinished = total - len(completed)
+    if unfinished and job.attempts < job.max_attempts:
+        # Keep what finished; the retry resumes from the checkpoint
+        raise Exception(f"{unfinished} of {total} batches did not finish")
+    if not ai_responses:
+        raise Exception('AI could not generate responses')
+
+    confidence = {r.get('question_id'): r.get('confidence', 'low') for r in ai_responses}
+    responses = [
+        {'question_id': r['question_id'], 'response': r['suggested_answer'], 'confidence': confidence[r['question_id']]}
+        for r in ai_responses if r.get('question_id') and r.get('suggested_answer')
+    ]
+    return {'message': f'AI prefilled {len(responses)} questions', 'responses': responses, 'unfinished_batches': unfinished}
+
+
 class handler(BaseHTTPRequestHandler):
     def send_cors_headers(self):
         for key, value in cors_headers().items():
@@ -393,32 +549,13 @@ class handler(BaseHTTPRequestHandler):
                 if not responses:
                     self.send_json(400, {'error': 'No responses provided'})
                     return
-                saved = []
-                for resp in responses:
-                    q_id = resp.get('question_id')
-                    if not q_id:
-                        continue
-                    existing = supabase.table('question_responses').select('*').eq('project_id', project_id).eq('question_id', q_id).execute()
-                    response_data = {'project_id': project_id, 'question_id': q_id, 'response': resp.get('response', ''), 'ai_suggested': resp.get('ai_suggested', False), 'confirmed': resp.get('confirmed', False)}
-                    if existing.data:
-                        result = supabase.table('question_responses').update(response_data).eq('id', existing.data[0]['id']).execute()
-                    else:
-                        response_data['id'] = str(uuid.uuid4())
-                        result = supabase.table('question_responses').insert(response_data).execute()
-                    if result.data:
-                        saved.append(result.data[0])
+                saved = save_question_responses(supabase, project_id, responses)
                 self.send_json(200, {'message': f'Saved {len(saved)} responses', 'responses': saved})
 
             elif op == 'response' and question_id:
-                existing = supabase.table('question_responses').select('*').eq('project_id', project_id).eq('question_id', question_id).execute()
-                response_data = {'project_id': project_id, 'question_id': question_id, 'response': data.get('response', ''), 'ai_suggested': data.get('ai_suggested', False), 'confirmed': data.get('confirmed', False)}
-                if existing.data:
-                    result = supabase.table('question_responses').update(response_data).eq('id', existing.data[0]['id']).execute()
-                else:
-                    response_data['id'] = str(uuid.uuid4())
-                    result = supabase.table('question_responses').insert(response_data).execute()
-                if result.data:
-                    self.send_json(200, result.data[0])
+                saved = save_question_responses(supabase, project_id, [{**data, 'question_id': question_id}])
+                if saved:
+                    self.send_json(200, saved[0])
                 else:
                     self.send_json(500, {'error': 'Failed to save response'})
             else:
@@ -438,14 +575,6 @@ class handler(BaseHTTPRequestHandler):
             supabase = get_supabase()
 
             if op == 'prefill':
-                context_result = supabase.table('context_files').select('extracted_text').eq('project_id', project_id).execute()
-                context_texts = [f.get('extracted_text', '') for f in (context_result.data or []) if f.get('extracted_text')]
-                context = '\n\n---\n\n'.join(context_texts)
-
-                if not context.strip():
-                    self.send_json(400, {'error': 'No context available. Please upload context files first.'})
-                    return
-
                 questions_data = load_questions()
                 flat_questions = get_flat_questions(questions_data)
                 if not flat_questions:
@@ -455,8 +584,13 @@ class handler(BaseHTTPRequestHandler):
                 features_result = supabase.table('features').select('name, description').eq('project_id', project_id).eq('is_selected', True).execute()
                 selected_features = features_result.data if features_result.data else []
 
+                contexts = get_prefill_contexts(supabase, project_id, flat_questions)
+                if not any(context.strip() for context in contexts):
+                    self.send_json(400, {'error': 'No context available. Please upload context files first.'})
+                    return
+
                 try:
-                    ai_responses = analyze_context_for_questions(context, flat_questions, selected_features)
+                    ai_responses = analyze_context_for_questions(contexts, flat_questions, selected_features)
                 except Exception as e:
                     self.send_json(503, {'error': 'AI service temporarily unavailable', 'details': str(e)})
                     return
@@ -465,21 +599,7 @@ class handler(BaseHTTPRequestHandler):
                     self.send_json(422, {'error': 'AI could not generate responses'})
                     return
 
-                saved_responses = []
-                for ai_resp in ai_responses:
-                    q_id = ai_resp.get('question_id')
-                    suggested = ai_resp.get('suggested_answer', '')
-                    if not q_id or not suggested:
-                        continue
-                    existing = supabase.table('question_responses').select('*').eq('project_id', project_id).eq('question_id', q_id).execute()
-                    response_data = {'project_id': project_id, 'question_id': q_id, 'response': suggested, 'ai_suggested': True, 'confirmed': False}
-                    if existing.data:
-                        result = supabase.table('question_responses').update(response_data).eq('id', existing.data[0]['id']).execute()
-                    else:
-                        response_data['id'] = str(uuid.uuid4())
-                        result = supabase.table('question_responses').insert(response_data).execute()
-                    if result.data:
-                        saved_responses.append({'question_id': q_id, 'response': suggested, 'confidence': ai_resp.get('confidence', 'low')})
+                saved_responses = save_prefill_answers(supabase, project_id, ai_responses)
 
                 self.send_json(200, {'message': f'AI prefilled {len(saved_responses)} questions', 'responses': saved_responses})
 
@@ -496,6 +616,7 @@ class handler(BaseHTTPRequestHandler):
 
                 result = supabase.table('question_responses').update({'confirmed': confirmed}).eq('id', existing.data[0]['id']).execute()
                 if result.data:
+                    bump_generation(supabase, project_id)
                     self.send_json(200, result.data[0])
                 else:
                     self.send_json(500, {'error': 'Failed to confirm response'})
@@ -525,8 +646,8 @@ class handler(BaseHTTPRequestHandler):
                 # Optionally generate AI follow-ups
                 ai_follow_ups = []
                 if include_ai and response_text and len(response_text) > 50:
-                    context_result = supabase.table('context_files').select('extracted_text').eq('project_id', project_id).limit(3).execute()
-                    context = '\n'.join([f.get('extracted_text', '')[:2000] for f in (context_result.data or [])])
+                    context = get_prompt_context(supabase, project_id, f"{question_text}\n{response_text}",
+                                                 FOLLOW_UP_CONTEXT_TOKENS)
                     ai_follow_ups = generate_ai_follow_ups(question_text, response_text, context)
 
                 self.send_json(200, {
@@ -578,6 +699,7 @@ class handler(BaseHTTPRequestHandler):
                     result = supabase.table('question_responses').insert(response_data).execute()
 
                 if result.data:
+                    bump_generation(supabase, project_id)
                     self.send_json(200, result.data[0])
                 else:
                     self.send_json(500, {'error': 'Failed to save follow-up response'})
@@ -590,9 +712,8 @@ class handler(BaseHTTPRequestHandler):
 
                 question_text = data.get('question', '')
 
-                # Get context
-                context_result = supabase.table('context_files').select('extracted_text').eq('project_id', project_id).execute()
-                context = '\n'.join([f.get('extracted_text', '')[:3000] for f in (context_result.data or [])])
+                # Get the context chunks most relevant to the question
+                context = get_prompt_context(supabase, project_id, question_text, SMART_SUGGEST_CONTEXT_TOKENS)
 
                 # Get other responses for context
                 responses_result = supabase.table('question_responses').select('*').eq('project_id', project_id).execute()
@@ -604,20 +725,20 @@ class handler(BaseHTTPRequestHandler):
                     for r in other_responses if r.get('response')
                 ][:10])
 
-                if anthropic is None or not os.environ.get('ANTHROPIC_API_KEY'):
+                if not is_llm_available():
                     self.send_json(503, {'error': 'AI service not available'})
                     return
 
                 try:
-                    client = anthropic.Anthropic(api_key=os.environ.get('ANTHROPIC_API_KEY'))
+                    # The context is retrieved for this question, so only the instructions are cacheable
+                    system = split_system(
+                        "You suggest answers to product requirements questions for one project.",
+                        f"\n\nContext Documents (excerpt):\n{context[:SMART_SUGGEST_CONTEXT_TOKENS * 4]}")
 
                     prompt = f"""Based on the context and previous answers, suggest an answer for this question.
 
 Question: {question_text}
 
-Context Documents (excerpt):
-{context[:5000]}
-
 Previous Answers:
 {responses_context}
 
@@ -629,13 +750,8 @@ Provide a suggested answer that is:
 Return JSON: {{"suggested_answer": "...", "confidence": "high/medium/low", "reasoning": "..."}}
 Return ONLY the JSON, no other text."""
 
-                    message = client.messages.create(
-                        model="claude-sonnet-4-20250514",
-                        max_tokens=500,
-                        messages=[{"role": "user", "content": prompt}]
-                    )
-
-                    response_text = message.content[0].text.strip()
+                    response_text = complete(prompt, max_tokens=500, system=system,
+                                             label='smart_suggest', cache=True).strip()
                     if response_text.startswith('{'):
                         suggestion = json.loads(response_text)
                         self.send_json(200, suggestion)
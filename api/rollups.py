@@ -0,0 +1,39 @@
+"""
+Analytics Rollup Rebuild for PM Clarity API
+
+The analytics rollup tables (migrations/012_analytics_rollups.sql) are kept
+up to date by triggers. This rebuilds them from the source tables, e.g.
+after a bulk import that bypassed the triggers or to check for drift:
+
+    python api/rollups.py                       # rebuild all rollups
+    python api/rollups.py --project PROJECT_ID  # rebuild one project's rollup
+"""
+
+import argparse
+import os
+import sys
+import time
+
+# Modules import each other by name, as they do when deployed as functions
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from db import get_supabase
+from analytics import rebuild_rollups, validate_uuid
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Rebuild the analytics rollup tables')
+    parser.add_argument('--project', help='Only rebuild the rollup of this project')
+    args = parser.parse_args(argv)
+
+    if args.project and not validate_uuid(args.project):
+        parser.error('--project must be a project ID')
+
+    started = time.time()
+    rows = rebuild_rollups(get_supabase(), args.project)
+    print(f"Rebuilt {rows} project rollup(s) in {time.time() - started:.1f}s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,19 +1,11 @@
 from http.server import BaseHTTPRequestHandler
 import json
-import os
 import uuid
 import secrets
 import hashlib
 from urllib.parse import parse_qs, urlparse
-from supabase import create_client
-
-
-def get_supabase():
-    url = os.environ.get('SUPABASE_URL')
-    key = os.environ.get('SUPABASE_KEY')
-    if not url or not key:
-        raise Exception("Supabase credentials not configured")
-    return create_client(url, key)
+from analytics_cache import record_view
+from db import get_supabase
 
 
 def cors_headers():
@@ -168,6 +160,8 @@ class handler(BaseHTTPRequestHandler):
 
                 # Log activity
                 log_activity(supabase, share['prd_id'], 'viewed', metadata={'via': 'share_link'})
+                # Views are counted in the cached activity series
+                record_view(supabase, prd['project_id'])
 
                 # Get comments if access allows
                 comments = []
@@ -1,13 +1,8 @@
 from http.server import BaseHTTPRequestHandler
 import json
-import os
 import uuid
-from supabase import create_client
-
-try:
-    import anthropic
-except ImportError:
-    anthropic = None
+from db import get_supabase
+from llm import complete, is_llm_available
 
 
 STAKEHOLDER_PROFILES = {
@@ -118,14 +113,6 @@ STAKEHOLDER_PROFILES = {
 }
 
 
-def get_supabase():
-    url = os.environ.get('SUPABASE_URL')
-    key = os.environ.get('SUPABASE_KEY')
-    if not url or not key:
-        raise Exception("Supabase credentials not configured")
-    return create_client(url, key)
-
-
 def cors_headers():
     return {
         'Access-Control-Allow-Origin': '*',
@@ -202,11 +189,7 @@ def filter_prd_for_stakeholder(prd_content, role):
 
 def generate_stakeholder_summary(prd_content, role, project_name=''):
     """Generate a role-specific summary using AI"""
-    if anthropic is None:
-        return None
-
-    api_key = os.environ.get('ANTHROPIC_API_KEY')
-    if not api_key:
+    if not is_llm_available():
         return None
 
     if role not in STAKEHOLDER_PROFILES:
@@ -215,8 +198,6 @@ def generate_stakeholder_summary(prd_content, role, project_name=''):
     profile = STAKEHOLDER_PROFILES[role]
 
     try:
-        client = anthropic.Anthropic(api_key=api_key)
-
         prompt = f"""Based on the following PRD for "{project_name}", {profile['summary_prompt']}
 
 PRD Content:
@@ -227,13 +208,7 @@ Focus only on information relevant to the {profile['name']} team.
 Include specific details, metrics, and actionable items where available.
 """
 
-        message = client.messages.create(
-            model="claude-sonnet-4-20250514",
-            max_tokens=1500,
-            messages=[{"role": "user", "content": prompt}]
-        )
-
-        return message.content[0].text.strip()
+        return complete(prompt, max_tokens=1500, cache=True).strip()
     except Exception as e:
         print(f"Stakeholder summary generation error: {e}")
         return None
@@ -0,0 +1,135 @@
+"""
+Job Worker for PM Clarity API
+
+Runs the background jobs queued through /api/jobs (see jobs.py). Start one
+or more workers as plain processes with the same environment as the API:
+
+    python api/worker.py                              # run until interrupted
+    python api/worker.py --once                       # run what is runnable now, then exit
+    python api/worker.py --types prefill generate_prd # only some job types
+
+Workers claim jobs with SKIP LOCKED, so any number can run side by side.
+While a job runs its lock is refreshed in the background; if the worker
+dies, another one takes the job over after JOB_LOCK_TIMEOUT and resumes it
+from its checkpoint.
+
+Configuration (environment variables):
+    JOB_POLL_INTERVAL   Seconds to wait when no job is runnable (default 2)
+"""
+
+import argparse
+import os
+import socket
+import sys
+import threading
+import time
+import uuid
+
+# Modules import each other by name, as they do when deployed as functions
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from db import get_pool_stats, get_supabase
+from llm import get_usage_stats
+from jobs import JOB_LOCK_TIMEOUT, JOB_TYPES, JobLost, claim_job, fail_job, finish_job, release_job
+from context import run_analyze_context_job
+from feedback import run_improve_prd_job
+from features import run_extract_features_job
+from prd import run_generate_prd_job
+from questions import run_prefill_job
+
+JOB_POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL', '2'))
+
+JOB_RUNNERS = {
+    'prefill': run_prefill_job,
+    'extract_features': run_extract_features_job,
+    'generate_prd': run_generate_prd_job,
+    'improve_prd': run_improve_prd_job,
+    'analyze_context': run_analyze_context_job
+}
+
+
+def _keep_lock(job, stop):
+    """Refresh the job's lock until stop is set (long model calls report no progress)."""
+    while not stop.wait(JOB_LOCK_TIMEOUT / 3):
+        try:
+            job.heartbeat()
+        except JobLost:
+            print(f"Job {job.id} was cancelled or taken over; its result will be discarded")
+            return
+        except Exception as e:
+            print(f"Heartbeat failed for job {job.id}: {e}")
+
+
+def run_job(supabase, job):
+    """Run one claimed job and record its outcome."""
+    runner = JOB_RUNNERS.get(job.job_type)
+    if runner is None:
+        fail_job(job, f"No runner for job type: {job.job_type}")
+        return
+    if job.attempts > job.max_attempts:
+        # Taken over after its worker died on the last attempt
+        fail_job(job, 'Job stopped responding too many times')
+        return
+
+    print(f"Running {job.job_type} job {job.id} (attempt {job.attempts}/{job.max_attempts})")
+    stop = threading.Event()
+    threading.Thread(target=_keep_lock, args=(job, stop), daemon=True).start()
+    started = time.time()
+    try:
+        result = runner(supabase, job)
+        finish_job(job, result)
+        print(f"Job {job.id} succeeded in {time.time() - started:.1f}s")
+    except JobLost as e:
+        print(str(e))
+    except KeyboardInterrupt:
+        release_job(job)
+        raise
+    except Exception as e:
+        retry = fail_job(job, e)
+        print(f"Job {job.id} failed ({'will retry' if retry else 'giving up'}): {e}")
+    finally:
+        stop.set()
+        _log_usage()
+        _log_pool()
+
+
+def _log_usage():
+    """Print this worker's running LLM token totals, cached vs uncached."""
+    stats = get_usage_stats()
+    print(f"LLM totals: requests={stats['requests']} input={stats['input_tokens']} "
+          f"cache_read={stats['cache_read_input_tokens']} "
+          f"cache_creation={stats['cache_creation_input_tokens']} "
+          f"output={stats['output_tokens']} cache_read_ratio={stats['prompt_cache_read_ratio']}")
+
+
+def _log_pool():
+    """Print how often this worker reused its Supabase client."""
+    stats = get_pool_stats()
+    print(f"DB client: created={stats['clients_created']} reuses={stats['client_reuses']} "
+          f"reuse_ratio={stats['reuse_ratio']} age={stats['client_age_seconds']}s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run queued PM Clarity background jobs')
+    parser.add_argument('--once', action='store_true', help='exit when no job is runnable')
+    parser.add_argument('--types', nargs='+', choices=JOB_TYPES, help='only run these job types')
+    args = parser.parse_args(argv)
+
+    worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+    supabase = get_supabase()
+    print(f"Worker {worker_id} started")
+    try:
+        while True:
+            job = claim_job(supabase, worker_id, args.types)
+            if job is None:
+                if args.once:
+                    break
+                time.sleep(JOB_POLL_INTERVAL)
+                continue
+            run_job(supabase, job)
+    except KeyboardInterrupt:
+        print(f"Worker {worker_id} stopped")
+
+
+if __name__ == '__main__':
+    main()
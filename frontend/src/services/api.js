@@ -123,6 +123,71 @@ export const prdApi = {
   changelog: (projectId, fromVersionId, toVersionId, versionName) => api.post(`/prd/changelog/${projectId}`, { from_version_id: fromVersionId, to_version_id: toVersionId, version_name: versionName })
 }
 
+// Read a server-sent event block ("event: x\ndata: {...}"); comments (heartbeats) have no event
+function parseEvent(block) {
+  let event = null
+  const data = []
+  for (const line of block.split('\n')) {
+    if (line.startsWith('event:')) event = line.slice(6).trim()
+    else if (line.startsWith('data:')) data.push(line.slice(5).trim())
+  }
+  return { event, data: data.length ? JSON.parse(data.join('\n')) : {} }
+}
+
+// Generate a PRD over /prd/generate-stream (events: start, delta, done, error).
+// EventSource can't POST or send the auth header, so the stream is read with fetch.
+// onDelta(text) gets each Markdown chunk; resolves with the done event's data.
+// Errors set `started` once any event arrived, and `response` (as axios does) for HTTP errors.
+export async function streamPRD(projectId, { onDelta } = {}) {
+  const { useAuthStore } = await import('../stores/authStore')
+  const authStore = useAuthStore()
+  const token = await authStore.getIdToken()
+
+  const response = await fetch(`${API_BASE}/prd/generate-stream/${projectId}`, {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json',
+      ...(token ? { Authorization: `Bearer ${token}` } : {})
+    }
+  })
+  if (!response.ok || !response.body) {
+    if (response.status === 401) await authStore.signOut()
+    const error = new Error(`Request failed with status code ${response.status}`)
+    error.started = false
+    error.response = { status: response.status, data: await response.json().catch(() => ({})) }
+    throw error
+  }
+
+  const reader = response.body.pipeThrough(new TextDecoderStream()).getReader()
+  let buffer = ''
+  let started = false
+  for (;;) {
+    const { value, done } = await reader.read()
+    if (done) break
+    buffer += value
+
+    let end
+    while ((end = buffer.indexOf('\n\n')) !== -1) {
+      const { event, data } = parseEvent(buffer.slice(0, end))
+      buffer = buffer.slice(end + 2)
+      if (!event) continue
+      started = true
+
+      if (event === 'delta' && onDelta) onDelta(data.text)
+      else if (event === 'done') return data
+      else if (event === 'error') {
+        const error = new Error(data.details ? `${data.error}: ${data.details}` : data.error)
+        error.started = true
+        throw error
+      }
+    }
+  }
+
+  const error = new Error('PRD stream ended before the PRD was saved')
+  error.started = started
+  throw error
+}
+
 // Sharing API
 export const shareApi = {
   create: (projectId, options) => api.post(`/share/create/${projectId}`, options),
@@ -156,11 +221,35 @@ export const feedbackApi = {
   improveWithFeedback: (projectId) => api.post(`/feedback/improve/${projectId}`)
 }
 
+// Background Jobs API (long-running AI operations run by the worker)
+// jobType: prefill | extract_features | generate_prd | improve_prd | analyze_context
+export const jobsApi = {
+  enqueue: (jobType, projectId, params = {}) => api.post('/jobs', { job_type: jobType, project_id: projectId, params }),
+  get: (jobId) => api.get(`/jobs/${jobId}`),
+  listForProject: (projectId) => api.get(`/jobs/project/${projectId}`),
+  cancel: (jobId) => api.post(`/jobs/${jobId}/cancel`)
+}
+
+// Poll a job until it finishes; resolves with the finished job, rejects if it failed or was cancelled
+export async function waitForJob(jobId, { interval = 2000, onProgress } = {}) {
+  for (;;) {
+    const { data: job } = await jobsApi.get(jobId)
+    if (onProgress) onProgress(job)
+    if (job.status === 'succeeded') return job
+    if (job.status === 'failed' || job.status === 'cancelled') {
+      throw new Error(job.error || `Job ${job.status}`)
+    }
+    await new Promise(resolve => setTimeout(resolve, interval))
+  }
+}
+
 // Analytics API
 export const analyticsApi = {
   getOverview: () => api.get('/analytics/overview'),
   getProjectAnalytics: (projectId) => api.get(`/analytics/project/${projectId}`),
-  getTimeline: (projectId) => api.get(`/analytics/timeline/${projectId}`)
+  getTimeline: (projectId) => api.get(`/analytics/timeline/${projectId}`),
+  // params: { bucket: 'hour' | 'day' | 'week', start, end, project_id, cursor }
+  getSeries: (params = {}) => api.get('/analytics/series', { params })
 }
 
 export default api
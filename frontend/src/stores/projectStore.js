@@ -1,5 +1,5 @@
 import { defineStore } from 'pinia'
-import { projectsApi, contextApi, featuresApi, questionsApi, prdApi, templatesApi } from '../services/api'
+import { projectsApi, contextApi, featuresApi, questionsApi, prdApi, templatesApi, streamPRD } from '../services/api'
 
 // Helper function to extract error message from API response
 function getErrorMessage(error, defaultMessage = 'An error occurred') {
@@ -25,6 +25,24 @@ function isServerError(error) {
   return error.response?.status >= 500
 }
 
+// Helper function to replace the body of a "## Section" in PRD markdown
+// (mirrors find_section_span/splice_section in api/prd.py)
+function spliceSection(markdown, sectionName, sectionContent) {
+  if (!markdown) return markdown
+  const escaped = sectionName.trim().replace(/[.*+?^${}()|[\]\\]/g, '\\$&')
+  const header = new RegExp(`^##[ \\t]+${escaped}[ \\t]*$`, 'im')
+  const match = header.exec(markdown)
+  if (!match) return markdown
+
+  const bodyStart = match.index + match[0].length
+  const rest = markdown.slice(bodyStart)
+  const next = /^#{1,2}[ \t]+\S/m.exec(rest)
+  const bodyEnd = next ? bodyStart + next.index : markdown.length
+  const tail = markdown.slice(bodyEnd)
+
+  return `${markdown.slice(0, bodyStart)}\n\n${sectionContent.trim()}\n${tail ? '\n' + tail : ''}`
+}
+
 export const useProjectStore = defineStore('project', {
   state: () => ({
     // Projects
@@ -499,10 +517,9 @@ export const useProjectStore = defineStore('project', {
       this.setLoading(true, 'generatePRD')
 
       try {
-        const response = await prdApi.generate(this.currentProject.id)
-        this.prd = response.data?.content || ''
+        const result = await this.requestPRD()
         this.showToast('PRD generated successfully', 'success')
-        return response.data
+        return result
       } catch (error) {
         console.error('Failed to generate PRD:', error)
 
@@ -520,6 +537,37 @@ export const useProjectStore = defineStore('project', {
       }
     },
 
+    // Stream the PRD into this.prd as it is written. Falls back to the blocking
+    // endpoint when the stream can't be opened (e.g. a proxy that blocks SSE);
+    // a stream that fails part-way restores the previous PRD.
+    async requestPRD() {
+      const projectId = this.currentProject.id
+      const previous = this.prd
+      let content = ''
+
+      try {
+        const result = await streamPRD(projectId, {
+          onDelta: (text) => {
+            content += text
+            this.prd = content
+          }
+        })
+        return { ...result, content }
+      } catch (error) {
+        if (error.started) {
+          this.prd = previous
+          throw error
+        }
+        const status = error.response?.status
+        if (status && status < 500 && status !== 404 && status !== 405) throw error
+        console.warn('PRD stream unavailable, generating without streaming:', error)
+      }
+
+      const response = await prdApi.generate(projectId)
+      this.prd = response.data?.content || ''
+      return response.data
+    },
+
     // Generate PRD without triggering global loading overlay (component handles its own loading state)
     async generatePRDWithoutLoading() {
       if (!this.currentProject) {
@@ -528,10 +576,9 @@ export const useProjectStore = defineStore('project', {
       }
 
       try {
-        const response = await prdApi.generate(this.currentProject.id)
-        this.prd = response.data?.content || ''
+        const result = await this.requestPRD()
         this.showToast('PRD generated successfully', 'success')
-        return response.data
+        return result
       } catch (error) {
         console.error('Failed to generate PRD:', error)
 
@@ -738,8 +785,11 @@ export const useProjectStore = defineStore('project', {
 
       try {
         const response = await prdApi.regenerateSection(this.currentProject.id, sectionName)
-        // API returns { content: regenerated_prd, ... }
-        this.prd = response.data?.content || response.data?.content_md || this.prd
+        // API returns only the regenerated section; splice it into the local copy
+        const sectionContent = response.data?.section_content
+        if (sectionContent) {
+          this.prd = spliceSection(this.prd, response.data.section_name || sectionName, sectionContent)
+        }
         this.showToast(`Section "${sectionName}" regenerated`, 'success')
         return response.data
       } catch (error) {
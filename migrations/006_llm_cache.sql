@@ -0,0 +1,21 @@
+-- LLM response cache
+-- Content-addressed store for Claude responses, keyed by a SHA-256
+-- fingerprint of model, max_tokens and the full request (see api/cache.py)
+CREATE TABLE IF NOT EXISTS llm_cache (
+    cache_key TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    response_text TEXT NOT NULL,
+    created_at TIMESTAMPTZ DEFAULT NOW(),
+    expires_at TIMESTAMPTZ NOT NULL
+);
+
+-- Index for expiry purges
+CREATE INDEX IF NOT EXISTS idx_llm_cache_expires ON llm_cache(expires_at);
+
+-- Enable RLS
+ALTER TABLE llm_cache ENABLE ROW LEVEL SECURITY;
+
+-- RLS policies for llm_cache (accessed only by the API)
+DROP POLICY IF EXISTS "Enable all access for llm_cache" ON llm_cache;
+CREATE POLICY "Enable all access for llm_cache" ON llm_cache
+    FOR ALL USING (true) WITH CHECK (true);
@@ -0,0 +1,10 @@
+-- Content-hash deduplication for context files
+-- SHA-256 of the uploaded bytes; uploads with a known hash reuse the
+-- earlier extraction and storage object (see api/context.py)
+ALTER TABLE context_files ADD COLUMN IF NOT EXISTS content_hash TEXT;
+
+-- Index for hash lookups at upload time
+CREATE INDEX IF NOT EXISTS idx_context_files_content_hash ON context_files(content_hash) WHERE content_hash IS NOT NULL;
+
+-- Index for shared storage object checks on delete
+CREATE INDEX IF NOT EXISTS idx_context_files_file_url ON context_files(file_url);
@@ -0,0 +1,6 @@
+-- Per-file context analysis
+-- Keyword counts, entities and length computed once at upload time
+-- (see analyze_file_text in api/context.py); project-level analysis merges
+-- these instead of re-reading extracted_text. Rows with NULL analysis are
+-- backfilled on the next analyze call.
+ALTER TABLE context_files ADD COLUMN IF NOT EXISTS analysis JSONB;
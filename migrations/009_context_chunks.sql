@@ -0,0 +1,27 @@
+-- Context chunk index
+-- Each context file is split into chunks at upload time, stored with their
+-- term frequencies; prompt builders rank a project's chunks with BM25 and
+-- send the best ones within a token budget (see api/context_index.py)
+CREATE TABLE IF NOT EXISTS context_chunks (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    project_id UUID NOT NULL REFERENCES projects(id) ON DELETE CASCADE,
+    file_id UUID NOT NULL REFERENCES context_files(id) ON DELETE CASCADE,
+    chunk_index INTEGER NOT NULL,
+    content TEXT NOT NULL,
+    char_count INTEGER NOT NULL,
+    term_count INTEGER NOT NULL,
+    terms JSONB NOT NULL,
+    created_at TIMESTAMPTZ DEFAULT NOW(),
+    UNIQUE (file_id, chunk_index)
+);
+
+-- Index for loading a project's chunk statistics
+CREATE INDEX IF NOT EXISTS idx_context_chunks_project ON context_chunks(project_id);
+
+-- Enable RLS
+ALTER TABLE context_chunks ENABLE ROW LEVEL SECURITY;
+
+-- RLS policies for context_chunks (accessed only by the API)
+DROP POLICY IF EXISTS "Enable all access for context_chunks" ON context_chunks;
+CREATE POLICY "Enable all access for context_chunks" ON context_chunks
+    FOR ALL USING (true) WITH CHECK (true);
@@ -0,0 +1,62 @@
+-- Background jobs
+-- Long-running AI operations (prefill, feature extraction, PRD generation,
+-- feedback improvement, AI context analysis) are queued here and run by
+-- api/worker.py instead of inside the HTTP request (see api/jobs.py).
+-- checkpoint holds the work finished so far, so a retried job resumes.
+CREATE TABLE IF NOT EXISTS jobs (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    project_id UUID REFERENCES projects(id) ON DELETE CASCADE,
+    job_type TEXT NOT NULL CHECK (job_type IN ('prefill', 'extract_features', 'generate_prd', 'improve_prd', 'analyze_context')),
+    status TEXT NOT NULL DEFAULT 'queued' CHECK (status IN ('queued', 'running', 'succeeded', 'failed', 'cancelled')),
+    params JSONB NOT NULL DEFAULT '{}',
+    progress JSONB NOT NULL DEFAULT '{}',
+    checkpoint JSONB NOT NULL DEFAULT '{}',
+    result JSONB,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 3,
+    run_after TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    locked_by TEXT,
+    locked_at TIMESTAMPTZ,
+    created_at TIMESTAMPTZ DEFAULT NOW(),
+    updated_at TIMESTAMPTZ DEFAULT NOW(),
+    started_at TIMESTAMPTZ,
+    finished_at TIMESTAMPTZ
+);
+
+-- Indexes for claiming and for listing a project's jobs
+CREATE INDEX IF NOT EXISTS idx_jobs_claim ON jobs(status, run_after) WHERE status IN ('queued', 'running');
+CREATE INDEX IF NOT EXISTS idx_jobs_project ON jobs(project_id, created_at DESC);
+
+-- Claim the oldest runnable job for a worker. Queued jobs are runnable once
+-- run_after has passed; running jobs whose lock has not been refreshed for
+-- p_lock_timeout seconds belong to a dead worker and are taken over.
+-- SKIP LOCKED lets several workers claim concurrently.
+CREATE OR REPLACE FUNCTION claim_job(p_worker TEXT, p_types TEXT[] DEFAULT NULL, p_lock_timeout INTEGER DEFAULT 600)
+RETURNS SETOF jobs AS $$
+    UPDATE jobs
+    SET status = 'running',
+        locked_by = p_worker,
+        locked_at = NOW(),
+        attempts = attempts + 1,
+        started_at = COALESCE(started_at, NOW()),
+        updated_at = NOW()
+    WHERE id = (
+        SELECT id FROM jobs
+        WHERE ((status = 'queued' AND run_after <= NOW())
+               OR (status = 'running' AND locked_at < NOW() - make_interval(secs => p_lock_timeout)))
+          AND (p_types IS NULL OR job_type = ANY(p_types))
+        ORDER BY run_after
+        FOR UPDATE SKIP LOCKED
+        LIMIT 1
+    )
+    RETURNING *;
+$$ LANGUAGE sql;
+
+-- Enable RLS
+ALTER TABLE jobs ENABLE ROW LEVEL SECURITY;
+
+-- RLS policies for jobs (accessed only by the API and the worker)
+DROP POLICY IF EXISTS "Enable all access for jobs" ON jobs;
+CREATE POLICY "Enable all access for jobs" ON jobs
+    FOR ALL USING (true) WITH CHECK (true);
@@ -0,0 +1,56 @@
+-- Overview analytics aggregated in the database
+-- /api/analytics/overview calls analytics_overview() and receives a single
+-- JSON object of scalars instead of reading every row (and every
+-- extracted_text) of projects, generated_prds, context_files and
+-- question_responses. Requires 008_context_file_analysis.sql: context size is
+-- taken from the stored per-file analysis where available, so most
+-- extracted_text values are never read.
+
+-- Indexes for the 7-day activity windows
+CREATE INDEX IF NOT EXISTS idx_projects_created_at ON projects(created_at);
+CREATE INDEX IF NOT EXISTS idx_generated_prds_created_at ON generated_prds(created_at);
+
+CREATE OR REPLACE FUNCTION analytics_overview(p_recent_days INTEGER DEFAULT 7)
+RETURNS JSON AS $$
+    WITH
+    p AS (
+        SELECT
+            COUNT(*) AS total,
+            COUNT(*) FILTER (WHERE created_at > NOW() - make_interval(days => p_recent_days)) AS recent,
+            -- Time spent per project is capped at 8 hours (as calculate_time_spent)
+            COALESCE(SUM(LEAST(EXTRACT(EPOCH FROM (updated_at - created_at)) / 3600, 8)), 0) AS hours
+        FROM projects
+    ),
+    g AS (
+        SELECT
+            COUNT(*) AS total,
+            COUNT(*) FILTER (WHERE created_at > NOW() - make_interval(days => p_recent_days)) AS recent
+        FROM generated_prds
+    ),
+    c AS (
+        SELECT
+            COUNT(*) AS total,
+            COALESCE(SUM(COALESCE((analysis->>'length')::BIGINT, LENGTH(extracted_text))), 0) AS chars
+        FROM context_files
+    ),
+    r AS (
+        SELECT
+            COUNT(*) AS total,
+            COUNT(*) FILTER (WHERE confirmed) AS confirmed,
+            COUNT(*) FILTER (WHERE ai_suggested) AS ai_suggested
+        FROM question_responses
+    )
+    SELECT json_build_object(
+        'total_projects', p.total,
+        'projects_recent', p.recent,
+        'total_hours', p.hours,
+        'prds_generated', g.total,
+        'prds_recent', g.recent,
+        'total_context_files', c.total,
+        'total_context_chars', c.chars,
+        'total_responses', r.total,
+        'confirmed_responses', r.confirmed,
+        'ai_suggested_responses', r.ai_suggested
+    )
+    FROM p, g, c, r;
+$$ LANGUAGE sql STABLE;
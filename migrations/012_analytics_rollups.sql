@@ -0,0 +1,495 @@
+-- Analytics rollups
+-- Daily and per-project totals kept up to date by triggers on the source
+-- tables, so analytics read a few rollup rows instead of aggregating the
+-- source tables on every dashboard hit:
+--   analytics_daily    totals of the rows created each UTC day, split over up
+--                      to 8 shard rows per day (see add_analytics_daily)
+--   analytics_project  one row per project: its totals and timeline dates
+-- rebuild_analytics_rollups() recomputes them from the source tables (run at
+-- the end of this migration, and from the CLI: python api/rollups.py).
+-- Requires 008_context_file_analysis.sql and 011_analytics_overview.sql.
+
+-- Written by the feedback improve loop; declared here as the rollups read it
+ALTER TABLE generated_prds ADD COLUMN IF NOT EXISTS version INTEGER DEFAULT 1;
+
+CREATE TABLE IF NOT EXISTS analytics_daily (
+    day DATE NOT NULL,
+    shard SMALLINT NOT NULL DEFAULT 0,
+    projects_created INTEGER NOT NULL DEFAULT 0,
+    project_hours DOUBLE PRECISION NOT NULL DEFAULT 0,
+    prds_generated INTEGER NOT NULL DEFAULT 0,
+    context_files INTEGER NOT NULL DEFAULT 0,
+    context_chars BIGINT NOT NULL DEFAULT 0,
+    responses INTEGER NOT NULL DEFAULT 0,
+    confirmed_responses INTEGER NOT NULL DEFAULT 0,
+    ai_suggested_responses INTEGER NOT NULL DEFAULT 0,
+    feedback_count INTEGER NOT NULL DEFAULT 0,
+    rating_sum INTEGER NOT NULL DEFAULT 0,
+    rating_count INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMPTZ DEFAULT NOW(),
+    PRIMARY KEY (day, shard)
+);
+
+CREATE TABLE IF NOT EXISTS analytics_project (
+    project_id UUID PRIMARY KEY REFERENCES projects(id) ON DELETE CASCADE,
+    context_files INTEGER NOT NULL DEFAULT 0,
+    context_chars BIGINT NOT NULL DEFAULT 0,
+    file_types JSONB NOT NULL DEFAULT '{}',
+    features INTEGER NOT NULL DEFAULT 0,
+    selected_features INTEGER NOT NULL DEFAULT 0,
+    features_first_at TIMESTAMPTZ,
+    responses INTEGER NOT NULL DEFAULT 0,
+    confirmed_responses INTEGER NOT NULL DEFAULT 0,
+    ai_suggested_responses INTEGER NOT NULL DEFAULT 0,
+    prd_id UUID,
+    prd_version INTEGER,
+    prd_word_count INTEGER NOT NULL DEFAULT 0,
+    prd_created_at TIMESTAMPTZ,
+    prd_edit_count INTEGER NOT NULL DEFAULT 0,
+    feedback_count INTEGER NOT NULL DEFAULT 0,
+    rating_sum INTEGER NOT NULL DEFAULT 0,
+    rating_count INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+-- Snapshots are matched to the project's current PRD
+CREATE INDEX IF NOT EXISTS idx_analytics_project_prd_id ON analytics_project(prd_id);
+
+-- Helpers
+
+CREATE OR REPLACE FUNCTION analytics_day(p_at TIMESTAMPTZ)
+RETURNS DATE AS $$
+    SELECT (COALESCE(p_at, NOW()) AT TIME ZONE 'UTC')::DATE;
+$$ LANGUAGE sql STABLE;
+
+-- Time spent on a project, capped at 8 hours (as calculate_time_spent)
+CREATE OR REPLACE FUNCTION analytics_project_hours(p_created TIMESTAMPTZ, p_updated TIMESTAMPTZ)
+RETURNS DOUBLE PRECISION AS $$
+    SELECT COALESCE(LEAST(EXTRACT(EPOCH FROM (p_updated - p_created)) / 3600, 8), 0)::DOUBLE PRECISION;
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION analytics_context_chars(p_analysis JSONB, p_text TEXT)
+RETURNS BIGINT AS $$
+    SELECT COALESCE((p_analysis->>'length')::BIGINT, LENGTH(p_text), 0);
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Whitespace-separated words, as str.split() counts them
+CREATE OR REPLACE FUNCTION analytics_word_count(p_text TEXT)
+RETURNS INTEGER AS $$
+    SELECT COUNT(*)::INTEGER FROM regexp_matches(COALESCE(p_text, ''), '\S+', 'g');
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Every write of a day updates that day's totals. With a single row per day,
+-- concurrent writers would queue on its row lock until each commits; instead
+-- each connection writes to one of 8 shard rows (by backend pid), and readers
+-- sum the shards. rebuild_analytics_rollups() writes everything to shard 0.
+CREATE OR REPLACE FUNCTION add_analytics_daily(
+    p_day DATE,
+    p_projects INTEGER DEFAULT 0,
+    p_hours DOUBLE PRECISION DEFAULT 0,
+    p_prds INTEGER DEFAULT 0,
+    p_context_files INTEGER DEFAULT 0,
+    p_context_chars BIGINT DEFAULT 0,
+    p_responses INTEGER DEFAULT 0,
+    p_confirmed INTEGER DEFAULT 0,
+    p_ai_suggested INTEGER DEFAULT 0,
+    p_feedback INTEGER DEFAULT 0,
+    p_rating_sum INTEGER DEFAULT 0,
+    p_rating_count INTEGER DEFAULT 0
+) RETURNS VOID AS $$
+    INSERT INTO analytics_daily AS d (
+        day, shard, projects_created, project_hours, prds_generated, context_files, context_chars,
+        responses, confirmed_responses, ai_suggested_responses, feedback_count, rating_sum, rating_count
+    ) VALUES (
+        p_day, pg_backend_pid() % 8, p_projects, p_hours, p_prds, p_context_files, p_context_chars,
+        p_responses, p_confirmed, p_ai_suggested, p_feedback, p_rating_sum, p_rating_count
+    )
+    ON CONFLICT (day, shard) DO UPDATE SET
+        projects_created = d.projects_created + EXCLUDED.projects_created,
+        project_hours = d.project_hours + EXCLUDED.project_hours,
+        prds_generated = d.prds_generated + EXCLUDED.prds_generated,
+        context_files = d.context_files + EXCLUDED.context_files,
+        context_chars = d.context_chars + EXCLUDED.context_chars,
+        responses = d.responses + EXCLUDED.responses,
+        confirmed_responses = d.confirmed_responses + EXCLUDED.confirmed_responses,
+        ai_suggested_responses = d.ai_suggested_responses + EXCLUDED.ai_suggested_responses,
+        feedback_count = d.feedback_count + EXCLUDED.feedback_count,
+        rating_sum = d.rating_sum + EXCLUDED.rating_sum,
+        rating_count = d.rating_count + EXCLUDED.rating_count,
+        updated_at = NOW();
+$$ LANGUAGE sql;
+
+-- Triggers
+-- Each applies the old row with sign -1 and the new row with sign +1.
+-- Per-project rows are only updated, never inserted: the row is created with
+-- the project, and rows deleted by a project's cascade must not come back.
+
+CREATE OR REPLACE FUNCTION rollup_projects()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM add_analytics_daily(analytics_day(OLD.created_at),
+            p_projects => -1, p_hours => -analytics_project_hours(OLD.created_at, OLD.updated_at));
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM add_analytics_daily(analytics_day(NEW.created_at),
+            p_projects => 1, p_hours => analytics_project_hours(NEW.created_at, NEW.updated_at));
+    END IF;
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO analytics_project (project_id) VALUES (NEW.id) ON CONFLICT (project_id) DO NOTHING;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION rollup_context_file(p_row context_files, p_sign INTEGER)
+RETURNS VOID AS $$
+DECLARE
+    v_chars BIGINT := analytics_context_chars(p_row.analysis, p_row.extracted_text);
+    v_type TEXT := COALESCE(p_row.file_type, 'unknown');
+BEGIN
+    PERFORM add_analytics_daily(analytics_day(p_row.created_at),
+        p_context_files => p_sign, p_context_chars => p_sign * v_chars);
+    UPDATE analytics_project SET
+        context_files = context_files + p_sign,
+        context_chars = context_chars + p_sign * v_chars,
+        file_types = CASE WHEN COALESCE((file_types->>v_type)::INTEGER, 0) + p_sign > 0
+                          THEN file_types || jsonb_build_object(v_type, COALESCE((file_types->>v_type)::INTEGER, 0) + p_sign)
+                          ELSE file_types - v_type END,
+        updated_at = NOW()
+    WHERE project_id = p_row.project_id;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION rollup_context_files()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM rollup_context_file(OLD, -1);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM rollup_context_file(NEW, 1);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION rollup_features()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        UPDATE analytics_project SET
+            features = features - 1,
+            selected_features = selected_features - (OLD.is_selected IS TRUE)::INTEGER,
+            -- The row is already gone (or moved), so this finds the next earliest
+            features_first_at = CASE WHEN OLD.created_at > features_first_at THEN features_first_at
+                                     ELSE (SELECT MIN(created_at) FROM features WHERE project_id = OLD.project_id) END,
+            updated_at = NOW()
+        WHERE project_id = OLD.project_id;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        UPDATE analytics_project SET
+            features = features + 1,
+            selected_features = selected_features + (NEW.is_selected IS TRUE)::INTEGER,
+            features_first_at = LEAST(features_first_at, COALESCE(NEW.created_at, NOW())),
+            updated_at = NOW()
+        WHERE project_id = NEW.project_id;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION rollup_question_response(p_row question_responses, p_sign INTEGER)
+RETURNS VOID AS $$
+DECLARE
+    v_confirmed INTEGER := p_sign * (p_row.confirmed IS TRUE)::INTEGER;
+    v_ai_suggested INTEGER := p_sign * (p_row.ai_suggested IS TRUE)::INTEGER;
+BEGIN
+    PERFORM add_analytics_daily(analytics_day(p_row.created_at),
+        p_responses => p_sign, p_confirmed => v_confirmed, p_ai_suggested => v_ai_suggested);
+    UPDATE analytics_project SET
+        responses = responses + p_sign,
+        confirmed_responses = confirmed_responses + v_confirmed,
+        ai_suggested_responses = ai_suggested_responses + v_ai_suggested,
+        updated_at = NOW()
+    WHERE project_id = p_row.project_id;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION rollup_question_responses()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM rollup_question_response(OLD, -1);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM rollup_question_response(NEW, 1);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- A project's PRD is the one written last
+CREATE OR REPLACE FUNCTION rollup_generated_prds()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        PERFORM add_analytics_daily(analytics_day(OLD.created_at), p_prds => -1);
+        UPDATE analytics_project SET
+            prd_id = NULL, prd_version = NULL, prd_word_count = 0, prd_created_at = NULL, prd_edit_count = 0,
+            updated_at = NOW()
+        WHERE project_id = OLD.project_id AND prd_id = OLD.id;
+        RETURN NULL;
+    END IF;
+    IF TG_OP = 'INSERT' THEN
+        PERFORM add_analytics_daily(analytics_day(NEW.created_at), p_prds => 1);
+    END IF;
+    UPDATE analytics_project SET
+        prd_id = NEW.id,
+        prd_version = COALESCE(NEW.version, 1),
+        prd_word_count = analytics_word_count(NEW.content_md),
+        prd_created_at = COALESCE(NEW.created_at, NOW()),
+        prd_edit_count = CASE WHEN prd_id = NEW.id THEN prd_edit_count
+                              ELSE (SELECT COUNT(*) FROM prd_edit_snapshots WHERE prd_id = NEW.id) END,
+        updated_at = NOW()
+    WHERE project_id = NEW.project_id;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Snapshots of the project's current PRD, matched by prd_id (not every
+-- writer sets project_id)
+CREATE OR REPLACE FUNCTION rollup_prd_edit_snapshots()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        UPDATE analytics_project SET prd_edit_count = prd_edit_count - 1, updated_at = NOW()
+        WHERE prd_id = OLD.prd_id;
+    ELSE
+        UPDATE analytics_project SET prd_edit_count = prd_edit_count + 1, updated_at = NOW()
+        WHERE prd_id = NEW.prd_id;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION rollup_prd_feedback_row(p_row prd_feedback, p_sign INTEGER)
+RETURNS VOID AS $$
+DECLARE
+    v_rating_sum INTEGER := p_sign * COALESCE(p_row.rating, 0);
+    v_rating_count INTEGER := p_sign * (p_row.rating IS NOT NULL)::INTEGER;
+BEGIN
+    PERFORM add_analytics_daily(analytics_day(p_row.created_at),
+        p_feedback => p_sign, p_rating_sum => v_rating_sum, p_rating_count => v_rating_count);
+    UPDATE analytics_project SET
+        feedback_count = feedback_count + p_sign,
+        rating_sum = rating_sum + v_rating_sum,
+        rating_count = rating_count + v_rating_count,
+        updated_at = NOW()
+    WHERE project_id = p_row.project_id;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION rollup_prd_feedback()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM rollup_prd_feedback_row(OLD, -1);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM rollup_prd_feedback_row(NEW, 1);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Updates only fire the triggers when a rolled-up column is written
+DROP TRIGGER IF EXISTS analytics_rollup ON projects;
+CREATE TRIGGER analytics_rollup
+    AFTER INSERT OR DELETE OR UPDATE OF created_at, updated_at ON projects
+    FOR EACH ROW
+    EXECUTE FUNCTION rollup_projects();
+
+DROP TRIGGER IF EXISTS analytics_rollup ON context_files;
+CREATE TRIGGER analytics_rollup
+    AFTER INSERT OR DELETE OR UPDATE OF project_id, file_type, extracted_text, analysis, created_at ON context_files
+    FOR EACH ROW
+    EXECUTE FUNCTION rollup_context_files();
+
+DROP TRIGGER IF EXISTS analytics_rollup ON features;
+CREATE TRIGGER analytics_rollup
+    AFTER INSERT OR DELETE OR UPDATE OF project_id, is_selected, created_at ON features
+    FOR EACH ROW
+    EXECUTE FUNCTION rollup_features();
+
+DROP TRIGGER IF EXISTS analytics_rollup ON question_responses;
+CREATE TRIGGER analytics_rollup
+    AFTER INSERT OR DELETE OR UPDATE OF project_id, confirmed, ai_suggested, created_at ON question_responses
+    FOR EACH ROW
+    EXECUTE FUNCTION rollup_question_responses();
+
+DROP TRIGGER IF EXISTS analytics_rollup ON generated_prds;
+CREATE TRIGGER analytics_rollup
+    AFTER INSERT OR DELETE OR UPDATE OF content_md, version ON generated_prds
+    FOR EACH ROW
+    EXECUTE FUNCTION rollup_generated_prds();
+
+DROP TRIGGER IF EXISTS analytics_rollup ON prd_edit_snapshots;
+CREATE TRIGGER analytics_rollup
+    AFTER INSERT OR DELETE ON prd_edit_snapshots
+    FOR EACH ROW
+    EXECUTE FUNCTION rollup_prd_edit_snapshots();
+
+DROP TRIGGER IF EXISTS analytics_rollup ON prd_feedback;
+CREATE TRIGGER analytics_rollup
+    AFTER INSERT OR DELETE OR UPDATE OF project_id, rating, created_at ON prd_feedback
+    FOR EACH ROW
+    EXECUTE FUNCTION rollup_prd_feedback();
+
+-- Rebuild
+-- Recomputes the rollups from the source tables: everything, or the row of
+-- one project. The EXCLUSIVE lock waits for transactions that have already
+-- applied their deltas and holds back new ones until the rebuild commits, so
+-- no change is counted twice or lost.
+CREATE OR REPLACE FUNCTION rebuild_analytics_rollups(p_project UUID DEFAULT NULL)
+RETURNS INTEGER AS $$
+DECLARE
+    v_rows INTEGER;
+BEGIN
+    LOCK TABLE analytics_daily, analytics_project IN EXCLUSIVE MODE;
+
+    IF p_project IS NULL THEN
+        DELETE FROM analytics_daily;
+        INSERT INTO analytics_daily (
+            day, projects_created, project_hours, prds_generated, context_files, context_chars,
+            responses, confirmed_responses, ai_suggested_responses, feedback_count, rating_sum, rating_count
+        )
+        SELECT day, SUM(projects_created), SUM(project_hours), SUM(prds_generated), SUM(context_files),
+               SUM(context_chars), SUM(responses), SUM(confirmed_responses), SUM(ai_suggested_responses),
+               SUM(feedback_count), SUM(rating_sum), SUM(rating_count)
+        FROM (
+            SELECT analytics_day(created_at) AS day, COUNT(*) AS projects_created,
+                   SUM(analytics_project_hours(created_at, updated_at)) AS project_hours,
+                   0 AS prds_generated, 0 AS context_files, 0 AS context_chars, 0 AS responses,
+                   0 AS confirmed_responses, 0 AS ai_suggested_responses, 0 AS feedback_count,
+                   0 AS rating_sum, 0 AS rating_count
+            FROM projects GROUP BY 1
+            UNION ALL
+            SELECT analytics_day(created_at), 0, 0, COUNT(*), 0, 0, 0, 0, 0, 0, 0, 0
+            FROM generated_prds GROUP BY 1
+            UNION ALL
+            SELECT analytics_day(created_at), 0, 0, 0, COUNT(*), SUM(analytics_context_chars(analysis, extracted_text)),
+                   0, 0, 0, 0, 0, 0
+            FROM context_files GROUP BY 1
+            UNION ALL
+            SELECT analytics_day(created_at), 0, 0, 0, 0, 0, COUNT(*), COUNT(*) FILTER (WHERE confirmed),
+                   COUNT(*) FILTER (WHERE ai_suggested), 0, 0, 0
+            FROM question_responses GROUP BY 1
+            UNION ALL
+            SELECT analytics_day(created_at), 0, 0, 0, 0, 0, 0, 0, 0, COUNT(*), COALESCE(SUM(rating), 0), COUNT(rating)
+            FROM prd_feedback GROUP BY 1
+        ) totals
+        GROUP BY day;
+        DELETE FROM analytics_project;
+    END IF;
+
+    INSERT INTO analytics_project (
+        project_id, context_files, context_chars, file_types, features, selected_features, features_first_at,
+        responses, confirmed_responses, ai_suggested_responses, prd_id, prd_version, prd_word_count,
+        prd_created_at, prd_edit_count, feedback_count, rating_sum, rating_count, updated_at
+    )
+    SELECT p.id, COALESCE(c.files, 0), COALESCE(c.chars, 0), COALESCE(t.file_types, '{}'),
+           COALESCE(f.total, 0), COALESCE(f.selected, 0), f.first_at,
+           COALESCE(r.total, 0), COALESCE(r.confirmed, 0), COALESCE(r.ai_suggested, 0),
+           g.id, COALESCE(g.version, 1), COALESCE(analytics_word_count(g.content_md), 0), g.created_at,
+           COALESCE(s.edits, 0), COALESCE(b.total, 0), COALESCE(b.rating_sum, 0), COALESCE(b.rating_count, 0), NOW()
+    FROM projects p
+    LEFT JOIN LATERAL (
+        SELECT COUNT(*) AS files, SUM(analytics_context_chars(analysis, extracted_text)) AS chars
+        FROM context_files WHERE project_id = p.id
+    ) c ON TRUE
+    LEFT JOIN LATERAL (
+        SELECT jsonb_object_agg(file_type, n) AS file_types
+        FROM (SELECT COALESCE(file_type, 'unknown') AS file_type, COUNT(*) AS n
+              FROM context_files WHERE project_id = p.id GROUP BY 1) types
+    ) t ON TRUE
+    LEFT JOIN LATERAL (
+        SELECT COUNT(*) AS total, COUNT(*) FILTER (WHERE is_selected) AS selected, MIN(created_at) AS first_at
+        FROM features WHERE project_id = p.id
+    ) f ON TRUE
+    LEFT JOIN LATERAL (
+        SELECT COUNT(*) AS total, COUNT(*) FILTER (WHERE confirmed) AS confirmed,
+               COUNT(*) FILTER (WHERE ai_suggested) AS ai_suggested
+        FROM question_responses WHERE project_id = p.id
+    ) r ON TRUE
+    LEFT JOIN LATERAL (
+        SELECT id, version, content_md, created_at
+        FROM generated_prds WHERE project_id = p.id
+        ORDER BY COALESCE(last_edited_at, created_at) DESC LIMIT 1
+    ) g ON TRUE
+    LEFT JOIN LATERAL (
+        SELECT COUNT(*) AS edits FROM prd_edit_snapshots WHERE prd_id = g.id
+    ) s ON TRUE
+    LEFT JOIN LATERAL (
+        SELECT COUNT(*) AS total, SUM(rating) AS rating_sum, COUNT(rating) AS rating_count
+        FROM prd_feedback WHERE project_id = p.id
+    ) b ON TRUE
+    WHERE p_project IS NULL OR p.id = p_project
+    ON CONFLICT (project_id) DO UPDATE SET
+        context_files = EXCLUDED.context_files,
+        context_chars = EXCLUDED.context_chars,
+        file_types = EXCLUDED.file_types,
+        features = EXCLUDED.features,
+        selected_features = EXCLUDED.selected_features,
+        features_first_at = EXCLUDED.features_first_at,
+        responses = EXCLUDED.responses,
+        confirmed_responses = EXCLUDED.confirmed_responses,
+        ai_suggested_responses = EXCLUDED.ai_suggested_responses,
+        prd_id = EXCLUDED.prd_id,
+        prd_version = EXCLUDED.prd_version,
+        prd_word_count = EXCLUDED.prd_word_count,
+        prd_created_at = EXCLUDED.prd_created_at,
+        prd_edit_count = EXCLUDED.prd_edit_count,
+        feedback_count = EXCLUDED.feedback_count,
+        rating_sum = EXCLUDED.rating_sum,
+        rating_count = EXCLUDED.rating_count,
+        updated_at = NOW();
+
+    GET DIAGNOSTICS v_rows = ROW_COUNT;
+    RETURN v_rows;
+END;
+$$ LANGUAGE plpgsql;
+
+-- The overview now sums the daily rollup (replaces the version in 011)
+CREATE OR REPLACE FUNCTION analytics_overview(p_recent_days INTEGER DEFAULT 7)
+RETURNS JSON AS $$
+    SELECT json_build_object(
+        'total_projects', COALESCE(SUM(projects_created), 0),
+        'projects_recent', COALESCE(SUM(projects_created) FILTER (WHERE day > analytics_day(NOW()) - p_recent_days), 0),
+        'total_hours', COALESCE(SUM(project_hours), 0),
+        'prds_generated', COALESCE(SUM(prds_generated), 0),
+        'prds_recent', COALESCE(SUM(prds_generated) FILTER (WHERE day > analytics_day(NOW()) - p_recent_days), 0),
+        'total_context_files', COALESCE(SUM(context_files), 0),
+        'total_context_chars', COALESCE(SUM(context_chars), 0),
+        'total_responses', COALESCE(SUM(responses), 0),
+        'confirmed_responses', COALESCE(SUM(confirmed_responses), 0),
+        'ai_suggested_responses', COALESCE(SUM(ai_suggested_responses), 0)
+    )
+    FROM analytics_daily;
+$$ LANGUAGE sql STABLE;
+
+-- Enable RLS
+ALTER TABLE analytics_daily ENABLE ROW LEVEL SECURITY;
+ALTER TABLE analytics_project ENABLE ROW LEVEL SECURITY;
+
+-- RLS policies for the rollups (written by the triggers, read by the API)
+DROP POLICY IF EXISTS "Enable all access for analytics_daily" ON analytics_daily;
+CREATE POLICY "Enable all access for analytics_daily" ON analytics_daily
+    FOR ALL USING (true) WITH CHECK (true);
+
+DROP POLICY IF EXISTS "Enable all access for analytics_project" ON analytics_project;
+CREATE POLICY "Enable all access for analytics_project" ON analytics_project
+    FOR ALL USING (true) WITH CHECK (true);
+
+-- Populate from the existing data
+SELECT rebuild_analytics_rollups();
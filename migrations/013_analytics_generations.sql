@@ -0,0 +1,37 @@
+-- Analytics cache generations
+-- One counter per project plus a 'global' one, incremented by the API after
+-- every write to a project's data (api/analytics_cache.py). Cached analytics
+-- results are keyed by these counters, so a bump invalidates them.
+CREATE TABLE IF NOT EXISTS analytics_generations (
+    scope TEXT PRIMARY KEY,
+    generation BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+-- Increment the project's counter and the global one; returns both new values
+-- as {"<project_id>": n, "global": m}
+CREATE OR REPLACE FUNCTION bump_analytics_generation(p_project UUID)
+RETURNS JSON AS $$
+DECLARE
+    v_project BIGINT;
+    v_global BIGINT;
+BEGIN
+    INSERT INTO analytics_generations AS g (scope, generation) VALUES (p_project::TEXT, 1)
+    ON CONFLICT (scope) DO UPDATE SET generation = g.generation + 1, updated_at = NOW()
+    RETURNING generation INTO v_project;
+
+    INSERT INTO analytics_generations AS g (scope, generation) VALUES ('global', 1)
+    ON CONFLICT (scope) DO UPDATE SET generation = g.generation + 1, updated_at = NOW()
+    RETURNING generation INTO v_global;
+
+    RETURN json_build_object(p_project::TEXT, v_project, 'global', v_global);
+END;
+$$ LANGUAGE plpgsql;
+
+-- Enable RLS
+ALTER TABLE analytics_generations ENABLE ROW LEVEL SECURITY;
+
+-- RLS policies for analytics_generations (accessed only by the API)
+DROP POLICY IF EXISTS "Enable all access for analytics_generations" ON analytics_generations;
+CREATE POLICY "Enable all access for analytics_generations" ON analytics_generations
+    FOR ALL USING (true) WITH CHECK (true);
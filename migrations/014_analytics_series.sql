@@ -0,0 +1,79 @@
+-- Activity time series
+-- analytics_series() counts the events of a time range per hour, day or week
+-- (date_trunc in UTC) for /api/analytics/series, returning one row per
+-- bucket (empty buckets included) instead of the rows themselves.
+
+-- Indexes for the range scans
+CREATE INDEX IF NOT EXISTS idx_context_files_created_at ON context_files(created_at);
+CREATE INDEX IF NOT EXISTS idx_question_responses_created_at ON question_responses(created_at);
+CREATE INDEX IF NOT EXISTS idx_prd_feedback_created_at ON prd_feedback(created_at);
+CREATE INDEX IF NOT EXISTS idx_prd_activity_type_created_at ON prd_activity(activity_type, created_at);
+
+-- p_bucket: 'hour' | 'day' | 'week'; events in [p_start, p_end), optionally of one project
+CREATE OR REPLACE FUNCTION analytics_series(
+    p_bucket TEXT,
+    p_start TIMESTAMPTZ,
+    p_end TIMESTAMPTZ,
+    p_project UUID DEFAULT NULL
+)
+RETURNS TABLE (
+    bucket TIMESTAMPTZ,
+    projects BIGINT,
+    prds BIGINT,
+    uploads BIGINT,
+    responses BIGINT,
+    feedback BIGINT,
+    share_views BIGINT
+) AS $$
+    WITH events AS (
+        SELECT 'projects' AS metric, date_trunc(p_bucket, created_at AT TIME ZONE 'UTC') AS b, COUNT(*) AS n
+        FROM projects
+        WHERE created_at >= p_start AND created_at < p_end AND (p_project IS NULL OR id = p_project)
+        GROUP BY 2
+        UNION ALL
+        SELECT 'prds', date_trunc(p_bucket, created_at AT TIME ZONE 'UTC'), COUNT(*)
+        FROM generated_prds
+        WHERE created_at >= p_start AND created_at < p_end AND (p_project IS NULL OR project_id = p_project)
+        GROUP BY 2
+        UNION ALL
+        SELECT 'uploads', date_trunc(p_bucket, created_at AT TIME ZONE 'UTC'), COUNT(*)
+        FROM context_files
+        WHERE created_at >= p_start AND created_at < p_end AND (p_project IS NULL OR project_id = p_project)
+        GROUP BY 2
+        UNION ALL
+        SELECT 'responses', date_trunc(p_bucket, created_at AT TIME ZONE 'UTC'), COUNT(*)
+        FROM question_responses
+        WHERE created_at >= p_start AND created_at < p_end AND (p_project IS NULL OR project_id = p_project)
+        GROUP BY 2
+        UNION ALL
+        SELECT 'feedback', date_trunc(p_bucket, created_at AT TIME ZONE 'UTC'), COUNT(*)
+        FROM prd_feedback
+        WHERE created_at >= p_start AND created_at < p_end AND (p_project IS NULL OR project_id = p_project)
+        GROUP BY 2
+        UNION ALL
+        SELECT 'share_views', date_trunc(p_bucket, created_at AT TIME ZONE 'UTC'), COUNT(*)
+        FROM prd_activity
+        WHERE activity_type = 'viewed' AND created_at >= p_start AND created_at < p_end
+          AND (p_project IS NULL OR prd_id IN (SELECT id FROM generated_prds WHERE project_id = p_project))
+        GROUP BY 2
+    ),
+    buckets AS (
+        SELECT generate_series(
+            date_trunc(p_bucket, p_start AT TIME ZONE 'UTC'),
+            (p_end AT TIME ZONE 'UTC') - INTERVAL '1 microsecond',
+            ('1 ' || p_bucket)::INTERVAL
+        ) AS b
+    )
+    SELECT
+        buckets.b AT TIME ZONE 'UTC',
+        COALESCE(SUM(events.n) FILTER (WHERE events.metric = 'projects'), 0)::BIGINT,
+        COALESCE(SUM(events.n) FILTER (WHERE events.metric = 'prds'), 0)::BIGINT,
+        COALESCE(SUM(events.n) FILTER (WHERE events.metric = 'uploads'), 0)::BIGINT,
+        COALESCE(SUM(events.n) FILTER (WHERE events.metric = 'responses'), 0)::BIGINT,
+        COALESCE(SUM(events.n) FILTER (WHERE events.metric = 'feedback'), 0)::BIGINT,
+        COALESCE(SUM(events.n) FILTER (WHERE events.metric = 'share_views'), 0)::BIGINT
+    FROM buckets
+    LEFT JOIN events ON events.b = buckets.b
+    GROUP BY buckets.b
+    ORDER BY buckets.b;
+$$ LANGUAGE sql STABLE;
@@ -0,0 +1,38 @@
+-- Shared text for deduplicated context files
+-- An upload whose bytes the user has uploaded before stores no text or chunks
+-- of its own: source_file_id points at the earlier row that holds them (see
+-- api/context.py and api/context_index.py). Requires 007 and 009.
+ALTER TABLE context_files ADD COLUMN IF NOT EXISTS source_file_id UUID
+    REFERENCES context_files(id) ON DELETE SET NULL;
+
+-- Index for finding the copies of a file
+CREATE INDEX IF NOT EXISTS idx_context_files_source_file_id ON context_files(source_file_id)
+    WHERE source_file_id IS NOT NULL;
+
+-- Before a file that other rows share is deleted, its text and chunks move to
+-- the oldest copy, which becomes the one the remaining copies point at
+CREATE OR REPLACE FUNCTION promote_context_file_copy()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_heir context_files;
+BEGIN
+    SELECT * INTO v_heir FROM context_files
+    WHERE source_file_id = OLD.id
+    ORDER BY created_at, id
+    LIMIT 1;
+    IF v_heir.id IS NULL THEN
+        RETURN OLD;
+    END IF;
+
+    UPDATE context_files SET extracted_text = OLD.extracted_text, source_file_id = NULL WHERE id = v_heir.id;
+    UPDATE context_files SET source_file_id = v_heir.id WHERE source_file_id = OLD.id;
+    UPDATE context_chunks SET file_id = v_heir.id, project_id = v_heir.project_id WHERE file_id = OLD.id;
+    RETURN OLD;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS promote_copy ON context_files;
+CREATE TRIGGER promote_copy
+    BEFORE DELETE ON context_files
+    FOR EACH ROW
+    EXECUTE FUNCTION promote_context_file_copy();
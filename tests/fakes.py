@@ -0,0 +1,180 @@
+"""In-memory stand-ins for the Supabase client and a claimed job."""
+
+import copy
+import fnmatch
+
+# Columns of tables whose writes are checked, as PostgREST would reject
+# unknown columns or a missing NOT NULL column
+TABLE_COLUMNS = {
+    'prd_edit_snapshots': ({'id', 'prd_id', 'project_id', 'snapshot_content', 'version_name',
+                            'is_major_version', 'change_summary', 'created_at'}, {'snapshot_content'}),
+}
+
+
+class Result:
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+
+class Query:
+    def __init__(self, db, table):
+        self.db = db
+        self.table = table
+        self.action = 'select'
+        self.columns = None
+        self.payload = None
+        self.filters = []
+        self.ordering = None
+        self.row_limit = None
+        self.row_offset = 0
+        self.on_conflict = 'id'
+        self.negate = False
+
+    def _filter(self, test):
+        negate, self.negate = self.negate, False
+        self.filters.append((lambda row: not test(row)) if negate else test)
+        return self
+
+    def _rows(self):
+        return self.db.tables.setdefault(self.table, [])
+
+    def _check(self, row):
+        if self.table not in TABLE_COLUMNS:
+            return
+        columns, required = TABLE_COLUMNS[self.table]
+        unknown = set(row) - columns
+        if unknown:
+            raise Exception(f"Could not find the '{sorted(unknown)[0]}' column of '{self.table}'")
+        missing = [c for c in required if row.get(c) is None]
+        if missing:
+            raise Exception(f"null value in column \"{missing[0]}\" violates not-null constraint")
+
+    def select(self, columns='*', count=None):
+        if columns != '*':
+            self.columns = [c.strip() for c in columns.split(',')]
+        return self
+
+    def insert(self, payload):
+        self.action, self.payload = 'insert', payload
+        return self
+
+    def upsert(self, payload, on_conflict='id'):
+        self.action, self.payload, self.on_conflict = 'upsert', payload, on_conflict
+        return self
+
+    def update(self, payload):
+        self.action, self.payload = 'update', payload
+        return self
+
+    def delete(self):
+        self.action = 'delete'
+        return self
+
+    @property
+    def not_(self):
+        self.negate = True
+        return self
+
+    def eq(self, column, value):
+        return self._filter(lambda row: row.get(column) == value)
+
+    def neq(self, column, value):
+        return self._filter(lambda row: row.get(column) != value)
+
+    def like(self, column, pattern):
+        return self._filter(lambda row: fnmatch.fnmatchcase(row.get(column) or '', pattern.replace('%', '*')))
+
+    def in_(self, column, values):
+        return self._filter(lambda row: row.get(column) in values)
+
+    def order(self, column, desc=False):
+        self.ordering = (column, desc)
+        return self
+
+    def limit(self, n):
+        self.row_limit = n
+        return self
+
+    def range(self, start, end):
+        self.row_offset, self.row_limit = start, end - start + 1
+        return self
+
+    def execute(self):
+        self.db.log.append((self.action, self.table))
+        rows = self._rows()
+        if self.action in ('insert', 'upsert'):
+            payload = self.payload if isinstance(self.payload, list) else [self.payload]
+            saved = []
+            for row in payload:
+                self._check(row)
+                keys = self.on_conflict.split(',')
+                existing = [r for r in rows if all(r.get(k) == row.get(k) for k in keys)]
+                if existing and self.action == 'upsert':
+                    existing[0].update(copy.deepcopy(row))
+                    saved.append(copy.deepcopy(existing[0]))
+                else:
+                    rows.append(copy.deepcopy(row))
+                    saved.append(copy.deepcopy(row))
+            return Result(saved)
+
+        matched = [r for r in rows if all(f(r) for f in self.filters)]
+        if self.action == 'update':
+            for row in matched:
+                row.update(copy.deepcopy(self.payload))
+            return Result(copy.deepcopy(matched))
+        if self.action == 'delete':
+            self.db.tables[self.table] = [r for r in rows if r not in matched]
+            return Result(copy.deepcopy(matched))
+
+        if self.ordering:
+            column, desc = self.ordering
+            matched = sorted(matched, key=lambda r: r.get(column) or '', reverse=desc)
+        total = len(matched)
+        limit = min(n for n in (self.row_limit, self.db.max_rows, total) if n is not None)
+        matched = matched[self.row_offset:self.row_offset + limit]
+        if self.columns:
+            matched = [{c: row.get(c) for c in self.columns} for row in matched]
+        return Result(copy.deepcopy(matched), count=total)
+
+
+class RPC:
+    def __init__(self, db, name, params):
+        self.db, self.name, self.params = db, name, params
+
+    def execute(self):
+        self.db.log.append(('rpc', self.name))
+        return Result(self.db.rpcs[self.name](self.params))
+
+
+class FakeSupabase:
+    def __init__(self, tables=None):
+        self.tables = copy.deepcopy(tables or {})
+        self.rpcs = {}
+        self.log = []
+        # Like PostgREST's max-rows setting: responses are cut off silently
+        self.max_rows = None
+
+    def table(self, name):
+        return Query(self, name)
+
+    def rpc(self, name, params=None):
+        return RPC(self, name, params or {})
+
+
+class FakeJob:
+    """A claimed job whose progress and checkpoints are kept in memory."""
+
+    def __init__(self, job_id, project_id, params=None, checkpoint=None):
+        self.id = job_id
+        self.project_id = project_id
+        self.params = params or {}
+        self.checkpoint = checkpoint or {}
+        self.progress = {}
+
+    def report(self, **progress):
+        self.progress.update({k: v for k, v in progress.items() if v is not None})
+
+    def save_checkpoint(self, checkpoint, **progress):
+        self.checkpoint = copy.deepcopy(checkpoint)
+        self.report(**progress)
@@ -0,0 +1,35 @@
+import time
+import uuid
+
+from analytics_cache import AnalyticsCache
+from fakes import FakeSupabase
+
+PROJECT_ID = str(uuid.uuid4())
+
+
+def make_db():
+    db = FakeSupabase()
+    db.bumped = []
+    db.rpcs['bump_analytics_generation'] = lambda params: db.bumped.append(params['p_project']) or {}
+    return db
+
+
+def test_views_bump_a_project_once_per_interval():
+    db = make_db()
+    cache = AnalyticsCache(backend='memory', view_bump_interval=60)
+
+    for _ in range(5):
+        cache.record_view(db, PROJECT_ID)
+
+    assert db.bumped == [PROJECT_ID]
+
+
+def test_views_bump_again_after_the_interval():
+    db = make_db()
+    cache = AnalyticsCache(backend='memory', view_bump_interval=0.01)
+
+    cache.record_view(db, PROJECT_ID)
+    time.sleep(0.02)
+    cache.record_view(db, PROJECT_ID)
+
+    assert db.bumped == [PROJECT_ID, PROJECT_ID]
@@ -0,0 +1,43 @@
+import pytest
+
+import analytics
+from fakes import FakeSupabase
+
+STATS = {
+    'total_projects': 4, 'prds_generated': 3, 'total_context_files': 10, 'total_context_chars': 52000,
+    'total_responses': 40, 'confirmed_responses': 30, 'ai_suggested_responses': 10,
+    'total_hours': 9.5, 'projects_recent': 2, 'prds_recent': 1,
+}
+
+
+def make_db(result):
+    db = FakeSupabase()
+    db.calls = []
+    db.rpcs['analytics_overview'] = lambda params: db.calls.append(params) or result
+    return db
+
+
+def test_overview_is_built_from_one_aggregate_call():
+    db = make_db([STATS])
+
+    overview = analytics.get_overview_analytics(db)
+
+    assert db.log == [('rpc', 'analytics_overview')]
+    assert db.calls == [{'p_recent_days': analytics.RECENT_DAYS}]
+    assert overview['summary']['total_context_characters'] == 52000
+    assert overview['recent_activity'] == {'projects_last_7_days': 2, 'prds_last_7_days': 1}
+    assert overview['averages'] == {'context_files_per_project': 2.5, 'responses_per_project': 10.0,
+                                    'hours_per_project': 2.38}
+    assert overview['efficiency'] == {'ai_assistance_rate': 25.0, 'confirmation_rate': 75.0}
+
+
+def test_empty_database_gives_zero_rates():
+    overview = analytics.get_overview_analytics(make_db({'total_projects': 0}))
+
+    assert overview['averages']['hours_per_project'] == 0
+    assert overview['efficiency'] == {'ai_assistance_rate': 0, 'confirmation_rate': 0}
+
+
+def test_missing_aggregate_row_is_an_error():
+    with pytest.raises(Exception, match='Failed to load overview analytics'):
+        analytics.get_overview_analytics(make_db([]))
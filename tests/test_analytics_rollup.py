@@ -0,0 +1,18 @@
+import uuid
+
+import analytics
+from fakes import FakeSupabase
+
+PROJECT_ID = str(uuid.uuid4())
+
+
+def test_missing_rollup_reads_as_empty_without_rebuilding():
+    db = FakeSupabase({'projects': [{'id': PROJECT_ID, 'name': 'Billing',
+                                     'created_at': '2025-01-01T00:00:00Z',
+                                     'updated_at': '2025-01-01T01:00:00Z'}]})
+
+    result = analytics.get_project_analytics(db, PROJECT_ID)
+
+    assert result['context']['files_uploaded'] == 0
+    assert result['completion']['percentage'] == 0
+    assert not [entry for entry in db.log if entry[0] == 'rpc']
@@ -0,0 +1,80 @@
+import cache
+
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def test_lru_evicts_least_recently_used():
+    lru = cache.LRUTTLCache(max_entries=2, ttl=60)
+    lru.set('a', 1)
+    lru.set('b', 2)
+    assert lru.get('a') == 1
+
+    lru.set('c', 3)
+
+    assert lru.get('b') is None
+    assert lru.get('a') == 1 and lru.get('c') == 3
+
+
+def test_lru_entries_expire_after_ttl(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache.time, 'time', clock)
+    lru = cache.LRUTTLCache(max_entries=10, ttl=60)
+    lru.set('a', 1)
+    lru.set('b', 2, ttl=300)
+
+    clock.now += 61
+
+    assert lru.get('a') is None
+    assert lru.get('b') == 2
+    assert len(lru) == 1
+
+
+def test_fingerprint_covers_every_output_affecting_argument():
+    messages = [{'role': 'user', 'content': 'Summarize'}]
+    key = cache.fingerprint('model-a', 100, messages, system='Be brief')
+
+    assert key == cache.fingerprint('model-a', 100, [{'content': 'Summarize', 'role': 'user'}], system='Be brief')
+    assert key != cache.fingerprint('model-b', 100, messages, system='Be brief')
+    assert key != cache.fingerprint('model-a', 200, messages, system='Be brief')
+    assert key != cache.fingerprint('model-a', 100, messages, system='Be thorough')
+
+
+def test_sqlite_purge_drops_expired_and_least_recently_used_rows(monkeypatch, tmp_path):
+    clock = Clock()
+    monkeypatch.setattr(cache.time, 'time', clock)
+    monkeypatch.setattr(cache, '_should_purge', lambda: False)
+    store = cache.SQLiteStore(str(tmp_path / 'cache.sqlite3'), max_entries=2)
+    store.set('expired', 'old', 'model', ttl=10)
+    store.set('a', 'A', 'model', ttl=600)
+    clock.now += 20
+    store.set('b', 'B', 'model', ttl=600)
+    clock.now += 1
+    assert store.get('a') == 'A'
+
+    monkeypatch.setattr(cache, '_should_purge', lambda: True)
+    clock.now += 1
+    store.set('c', 'C', 'model', ttl=600)
+
+    with store._connect() as conn:
+        keys = {row[0] for row in conn.execute('SELECT cache_key FROM llm_cache')}
+    assert keys == {'a', 'c'}
+
+
+def test_store_hits_are_promoted_to_memory_and_counted(monkeypatch, tmp_path):
+    monkeypatch.setattr(cache, 'SQLITE_PATH', str(tmp_path / 'cache.sqlite3'))
+    writer = cache.LLMResponseCache(backend='sqlite')
+    writer.set('key', 'cached reply', 'model')
+
+    reader = cache.LLMResponseCache(backend='sqlite')
+    assert reader.get('key') == 'cached reply'
+    assert reader.get('key') == 'cached reply'
+    assert reader.get('missing') is None
+
+    stats = reader.get_stats()
+    assert (stats['store_hits'], stats['memory_hits'], stats['misses']) == (1, 1, 1)
@@ -0,0 +1,42 @@
+import context
+from fakes import FakeSupabase
+
+TEXTS = [
+    'Target users are finance teams. Success metric: cut close time 25% by 12/31/2025.',
+    '',
+    'Stakeholder interviews: customers want a mobile app. Goal is 40% adoption.',
+]
+
+
+def test_merged_analyses_match_analyzing_the_joined_text():
+    files = [{'file_type': 'txt', 'extracted_text': text} for text in TEXTS]
+    joined = '\n'.join(text for text in TEXTS if text)
+
+    keyword_counts, total_length, entities = context.merge_file_analyses(
+        [context.analyze_file_text(text) for text in TEXTS])
+
+    assert total_length == len(joined)
+    assert keyword_counts == context.CONTEXT_MATCHER.count(joined)
+    assert entities == context.extract_entities(joined)
+    assert context.analyze_context_quality(
+        [{'file_type': 'txt'}] * len(TEXTS), keyword_counts, total_length) == context.analyze_context_quality(files)
+
+
+def test_stored_analyses_are_read_without_text_and_stale_ones_backfilled():
+    db = FakeSupabase({'context_files': [
+        {'id': 'f1', 'project_id': 'p1', 'file_name': 'a.txt', 'file_type': 'txt', 'created_at': '2025-01-01',
+         'extracted_text': TEXTS[0], 'analysis': context.analyze_file_text(TEXTS[0])},
+        {'id': 'f2', 'project_id': 'p1', 'file_name': 'b.txt', 'file_type': 'txt', 'created_at': '2025-01-02',
+         'extracted_text': TEXTS[2], 'analysis': {'version': context.ANALYSIS_VERSION - 1}},
+    ]})
+
+    files = context.load_file_analyses(db, 'p1')
+
+    assert all('extracted_text' not in f for f in files)
+    assert files[1]['analysis'] == context.analyze_file_text(TEXTS[2])
+    assert db.tables['context_files'][1]['analysis'] == files[1]['analysis']
+    assert db.log == [('select', 'context_files'), ('select', 'context_files'), ('update', 'context_files')]
+
+    db.log.clear()
+    context.load_file_analyses(db, 'p1')
+    assert db.log == [('select', 'context_files')]
@@ -0,0 +1,49 @@
+import context_index
+from fakes import FakeSupabase
+
+
+def make_project(files=3, paragraphs=12):
+    db = FakeSupabase({'context_files': [], 'context_chunks': []})
+    for i in range(files):
+        text = '\n\n'.join(f'File {i} paragraph {j}: ' + 'filler words here ' * 80 for j in range(paragraphs))
+        if i == files - 1:
+            text += '\n\nThe billing reconciliation runs nightly.'
+        db.tables['context_files'].append({'id': f'f{i}', 'project_id': 'p1', 'file_name': f'doc{i}.txt',
+                                           'extracted_text': text, 'created_at': f'2025-01-0{i + 1}'})
+        db.tables['context_chunks'].extend(context_index.build_chunk_rows('p1', f'f{i}', text))
+    return db
+
+
+def test_chunks_past_the_server_row_limit_are_loaded(monkeypatch):
+    db = make_project()
+    db.max_rows = 7
+    monkeypatch.setattr(context_index, 'CHUNK_PAGE_SIZE', 10)
+
+    files = context_index._load_project_files(db, 'p1')
+    chunks = context_index.load_project_chunks(db, files)
+
+    assert len(chunks) == len(db.tables['context_chunks'])
+    assert ('delete', 'context_chunks') not in db.log
+
+
+def test_ranked_retrieval_reaches_the_last_file(monkeypatch):
+    db = make_project()
+    db.max_rows = 7
+    monkeypatch.setattr(context_index, 'CHUNK_PAGE_SIZE', 10)
+
+    context = context_index.retrieve_context(db, 'p1', 'billing reconciliation', 600)
+
+    assert context.startswith('=== doc2.txt ===')
+    assert 'billing reconciliation runs nightly' in context
+    assert ('delete', 'context_chunks') not in db.log
+
+
+def test_terms_are_not_loaded_when_everything_fits(monkeypatch):
+    db = make_project(files=1, paragraphs=1)
+    loaded = []
+    monkeypatch.setattr(context_index, 'load_chunk_terms', lambda supabase, chunks: loaded.append(chunks))
+
+    context = context_index.retrieve_context(db, 'p1', 'billing', 10000)
+
+    assert loaded == []
+    assert 'billing reconciliation' in context
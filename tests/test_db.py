@@ -0,0 +1,41 @@
+import db
+from fakes import FakeSupabase
+
+
+def test_bulk_upsert_collapses_duplicate_keys_last_wins():
+    supabase = FakeSupabase()
+    rows = [
+        {'project_id': 'p1', 'question_id': 'q1', 'response': 'first'},
+        {'project_id': 'p1', 'question_id': 'q2', 'response': 'other'},
+        {'project_id': 'p1', 'question_id': 'q1', 'response': 'second'},
+    ]
+
+    saved = db.bulk_upsert(supabase, 'question_responses', rows, 'project_id,question_id')
+
+    assert [row['response'] for row in saved] == ['second', 'other']
+    assert supabase.log == [('upsert', 'question_responses')]
+
+
+def test_bulk_upsert_sends_one_request_per_chunk():
+    supabase = FakeSupabase()
+    rows = [{'project_id': 'p1', 'question_id': f'q{i}'} for i in range(db.UPSERT_CHUNK_SIZE * 2 + 1)]
+
+    saved = db.bulk_upsert(supabase, 'question_responses', rows, 'project_id, question_id')
+
+    assert len(saved) == len(rows)
+    assert supabase.log == [('upsert', 'question_responses')] * 3
+
+
+def test_get_supabase_reuses_the_client_until_the_process_forks(monkeypatch):
+    created = []
+    monkeypatch.setattr(db, '_client', None)
+    monkeypatch.setattr(db, '_client_pid', None)
+    monkeypatch.setattr(db, '_create_client', lambda: created.append(object()) or created[-1])
+
+    first = db.get_supabase()
+    assert db.get_supabase() is first
+    assert len(created) == 1
+
+    monkeypatch.setattr(db.os, 'getpid', lambda: -1)
+    assert db.get_supabase() is not first
+    assert len(created) == 2
@@ -0,0 +1,23 @@
+from entity_extractor import ENTITY_MAX_MATCHES, extract_entities
+
+
+def test_rejected_candidates_do_not_exhaust_the_cap():
+    noise = 'row 1, 2024 value\n' * (ENTITY_MAX_MATCHES + 500)
+    entities = extract_entities(noise + 'Revenue grew 25% by 12/31/2025 via API')
+
+    assert entities['percentages'] == ['25%']
+    assert entities['dates'] == ['12/31/2025']
+    assert entities['truncated'] == []
+
+
+def test_month_dates_need_the_month_name():
+    entities = extract_entities('Launch on March 5, 2025 and JUNE 1 2024; see row 3, 2024')
+
+    assert entities['dates'] == ['March 5, 2025', 'JUNE 1 2024']
+
+
+def test_cap_on_one_type_keeps_other_types():
+    entities = extract_entities('on 12/31/2025 ' * (ENTITY_MAX_MATCHES + 10) + 'up 25%')
+
+    assert entities['truncated'] == ['dates']
+    assert entities['percentages'] == ['25%']
@@ -0,0 +1,89 @@
+import io
+import time
+
+import extraction
+
+
+def upload(name, data):
+    return {'filename': name, 'file': io.BytesIO(data)}
+
+
+def test_single_file_is_extracted_with_a_timeout(monkeypatch):
+    def stuck(file_data, filename):
+        time.sleep(5)
+
+    monkeypatch.setattr(extraction, 'extract_text_with_stats', stuck)
+    started = time.monotonic()
+
+    [(text, stats)] = extraction.extract_files([upload('notes.txt', b'hello')], timeout=0.2)
+
+    assert text == 'Error extracting text: timed out after 0.2s'
+    assert time.monotonic() - started < 2
+
+
+def test_serial_fallback_uses_the_timeout(monkeypatch):
+    def no_pool(*args, **kwargs):
+        raise OSError('no /dev/shm')
+
+    monkeypatch.setattr(extraction._mp, 'Pool', no_pool)
+    results = extraction.extract_files([upload('a.txt', b'alpha'), upload('b.md', b'beta')], timeout=5)
+
+    assert [text for text, _ in results] == ['alpha', 'beta']
+
+
+def test_files_are_extracted_on_a_spawned_pool():
+    assert extraction._mp.get_start_method() == 'spawn'
+
+    results = extraction.extract_files([upload('a.txt', b'alpha'), upload('b.csv', b'x,y')], timeout=60, max_workers=2)
+
+    assert [text for text, _ in results] == ['alpha', 'x,y']
+
+
+class FakePool:
+    """Runs tasks inline; 'stuck' files never finish and 'bad' ones crash the worker."""
+
+    created = []
+
+    def __init__(self, processes):
+        FakePool.created.append(self)
+
+    def apply_async(self, func, args, callback, error_callback):
+        data, filename = args
+        if filename.startswith('stuck'):
+            return
+        if filename.startswith('bad'):
+            error_callback(Exception('worker crashed'))
+            return
+        callback(func(data, filename))
+
+    def terminate(self):
+        pass
+
+    def join(self):
+        pass
+
+
+def use_fake_pool(monkeypatch):
+    FakePool.created = []
+    monkeypatch.setattr(extraction._mp, 'Pool', FakePool)
+
+
+def test_pool_reports_timeouts_and_failures_per_file(monkeypatch):
+    use_fake_pool(monkeypatch)
+    files = [upload('a.txt', b'alpha'), upload('stuck.txt', b''), upload('bad.txt', b''), upload('c.md', b'gamma')]
+
+    results = extraction.extract_files(files, timeout=0.2, max_workers=2)
+
+    assert [text for text, _ in results] == [
+        'alpha', 'Error extracting text: timed out after 0.2s', 'Error extracting text: worker crashed', 'gamma']
+
+
+def test_pool_is_replaced_when_every_worker_is_stuck(monkeypatch):
+    use_fake_pool(monkeypatch)
+    files = [upload('stuck-1.txt', b''), upload('stuck-2.txt', b''), upload('a.txt', b'alpha')]
+
+    results = extraction.extract_files(files, timeout=0.1, max_workers=2)
+
+    assert results[2][0] == 'alpha'
+    assert results[0][0] == results[1][0] == 'Error extracting text: timed out after 0.1s'
+    assert len(FakePool.created) == 2
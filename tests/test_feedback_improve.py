@@ -0,0 +1,72 @@
+import uuid
+
+import feedback
+from fakes import FakeJob, FakeSupabase
+
+PROJECT_ID = str(uuid.uuid4())
+PRD_ID = str(uuid.uuid4())
+
+
+def make_db():
+    db = FakeSupabase({
+        'generated_prds': [{'id': PRD_ID, 'project_id': PROJECT_ID, 'version': 2, 'content_md': '# Old PRD'}],
+        'prd_feedback': [{'project_id': PROJECT_ID, 'feedback_text': 'Add success metrics',
+                          'created_at': '2025-01-01T00:00:00Z'}],
+    })
+    db.bumped = []
+    db.rpcs['bump_analytics_generation'] = lambda params: db.bumped.append(params['p_project']) or {}
+    return db
+
+
+def test_improve_job_snapshots_then_updates_prd(monkeypatch):
+    monkeypatch.setattr(feedback, 'is_llm_available', lambda: True)
+    monkeypatch.setattr(feedback, 'complete', lambda prompt, **kwargs: '# Improved PRD\n')
+    db = make_db()
+    job = FakeJob(str(uuid.uuid4()), PROJECT_ID)
+
+    result = feedback.run_improve_prd_job(db, job)
+
+    snapshots = db.tables['prd_edit_snapshots']
+    assert len(snapshots) == 1
+    assert snapshots[0]['id'] == result['previous_version_id']
+    assert snapshots[0]['snapshot_content'] == '# Old PRD'
+    assert snapshots[0]['project_id'] == PROJECT_ID
+    assert snapshots[0]['prd_id'] == PRD_ID
+    assert db.tables['generated_prds'][0]['content_md'] == '# Improved PRD'
+    assert db.tables['generated_prds'][0]['version'] == 3
+    writes = [entry for entry in db.log if entry[0] in ('upsert', 'update', 'rpc')]
+    assert writes == [('upsert', 'prd_edit_snapshots'), ('update', 'generated_prds'),
+                      ('rpc', 'bump_analytics_generation')]
+    assert db.bumped == [PROJECT_ID]
+
+
+def test_improve_job_retry_reuses_snapshot(monkeypatch):
+    monkeypatch.setattr(feedback, 'is_llm_available', lambda: True)
+    monkeypatch.setattr(feedback, 'complete', lambda prompt, **kwargs: '# Improved PRD')
+    db = make_db()
+    job = FakeJob(str(uuid.uuid4()), PROJECT_ID)
+    original_save = job.save_checkpoint
+
+    def fail_after_apply(checkpoint, **progress):
+        # Lose the final checkpoint, as if the worker died after applying
+        if checkpoint.get('snapshot_id'):
+            raise Exception('worker stopped')
+        original_save(checkpoint, **progress)
+
+    job.save_checkpoint = fail_after_apply
+    try:
+        feedback.run_improve_prd_job(db, job)
+    except Exception:
+        pass
+    job.save_checkpoint = original_save
+
+    monkeypatch.setattr(feedback, 'complete', lambda prompt, **kwargs: model_called_again())
+    feedback.run_improve_prd_job(db, job)
+
+    assert len(db.tables['prd_edit_snapshots']) == 1
+    assert db.tables['prd_edit_snapshots'][0]['snapshot_content'] == '# Old PRD'
+    assert db.tables['generated_prds'][0]['version'] == 3
+
+
+def model_called_again():
+    raise AssertionError('the model must not be called again on retry')
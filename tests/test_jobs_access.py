@@ -0,0 +1,40 @@
+import uuid
+
+import jobs
+from fakes import FakeSupabase
+
+PROJECT_ID = str(uuid.uuid4())
+JOB_ID = str(uuid.uuid4())
+
+
+def request(monkeypatch, method, path, user_id):
+    db = FakeSupabase({
+        'projects': [{'id': PROJECT_ID, 'user_id': 'alice'}],
+        'jobs': [{'id': JOB_ID, 'project_id': PROJECT_ID, 'job_type': 'prefill', 'status': 'queued'}],
+    })
+    monkeypatch.setattr(jobs, 'get_supabase', lambda: db)
+    monkeypatch.setattr(jobs, 'get_user_from_request', lambda handler: user_id)
+    handler = jobs.handler.__new__(jobs.handler)
+    handler.path = path
+    sent = []
+    handler.send_json = lambda status, data: sent.append((status, data))
+    getattr(handler, method)()
+    return sent[0][0], db
+
+
+def test_owner_can_read_and_cancel_a_job(monkeypatch):
+    assert request(monkeypatch, 'do_GET', f'/api/jobs/{JOB_ID}', 'alice')[0] == 200
+    assert request(monkeypatch, 'do_GET', f'/api/jobs/project/{PROJECT_ID}', 'alice')[0] == 200
+
+    status, db = request(monkeypatch, 'do_POST', f'/api/jobs/{JOB_ID}/cancel', 'alice')
+    assert status == 200
+    assert db.tables['jobs'][0]['status'] == 'cancelled'
+
+
+def test_other_users_cannot_see_or_cancel_a_job(monkeypatch):
+    assert request(monkeypatch, 'do_GET', f'/api/jobs/{JOB_ID}', 'mallory')[0] == 404
+    assert request(monkeypatch, 'do_GET', f'/api/jobs/project/{PROJECT_ID}', 'mallory')[0] == 404
+
+    status, db = request(monkeypatch, 'do_POST', f'/api/jobs/{JOB_ID}/cancel', 'mallory')
+    assert status == 404
+    assert db.tables['jobs'][0]['status'] == 'queued'
@@ -0,0 +1,58 @@
+import context
+import context_index
+from fakes import FakeSupabase
+
+UPLOADS = [
+    {'id': 'f1', 'content_hash': 'h1', 'user_id': 'alice', 'project_id': 'p1', 'file_url': 'alice-old', 'extracted_text': 'old',
+     'created_at': '2025-01-01'},
+    {'id': 'f2', 'content_hash': 'h1', 'user_id': 'alice', 'project_id': 'p2', 'file_url': 'alice-new', 'extracted_text': 'new',
+     'created_at': '2025-02-01'},
+    {'id': 'f3', 'content_hash': 'h1', 'user_id': 'alice', 'project_id': 'p2', 'file_url': 'alice-failed',
+     'extracted_text': 'Error extracting text: bad pdf', 'created_at': '2025-03-01'},
+    {'id': 'f4', 'content_hash': 'h2', 'user_id': 'bob', 'project_id': 'p3', 'file_url': 'bob', 'extracted_text': 'secret',
+     'created_at': '2025-01-01'},
+]
+
+
+def test_reuses_the_users_newest_extracted_copy():
+    db = FakeSupabase({'context_files': UPLOADS})
+
+    known = context.find_known_uploads(db, ['h1', 'h2'], user_id='alice', project_id='p9')
+
+    assert list(known) == ['h1']
+    assert known['h1'] == {'id': 'f2', 'file_url': 'alice-new', 'analysis': None}
+
+
+def test_other_tenants_uploads_are_not_reused():
+    db = FakeSupabase({'context_files': UPLOADS})
+
+    assert context.find_known_uploads(db, ['h2'], user_id='alice') == {}
+    assert context.find_known_uploads(db, ['h2'], project_id='p1') == {}
+    assert list(context.find_known_uploads(db, ['h2'], project_id='p3')) == ['h2']
+    assert context.find_known_uploads(db, ['h2']) == {}
+
+
+def test_reused_upload_shares_the_text_and_chunks():
+    text = 'The checkout flow must support saved cards.\n\nRefunds are handled by support.'
+    analysis = context.analyze_file_text(text)
+    db = FakeSupabase({
+        'context_files': [{'id': 'f1', 'project_id': 'p1', 'file_name': 'spec.txt', 'content_hash': 'h1',
+                           'extracted_text': text, 'analysis': analysis, 'created_at': '2025-01-01'}],
+        'context_chunks': context_index.build_chunk_rows('p1', 'f1', text),
+    })
+    handler = context.handler.__new__(context.handler)
+    uploaded, errors = [], []
+
+    saved = handler.save_uploaded_file(
+        db, 'p2', 'alice', {'filename': 'spec-copy.txt', 'content_hash': 'h1', 'file': None}, '', {'reused': True},
+        uploaded, errors, file_url='url', analysis=analysis, source_file_id='f1')
+
+    copy = next(row for row in db.tables['context_files'] if row['id'] == saved[0])
+    assert errors == []
+    assert copy['extracted_text'] is None and copy['source_file_id'] == 'f1'
+    assert len(db.tables['context_chunks']) == 1
+    assert uploaded[0]['text_length'] == len(text)
+
+    retrieved = context_index.retrieve_context(db, 'p2', 'checkout saved cards', 1000)
+    assert retrieved.startswith('=== spec-copy.txt ===\nThe checkout flow')
+    assert context_index.load_leading_context(db, 'p2', 1000) == text
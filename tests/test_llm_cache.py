@@ -0,0 +1,59 @@
+from types import SimpleNamespace
+
+import llm
+from cache import LLMResponseCache
+
+
+class FakeClient:
+    def __init__(self, replies):
+        self.replies = list(replies)
+        self.calls = 0
+        self.messages = self
+
+    def create(self, **kwargs):
+        self.calls += 1
+        return SimpleNamespace(content=[SimpleNamespace(text=self.replies.pop(0))],
+                               stop_reason='end_turn', usage=None)
+
+
+def use_client(monkeypatch, replies):
+    client = FakeClient(replies)
+    monkeypatch.setattr(llm, 'get_client', lambda: client)
+    monkeypatch.setattr(llm, 'response_cache', LLMResponseCache(backend='memory'))
+    return client
+
+
+def test_complete_does_not_cache_by_default(monkeypatch):
+    client = use_client(monkeypatch, ['first draft', 'second draft'])
+
+    assert llm.complete('Write a PRD', max_tokens=100) == 'first draft'
+    assert llm.complete('Write a PRD', max_tokens=100) == 'second draft'
+    assert client.calls == 2
+
+
+def test_complete_caches_when_asked(monkeypatch):
+    client = use_client(monkeypatch, ['summary'])
+
+    assert llm.complete('Summarize', max_tokens=100, cache=True) == 'summary'
+    assert llm.complete('Summarize', max_tokens=100, cache=True) == 'summary'
+    assert client.calls == 1
+
+
+def test_empty_response_is_not_cached(monkeypatch):
+    client = use_client(monkeypatch, ['  ', 'summary'])
+
+    assert llm.complete('Summarize', max_tokens=100, cache=True) == '  '
+    assert llm.complete('Summarize', max_tokens=100, cache=True) == 'summary'
+    assert client.calls == 2
+
+
+def test_usage_is_logged_per_call(monkeypatch, capsys):
+    client = use_client(monkeypatch, ['summary'])
+    usage = SimpleNamespace(input_tokens=40, output_tokens=12,
+                            cache_read_input_tokens=1500, cache_creation_input_tokens=0)
+    reply = client.create
+    monkeypatch.setattr(client, 'create', lambda **kwargs: SimpleNamespace(**{**vars(reply(**kwargs)), 'usage': usage}))
+
+    llm.complete('Summarize', max_tokens=100, label='summarize')
+
+    assert 'LLM usage [summarize]: input=40 cache_read=1500 cache_creation=0 output=12' in capsys.readouterr().out
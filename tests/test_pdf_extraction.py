@@ -0,0 +1,62 @@
+import extraction
+
+
+def make_pdf(page_texts):
+    """A minimal PDF with one line of Helvetica text per page."""
+    objects = ['<< /Type /Catalog /Pages 2 0 R >>', None, '<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>']
+    kids = []
+    for text in page_texts:
+        stream = f'BT /F1 12 Tf 72 720 Td ({text}) Tj ET'
+        objects.append(f'<< /Length {len(stream)} >>\nstream\n{stream}\nendstream')
+        objects.append(f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] '
+                       f'/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>')
+        kids.append(f'{len(objects)} 0 R')
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+
+    pdf = b'%PDF-1.4\n'
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(pdf))
+        pdf += f'{number} 0 obj\n{body}\nendobj\n'.encode()
+    xref = len(pdf)
+    pdf += f'xref\n0 {len(objects) + 1}\n0000000000 65535 f \n'.encode()
+    pdf += ''.join(f'{offset:010d} 00000 n \n' for offset in offsets).encode()
+    pdf += f'trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n'.encode()
+    return pdf
+
+
+def test_page_selection_without_a_cap_keeps_every_page():
+    assert extraction.select_pdf_pages(5, max_pages=0) == [0, 1, 2, 3, 4]
+    assert extraction.select_pdf_pages(5, max_pages=10) == [0, 1, 2, 3, 4]
+
+
+def test_page_selection_head_and_sample_strategies():
+    assert extraction.select_pdf_pages(100, max_pages=4, strategy='head') == [0, 1, 2, 3]
+    assert extraction.select_pdf_pages(100, max_pages=4, strategy='sample') == [0, 33, 66, 99]
+
+
+def test_capped_pdf_records_pages_and_timings(monkeypatch):
+    select_pages = extraction.select_pdf_pages
+    monkeypatch.setattr(extraction, 'PDF_PAGE_STRATEGY', 'sample')
+    monkeypatch.setattr(extraction, 'select_pdf_pages', lambda count: select_pages(count, max_pages=2, strategy='sample'))
+    stats = {}
+
+    text = extraction.extract_pdf(make_pdf(['Page one', 'Page two', 'Page three']), stats)
+
+    assert 'Page one' in text and 'Page three' in text and 'Page two' not in text
+    assert text.endswith('[Extracted 2 of 3 pages]')
+    assert stats['pages_total'] == 3 and stats['pages_extracted'] == 2
+    assert stats['page_strategy'] == 'sample'
+    assert [t['page'] for t in stats['page_timings']] == [1, 3]
+
+
+def test_large_pdf_is_split_across_workers_in_page_order(monkeypatch):
+    monkeypatch.setattr(extraction, 'PDF_PAGE_WORKERS', 2)
+    page_count = extraction.PDF_PARALLEL_MIN_PAGES
+    stats = {}
+
+    text = extraction.extract_pdf(make_pdf([f'Page {n}' for n in range(1, page_count + 1)]), stats)
+
+    assert text.split('\n\n') == [f'Page {n}' for n in range(1, page_count + 1)]
+    assert stats['workers'] == 2
+    assert [t['page'] for t in stats['page_timings']] == list(range(1, page_count + 1))
@@ -0,0 +1,48 @@
+import io
+
+import prd
+
+
+class StreamHandler(prd.handler):
+    """The handler without a socket: the response is written to a buffer."""
+
+    def __init__(self):
+        self.wfile = io.BytesIO()
+        self.statuses = []
+
+    def send_response(self, code, message=None):
+        self.statuses.append(code)
+
+    def send_header(self, keyword, value):
+        pass
+
+    def end_headers(self):
+        pass
+
+
+def test_unexpected_error_is_sent_as_an_sse_event(monkeypatch):
+    def no_threads(*args, **kwargs):
+        raise RuntimeError("can't start new thread")
+
+    monkeypatch.setattr(prd.threading, 'Thread', no_threads)
+    handler = StreamHandler()
+
+    handler.stream_prd(None, 'project-1', {}, {})
+
+    body = handler.wfile.getvalue().decode()
+    assert handler.statuses == [200]
+    assert body.startswith('event: error\n')
+    assert "can't start new thread" in body
+
+
+def test_streamed_prd_is_saved(monkeypatch):
+    monkeypatch.setattr(prd, 'stream_prd_with_claude', lambda responses, template: iter(['# PRD', '\nBody']))
+    monkeypatch.setattr(prd, 'save_generated_prd', lambda supabase, project_id, content: 'prd-1')
+    handler = StreamHandler()
+
+    handler.stream_prd(None, 'project-1', {}, {'confirmed_responses': 1})
+
+    body = handler.wfile.getvalue().decode()
+    assert handler.statuses == [200]
+    assert body.startswith('event: start\n')
+    assert 'event: done\ndata: {"message": "PRD generated successfully", "prd_id": "prd-1"' in body
@@ -0,0 +1,62 @@
+import questions
+
+QUESTIONS = [{'id': f'1.1.{i}', 'question': f'Question {i}?', 'hint': ''} for i in range(questions.PREFILL_BATCH_SIZE * 3)]
+LONG_CONTEXT = 'Users upload meeting notes and specs. ' * 400
+
+
+def run_prefill(monkeypatch, contexts):
+    sent, warmed = [], []
+    monkeypatch.setattr(questions, 'get_client', lambda: None)
+    monkeypatch.setattr(questions, 'complete', lambda prompt, max_tokens, system=None, **kwargs: sent.append(system) or '[]')
+    monkeypatch.setattr(questions, 'warm_prompt_cache', lambda system, label=None: warmed.append(system))
+    questions.analyze_context_for_questions(contexts, QUESTIONS)
+    return sent, warmed
+
+
+def marked(system):
+    return [i for i, block in enumerate(system) if 'cache_control' in block]
+
+
+def test_shared_context_is_cached_and_warmed(monkeypatch):
+    sent, warmed = run_prefill(monkeypatch, LONG_CONTEXT)
+
+    assert len(sent) == 3
+    assert all(marked(system) == [1] for system in sent)
+    assert warmed == [sent[0]]
+
+
+def test_routed_contexts_are_not_marked(monkeypatch):
+    contexts = [f'Batch {i}: ' + LONG_CONTEXT for i in range(3)]
+    sent, warmed = run_prefill(monkeypatch, contexts)
+
+    assert len(sent) == 3
+    assert all(marked(system) == [] for system in sent)
+    assert warmed == []
+
+
+def test_routed_contexts_mark_only_a_cacheable_shared_prefix(monkeypatch):
+    features = [{'name': f'Feature {i}', 'description': 'Lets users do more'} for i in range(15)]
+
+    system = questions.build_prefill_system(LONG_CONTEXT, features, shared_context=False)
+    assert 'SELECTED FEATURES' in system[0]['text'] and 'CONTEXT' in system[1]['text']
+    assert marked(system) == []
+
+    monkeypatch.setattr(questions, 'is_cacheable', lambda text: True)
+    assert marked(questions.build_prefill_system(LONG_CONTEXT, features, shared_context=False)) == [0]
+
+
+def test_follow_up_context_is_not_marked(monkeypatch):
+    sent = []
+    monkeypatch.setattr(questions, 'is_llm_available', lambda: True)
+    monkeypatch.setattr(questions, 'complete', lambda prompt, max_tokens, system=None, **kwargs: sent.append(system) or '[]')
+
+    questions.generate_ai_follow_ups('Who are the users?', 'Finance teams', LONG_CONTEXT)
+
+    [system] = sent
+    assert marked(system) == []
+    assert system[1]['text'].startswith('\n\nAdditional Context: Users upload')
+
+
+def test_split_system_marks_only_a_cacheable_stable_block():
+    assert marked(questions.split_system('Short instructions.', LONG_CONTEXT)) == []
+    assert marked(questions.split_system(LONG_CONTEXT, 'Per-call context')) == [0]
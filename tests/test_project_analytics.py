@@ -0,0 +1,70 @@
+import threading
+import uuid
+
+import analytics
+from fakes import FakeSupabase, Result
+
+PROJECT_ID = str(uuid.uuid4())
+PRD_ID = str(uuid.uuid4())
+
+
+def make_db():
+    return FakeSupabase({
+        'projects': [{'id': PROJECT_ID, 'name': 'Billing', 'created_at': '2025-01-01T00:00:00Z',
+                      'updated_at': '2025-01-01T03:00:00Z'}],
+        'context_files': [{'project_id': PROJECT_ID, 'file_name': 'spec.pdf', 'created_at': '2025-01-01T00:10:00Z',
+                           'extracted_text': 'not read'}],
+        'analytics_project': [{
+            'project_id': PROJECT_ID, 'context_files': 1, 'context_chars': 1200, 'file_types': {'pdf': 1},
+            'features': 6, 'selected_features': 4, 'features_first_at': '2025-01-01T00:20:00Z',
+            'responses': 20, 'confirmed_responses': 12, 'ai_suggested_responses': 8,
+            'prd_id': PRD_ID, 'prd_version': 2, 'prd_word_count': 900, 'prd_created_at': '2025-01-01T01:00:00Z',
+            'prd_edit_count': 3, 'feedback_count': 2, 'rating_sum': 9, 'rating_count': 2,
+        }],
+    })
+
+
+class WaitingQuery:
+    """Finishes only once every query of the batch is running."""
+
+    def __init__(self, barrier, rows):
+        self.barrier, self.rows = barrier, rows
+
+    def execute(self):
+        self.barrier.wait()
+        return Result(self.rows)
+
+
+def test_queries_run_concurrently():
+    barrier = threading.Barrier(3, timeout=5)
+
+    rows = analytics.run_queries({name: WaitingQuery(barrier, [name]) for name in ('a', 'b', 'c')})
+
+    assert rows == {'a': ['a'], 'b': ['b'], 'c': ['c']}
+
+
+def test_project_analytics_come_from_the_project_and_rollup_rows():
+    db = make_db()
+
+    result = analytics.get_project_analytics(db, PROJECT_ID)
+
+    assert sorted(db.log) == [('select', 'analytics_project'), ('select', 'projects')]
+    assert result['project_info']['time_spent_hours'] == 3
+    assert result['completion']['percentage'] == 100
+    assert result['context'] == {'files_uploaded': 1, 'total_characters': 1200, 'file_types': ['pdf']}
+    assert result['features']['in_parking_lot'] == 2
+    assert result['questions']['confirmation_rate'] == 60
+    assert result['prd'] == {'generated': True, 'version': 2, 'edit_history_count': 3, 'word_count': 900}
+    assert result['feedback'] == {'total_feedback': 2, 'average_rating': 4.5}
+
+
+def test_timeline_is_ordered_by_time():
+    timeline = analytics.get_project_timeline(make_db(), PROJECT_ID)
+
+    assert [event['type'] for event in timeline] == [
+        'project_created', 'context_uploaded', 'features_extracted', 'prd_generated']
+    assert timeline[-1]['description'] == 'PRD generated (v2)'
+
+
+def test_unknown_project_has_no_analytics():
+    assert analytics.get_project_analytics(make_db(), str(uuid.uuid4())) is None
@@ -0,0 +1,38 @@
+import questions
+from fakes import FakeSupabase
+
+
+def make_db():
+    db = FakeSupabase({'question_responses': [
+        {'id': 'r1', 'project_id': 'p1', 'question_id': '1.1.1', 'response': 'Old answer', 'confirmed': True},
+        {'id': 'r2', 'project_id': 'p2', 'question_id': '1.1.2', 'response': 'Other project'},
+    ]})
+    db.rpcs['bump_analytics_generation'] = lambda params: {}
+    return db
+
+
+def test_responses_are_saved_in_one_upsert():
+    db = make_db()
+
+    saved = questions.save_question_responses(db, 'p1', [
+        {'question_id': '1.1.1', 'response': 'New answer'},
+        {'question_id': '1.1.2', 'response': 'Second', 'ai_suggested': True},
+        {'response': 'No question ID'},
+    ])
+
+    assert [row['question_id'] for row in saved] == ['1.1.1', '1.1.2']
+    assert [entry for entry in db.log if entry[0] != 'rpc'] == [('upsert', 'question_responses')]
+    rows = {(r['project_id'], r['question_id']): r for r in db.tables['question_responses']}
+    assert len(rows) == 3
+    assert rows[('p1', '1.1.1')]['id'] == 'r1'
+    assert rows[('p1', '1.1.1')]['response'] == 'New answer'
+    assert rows[('p1', '1.1.1')]['confirmed'] is False
+    assert rows[('p1', '1.1.2')]['ai_suggested'] is True
+    assert rows[('p2', '1.1.2')]['response'] == 'Other project'
+
+
+def test_nothing_to_save_makes_no_request():
+    db = make_db()
+
+    assert questions.save_question_responses(db, 'p1', [{'response': 'No question ID'}]) == []
+    assert db.log == []
@@ -0,0 +1,45 @@
+import io
+
+import openpyxl
+
+import extraction
+
+
+def make_workbook(sheets):
+    workbook = openpyxl.Workbook()
+    workbook.remove(workbook.active)
+    for title, rows in sheets.items():
+        sheet = workbook.create_sheet(title)
+        for row in rows:
+            sheet.append(row)
+    data = io.BytesIO()
+    workbook.save(data)
+    return data.getvalue()
+
+
+def test_small_sheets_are_extracted_whole():
+    stats = {}
+
+    text = extraction.extract_xlsx(make_workbook({'Metrics': [['Metric', 'Value'], ['Churn', 0.05], [None, None]]}), stats)
+
+    assert text == '=== Sheet: Metrics ===\nMetric | Value\nChurn | 0.05'
+    assert stats['sheets'][0]['rows_extracted'] == 2
+    assert not stats['sheets'][0]['rows_truncated'] and not stats['sheets'][0]['columns_truncated']
+
+
+def test_sheets_are_capped_by_rows_and_columns(monkeypatch):
+    monkeypatch.setattr(extraction, 'XLSX_MAX_ROWS', 3)
+    monkeypatch.setattr(extraction, 'XLSX_MAX_COLUMNS', 2)
+    rows = [['Name', 'Team', 'Notes']] + [[f'User {i}', 'Growth', 'extra'] for i in range(9)]
+    stats = {}
+
+    text = extraction.extract_xlsx(make_workbook({'Users': rows, 'Empty': []}), stats)
+
+    users, empty = stats['sheets']
+    assert text.split('\n')[:4] == ['=== Sheet: Users ===', 'Name | Team', 'User 0 | Growth', 'User 1 | Growth']
+    assert 'extra' not in text
+    assert '[Sheet truncated: first 3 of 10 rows, first 2 of 3 columns; header: Name | Team]' in text
+    assert (users['rows_extracted'], users['total_rows'], users['total_columns']) == (3, 10, 3)
+    assert users['rows_truncated'] and users['columns_truncated']
+    assert users['header'] == ['Name', 'Team']
+    assert empty['rows_extracted'] == 0 and not empty['rows_truncated']